@@ -1,11 +1,12 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
+import asyncio
+import contextlib
+import inspect
+import logging
 import os
 import json
-import re
-import random
 from dotenv import load_dotenv
 from typing import Dict, Any, Optional
 
@@ -19,67 +20,96 @@ from src.core.app_config import AppConfig
 AppConfig.setup_langsmith()
 
 # 修复导入路径
-from src.core.agent import build_agent
+from src.core.agent import LevelAgentCache, ainvoke_with_memory, astream_with_memory, load_chat_history
+from src.core.chat_router import ROUTE_AGENT, ROUTE_TALK, DirectChatRouter, LLMCallCounter
+from src.core.context_assembler import ContextAssembler
+from src.core.config import llm_registry
+from src.core.log import get_log_stats, get_logger, shutdown_logging
+from src.core.persona_catalog import PERSONA_DEFAULTS, etag_matches, persona_catalog
+from src.core import metrics
+from src.core.session_guard import SessionGuard
+from src.core.session_registry import SessionRegistry
+from src.core.static_assets import StaticAssets
 from src.core.severity_analyzer import SeverityResult, severity_analyzer
-from src.memory.memory_manager import SmartMemoryManager
+from src.memory.memory_factory import MemoryManagerFactory
+from src.tools.seaking import VICTORY_MESSAGE, SeakingStreamParser, get_seaking_chain, get_seaking_stats
+
+logger = get_logger("app")
+session_logger = get_logger("session")
+seaking_logger = get_logger("seaking")
 
 app = FastAPI(title="Anti Love Brain - 拽姐 Agent")
 
-# 挂载静态文件
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 静态资源：启动时预压缩，开发环境下文件变化自动重建
+static_assets = StaticAssets(reload=AppConfig.IS_DEVELOPMENT)
 
 # 打印配置信息
 AppConfig.print_startup_info()
 
+# 活跃会话数在导出指标时读取
+metrics.ACTIVE_SESSIONS.callback = lambda: len(sessions)
+
+# 启动时按恋爱脑级别预编译Agent与直连路由的prompt，各会话调用时绑定自己的记忆
+level_style_prompts = {
+    level: severity_analyzer.build_style_prompt(style)
+    for level, style in severity_analyzer.answerstyle.items()
+}
+level_agents = LevelAgentCache(level_style_prompts)
+chat_router = DirectChatRouter(level_style_prompts)
+context_assembler = ContextAssembler(level_style_prompts)
+
+def create_session(session_id: str) -> Dict[str, Any]:
+    """创建新会话的数据（Agent已按级别预编译，无需按会话创建）"""
+    return {
+        # Redis模式下共享连接池，创建管理器不产生Redis往返
+        "memory_manager": MemoryManagerFactory.create_memory_manager(
+            storage_type=AppConfig.MEMORY_STORAGE_TYPE,
+            user_id=session_id,
+            max_tokens=1500,
+            summary_trigger_ratio=0.8
+        ),
+        # 海王对战历史 - 只保存上一轮对话
+        "seaking_last_conversation": None
+    }
+
+# 会话注册表 - 容量上限LRU淘汰 + 滑动过期，过期清理由后台任务执行
+sessions = SessionRegistry(
+    factory=create_session,
+    ttl_seconds=AppConfig.SESSION_TTL_DAYS * 24 * 3600,
+    max_sessions=AppConfig.SESSION_MAX_COUNT,
+    sweep_interval=AppConfig.SESSION_SWEEP_INTERVAL
+)
+
+# 同一会话的请求串行执行，重复提交（双击、弱网重试）合并为一次
+session_guard = SessionGuard()
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    """启动会话过期清理任务"""
+    sessions.start()
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    """停止会话清理任务，关闭共享的LLM连接池，写完剩余日志"""
+    await sessions.stop()
+    await llm_registry.aclose()
+    shutdown_logging()
+
 def get_user_identifier(request: Request) -> str:
     """基于session_id的用户标识获取函数"""
-    print(f"[DEBUG] ===== 用户标识获取 =====")
-    
     # 检查是否有session_id cookie
     session_id = request.cookies.get("sid")
     
     if session_id:
-        print(f"[DEBUG] 找到现有session_id: {session_id}")
+        session_logger.debug("找到现有session_id: %s", session_id)
         return session_id
     else:
         # 生成新的session_id
         import uuid
-        import time
         new_session_id = uuid.uuid4().hex
-        session_creation_times[new_session_id] = time.time()
-        print(f"[DEBUG] 生成新session_id: {new_session_id}")
+        session_logger.debug("生成新session_id: %s", new_session_id)
         return new_session_id
 
-# 用户记忆管理器 - 简化为直接使用Agent架构
-user_memory_managers: Dict[str, Any] = {}
-
-# 海王对战历史管理 - 只保存上一轮对话
-seaking_last_conversations: Dict[str, str] = {}
-
-# Session管理 - 记录session创建时间，用于TTL清理
-session_creation_times: Dict[str, float] = {}
-
-def cleanup_expired_sessions():
-    """清理过期的session和相关数据"""
-    import time
-    current_time = time.time()
-    ttl_seconds = AppConfig.SESSION_TTL_DAYS * 24 * 3600
-    
-    expired_sessions = []
-    for session_id, creation_time in session_creation_times.items():
-        if current_time - creation_time > ttl_seconds:
-            expired_sessions.append(session_id)
-    
-    for session_id in expired_sessions:
-        # 清理session相关数据
-        session_creation_times.pop(session_id, None)
-        user_memory_managers.pop(session_id, None)
-        seaking_last_conversations.pop(session_id, None)
-        print(f"[DEBUG] 清理过期session: {session_id}")
-    
-    if expired_sessions:
-        print(f"[DEBUG] 清理了 {len(expired_sessions)} 个过期session")
-
 class ChatRequest(BaseModel):
     message: str
     persona: str = ""
@@ -97,110 +127,27 @@ class ChatRequest(BaseModel):
     weakness: Optional[str] = None  # 人设弱点
 
 def get_memory_manager(user_ip: str):
-    """获取用户的记忆管理器和Agent"""
-    if user_ip not in user_memory_managers:
-        # 直接创建记忆管理器
-        memory_manager = SmartMemoryManager(
-            max_tokens=1500,
-            summary_trigger_ratio=0.8
-        )
-        
-        # 创建Agent
-        agent = build_agent(memory_manager)
-        
-        # 存储记忆管理器和Agent
-        user_memory_managers[user_ip] = {
-            "memory_manager": memory_manager,
-            "agent": agent
-        }
-    return user_memory_managers[user_ip]
+    """获取用户的会话数据（包含记忆管理器），访问即续期"""
+    return sessions.get(user_ip)
+
+def request_key(request: ChatRequest) -> str:
+    """单飞合并的请求指纹：除前端历史外的全部字段"""
+    return json.dumps(request.dict(exclude={"history"}), ensure_ascii=False, sort_keys=True)
+
+async def resolve_memory(result):
+    """统一同步/异步记忆管理器的返回值（redis_async后端的方法返回协程）"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
 
 def generate_seaking_persona(button_type: str) -> Dict[str, Any]:
     """根据按钮类型生成随机海王人设"""
-    personas_data = AppConfig.load_personas()
-    
-    if button_type not in personas_data:
-        return {
-            "persona": "ENTJ-高阶PUA",
-            "gender": "男",
-            "user_gender": "女",
-            "challenge_type": "海王对战",
-            "description": "以刺激、新鲜感制造情绪过山车，擅长用“临时计划+高频邀约”建立优势地位，习惯在临界亲密前切换目标。",
-            "style": "夜生活达人、运动控、擅长即兴决策与肢体语言",
-            "weakness": "耐心差、厌倦快，深度关系维护能力低"
-        }
-    
-    config = personas_data[button_type]
-    if "personas" in config and config["personas"]:
-        selected_persona = random.choice(config["personas"])
-        return {
-            "persona": selected_persona.get("name", "ENTJ-高阶PUA"),
-            "gender": selected_persona.get("gender", "男"),
-            "user_gender": selected_persona.get("user_gender", "女"),
-            "challenge_type": selected_persona.get("challenge_type", "海王对战"),
-            "description": selected_persona.get("description", "以刺激、新鲜感制造情绪过山车，擅长用“临时计划+高频邀约”建立优势地位，习惯在临界亲密前切换目标。"),
-            "style": selected_persona.get("style", "夜生活达人、运动控、擅长即兴决策与肢体语言"),
-            "weakness": selected_persona.get("weakness", "耐心差、厌倦快，深度关系维护能力低")
-        }
-    
-    # 降级处理
-    return {
-        "persona": "ENTJ-高阶PUA",
-        "gender": "男",
-        "user_gender": "女",
-        "challenge_type": "海王对战",
-        "description": "以刺激、新鲜感制造情绪过山车，擅长用“临时计划+高频邀约”建立优势地位，习惯在临界亲密前切换目标。",
-        "style": "夜生活达人、运动控、擅长即兴决策与肢体语言",
-        "weakness": "耐心差、厌倦快，深度关系维护能力低"
-    }
-
-def parse_seaking_score(ai_response: str, prev_score: int, is_first_round: bool = False) -> tuple[int, bool]:
-    """从AI回复中解析得分和胜利状态"""
-    try:
-        print(f"[DEBUG] 解析得分 - AI回复: {ai_response[:200]}...")
-        print(f"[DEBUG] 解析得分 - 上轮得分: {prev_score}")
-        
-        # 检查是否通关
-        if "🎉恭喜挑战成功" in ai_response or "恭喜通关" in ai_response:
-            print(f"[DEBUG] 检测到通关信息")
-            return 100, True
-        
-        # 检查是否是第一轮对话（基于对话历史判断）
-        if is_first_round:
-            print(f"[DEBUG] 检测到第一轮对话，保持得分为0")
-            return 0, False
-        
-        # 更精确的得分匹配模式 - 专门匹配拽姐旁白中的得分
-        score_patterns = [
-            r'【拽姐旁白】.*?当前得分[：:]\s*(\d+)',  # 匹配拽姐旁白中的当前得分
-            r'当前得分[：:]\s*(\d+)',  # 匹配当前得分
-            r'得分[：:]\s*(\d+)'  # 匹配得分
-        ]
-        
-        for pattern in score_patterns:
-            match = re.search(pattern, ai_response)
-            if match:
-                score = int(match.group(1))
-                print(f"[DEBUG] 成功解析得分: {score} (使用模式: {pattern})")
-                return score, score >= 100
-        
-        # 如果没有找到明确的得分，保持原得分不变
-        print(f"[DEBUG] 未找到得分信息，保持原得分: {prev_score}")
-        return prev_score, prev_score >= 100
-        
-    except Exception as e:
-        print(f"[Error] Parse seaking score failed: {e}")
-        print(f"[DEBUG] 异常情况，返回原得分: {prev_score}")
-        return prev_score, prev_score >= 100
+    return persona_catalog.random_persona(button_type) or dict(PERSONA_DEFAULTS)
 
 @app.get("/")
 async def read_index(req: Request):
     """主页面"""
-    response = FileResponse('static/index_modern.html')
-    if AppConfig.IS_DEVELOPMENT:
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+    response = static_assets.response("index_modern.html", req)
     
     # 检查是否需要设置session_id cookie
     if not req.cookies.get("sid"):
@@ -219,11 +166,7 @@ async def read_index(req: Request):
 @app.get("/chat")
 async def read_chat(req: Request):
     """聊天页面"""
-    response = FileResponse('static/chat.html')
-    if AppConfig.IS_DEVELOPMENT:
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+    response = static_assets.response("chat.html", req)
     
     # 检查是否需要设置session_id cookie
     if not req.cookies.get("sid"):
@@ -242,22 +185,21 @@ async def read_chat(req: Request):
 @app.post("/chat")
 async def chat(request: ChatRequest, req: Request):
     """聊天端点 - 支持直接海王对战和正常Agent模式"""
-    # 定期清理过期session
-    cleanup_expired_sessions()
-    
     user_ip = get_user_identifier(req)
     
     try:
         user_session = get_memory_manager(user_ip)
         memory_manager = user_session["memory_manager"]
-        agent = user_session["agent"]
         
-        # 🌊 检查是否为海王对战模式
-        if request.button_type and AppConfig.is_seaking_mode(request.button_type):
-            response_data = await handle_seaking_mode(request, memory_manager, user_ip)
-        else:
-            # 正常聊天模式 - 使用同步优化逻辑
-            response_data = handle_normal_chat(request, memory_manager, agent)
+        async def process():
+            # 🌊 检查是否为海王对战模式
+            if request.button_type and AppConfig.is_seaking_mode(request.button_type):
+                return await handle_seaking_mode(request, memory_manager, user_ip)
+            # 正常聊天模式 - 全异步链路，LLM等待期间不阻塞其他用户
+            return await handle_normal_chat(request, memory_manager)
+        
+        # 同一会话串行处理；相同内容的请求在途时直接等待其结果
+        response_data = await session_guard.run(user_ip, request_key(request), process)
         
         # 检查是否需要设置session_id cookie
         if not req.cookies.get("sid"):
@@ -277,99 +219,114 @@ async def chat(request: ChatRequest, req: Request):
         return response_data
         
     except Exception as e:
-        print(f"[Error] Chat processing failed: {e}")
+        logger.error("Chat processing failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+def resolve_seaking_persona(request: ChatRequest) -> Dict[str, Any]:
+    """按人设ID从人设库查找，其次使用前端传递的人设信息，都没有则生成新的"""
+    catalog_persona = persona_catalog.get(request.persona) if request.persona else None
+    if catalog_persona:
+        persona_config = catalog_persona
+        seaking_logger.debug("使用人设库中的人设: %s", request.persona)
+    elif request.persona and request.gender and request.user_gender and request.challenge_type and request.description and request.style and request.weakness:
+        # 前端已传递完整人设信息，直接使用
+        persona_config = {
+            "persona": request.persona,
+            "gender": request.gender,
+            "user_gender": request.user_gender,
+            "challenge_type": request.challenge_type,
+            "description": request.description,
+            "style": request.style,
+            "weakness": request.weakness
+        }
+        seaking_logger.debug("使用前端传递的人设: %s", request.persona)
+    else:
+        # 生成海王人设（通常只在第一次切换模式时发生）
+        persona_config = generate_seaking_persona(request.button_type)
+        seaking_logger.debug("生成新的随机人设: %s", persona_config["persona"])
+    return persona_config
+
+def get_seaking_last_conversation(user_ip: str) -> tuple[str, bool]:
+    """获取上一轮对话 - 使用后端独立维护的海王对话历史"""
+    last_conversation = sessions.get(user_ip)["seaking_last_conversation"] or "（这是第一轮对话）"
+    is_first_round = last_conversation == "（这是第一轮对话）"
+    if seaking_logger.isEnabledFor(logging.DEBUG):
+        seaking_logger.debug("海王模式对话历史检查", extra={"fields": {
+            "user": user_ip,
+            "first_round": is_first_round,
+            "last_conversation": repr(last_conversation)
+        }})
+    return last_conversation, is_first_round
+
+def finish_seaking_turn(request: ChatRequest, user_ip: str, parsed: SeakingStreamParser, is_first_round: bool) -> tuple[int, bool]:
+    """根据解析结果确定本轮得分，并保存对话历史供下一轮使用"""
+    new_score, is_victory = parsed.result(request.seaking_score, is_first_round)
+    seaking_logger.debug("海王得分处理结果: 原得分=%s, 新得分=%s, 是否通关=%s",
+                         request.seaking_score, new_score, is_victory)
+    
+    if parsed.victory:
+        # 通关后清除对话历史
+        sessions.get(user_ip)["seaking_last_conversation"] = None
+    else:
+        # 无论是否第一轮，都保存本轮对话（海王台词 + 用户回复）给下轮使用
+        conversation_record = f"海王：{parsed.seaking_reply}\n用户：{request.message}"
+        sessions.get(user_ip)["seaking_last_conversation"] = conversation_record
+        seaking_logger.debug("海王对话历史已保存", extra={"fields": {
+            "user": user_ip,
+            "record": conversation_record
+        }})
+    
+    return new_score, is_victory
+
+def build_seaking_mode_info(request: ChatRequest, persona_config: Dict[str, Any], new_score: int, is_victory: bool) -> Dict[str, Any]:
+    """构建返回给前端的海王对战状态"""
+    return {
+        "button_type": request.button_type,
+        "persona": persona_config["persona"],
+        "challenge_type": persona_config["challenge_type"],
+        "current_score": new_score,
+        "is_victory": is_victory,
+        "is_first_seaking": False  # 新的Chain不需要首次对话概念
+    }
+
+def seaking_chain_inputs(request: ChatRequest, persona_config: Dict[str, Any]) -> Dict[str, Any]:
+    """组装SeakingChain的调用参数（不含上一轮对话）"""
+    return {
+        "persona": persona_config["persona"],
+        "user_input": request.message,
+        "current_score": request.seaking_score,
+        "challenge_type": persona_config["challenge_type"],
+        # 传入海王性别、用户性别
+        "gender": persona_config["gender"],
+        "user_gender": persona_config["user_gender"],
+        "description": persona_config["description"],
+        "style": persona_config["style"],
+        "weakness": persona_config["weakness"],
+    }
+
 async def handle_seaking_mode(request: ChatRequest, memory_manager, user_ip: str):
     """处理海王对战模式"""
-    print(f"=== handle_seaking_mode 被调用 ===")
-    print(f"请求参数: button_type={request.button_type}, persona={request.persona}")
+    import time
+    
+    seaking_logger.debug("handle_seaking_mode: button_type=%s, persona=%s", request.button_type, request.persona)
+    start_time = time.time()
     try:
-        # 使用前端传递的人设信息，如果没有则生成新的
-        if request.persona and request.gender and request.user_gender and request.challenge_type and request.description and request.style and request.weakness:
-            # 前端已传递完整人设信息，直接使用
-            persona_config = {
-                "persona": request.persona,
-                "gender": request.gender,
-                "user_gender": request.user_gender,
-                "challenge_type": request.challenge_type,
-                "description": request.description,
-                "style": request.style,
-                "weakness": request.weakness
-            }
-            print(f"[DEBUG] 使用前端传递的人设: {request.persona}")
-        else:
-            # 生成海王人设（通常只在第一次切换模式时发生）
-            persona_config = generate_seaking_persona(request.button_type)
-            print(f"[DEBUG] 生成新的随机人设: {persona_config['persona']}")
-        
-        # 使用新的SeakingChain
-        from src.tools.seaking import SeakingChain
-        seaking_chain = SeakingChain()
-        
-        # 获取上一轮对话 - 使用后端独立维护的海王对话历史
-        last_conversation = seaking_last_conversations.get(user_ip, "（这是第一轮对话）")
-        is_first_round = last_conversation == "（这是第一轮对话）"
-        print(f"[DEBUG] ===== 海王模式对话历史检查 =====")
-        print(f"[DEBUG] 用户IP: {user_ip}")
-        print(f"[DEBUG] 当前seaking_last_conversations内容: {dict(seaking_last_conversations)}")
-        print(f"[DEBUG] 本用户的上一轮对话: {repr(last_conversation)}")
-        print(f"[DEBUG] 是否为第一轮: {is_first_round}")
-        print(f"[DEBUG] ===== 对话历史检查结束 =====")
-        
-        # 直接调用SeakingChain
-        ai_response = seaking_chain.run(
-            persona=persona_config["persona"],
-            user_input=request.message,
-            current_score=request.seaking_score,
-            challenge_type=persona_config["challenge_type"],
-            # 传入海王性别、用户性别
-            gender=persona_config["gender"],
-            user_gender=persona_config["user_gender"],
-            description=persona_config["description"],
-            style=persona_config["style"],
-            weakness=persona_config["weakness"],
-            last_conversation=last_conversation
+        persona_config = resolve_seaking_persona(request)
+        
+        seaking_chain = get_seaking_chain(persona_config["challenge_type"])
+        
+        last_conversation, is_first_round = get_seaking_last_conversation(user_ip)
+        
+        # 异步调用SeakingChain
+        chain_start = time.time()
+        ai_response = await seaking_chain.arun(
+            last_conversation=last_conversation,
+            **seaking_chain_inputs(request, persona_config)
         )
+        chain_time = time.time() - chain_start
         
-        # 从AI回复中解析得分和胜利状态
-        new_score, is_victory = parse_seaking_score(ai_response, request.seaking_score, is_first_round)
-        print(f"[DEBUG] 海王得分处理结果: 原得分={request.seaking_score}, 新得分={new_score}, 是否通关={is_victory}")
-        
-        # 检查是否通关
-        if "🎉恭喜挑战成功" in ai_response:
-            is_victory = True
-            new_score = 100
-            print(f"[DEBUG] 检测到通关消息，强制设置得分为100")
-            # 通关后清除对话历史
-            seaking_last_conversations.pop(user_ip, None)
-        else:
-            # 保存当前对话历史供下一轮使用
-            # 无论是否第一轮，都需要保存本轮对话给下轮使用
-            
-            # 提取海王的回复（在【海王】和【拽姐旁白】之间的内容）
-            seaking_reply = ""
-            if "【海王】" in ai_response:
-                # 提取海王回复部分
-                seaking_part = ai_response.split("【海王】")[1]
-                if "【拽姐旁白】" in seaking_part:
-                    seaking_reply = seaking_part.split("【拽姐旁白】")[0].strip()
-                else:
-                    seaking_reply = seaking_part.strip()
-                # 清理格式，移除人设名称前缀
-                if "：" in seaking_reply:
-                    seaking_reply = seaking_reply.split("：", 1)[1].strip()
-            
-            # 保存格式：海王回复 + 用户回复
-            conversation_record = f"海王：{seaking_reply}\n用户：{request.message}"
-            seaking_last_conversations[user_ip] = conversation_record
-            print(f"[DEBUG] ===== 对话历史保存详情 =====")
-            print(f"[DEBUG] 用户IP: {user_ip}")
-            print(f"[DEBUG] 海王回复: \"{seaking_reply}\"")
-            print(f"[DEBUG] 用户消息: \"{request.message}\"")
-            print(f"[DEBUG] 完整对话记录: \"{conversation_record}\"")
-            print(f"[DEBUG] 保存后的seaking_last_conversations: {dict(seaking_last_conversations)}")
-            print(f"[DEBUG] ===== 对话历史保存完成 =====")
+        new_score, is_victory = finish_seaking_turn(request, user_ip, SeakingStreamParser.parse(ai_response), is_first_round)
+        metrics.observe_stages(request.button_type, "", seaking_chain=chain_time, total=time.time() - start_time)
         
         # 海王对战模式不更新全局记忆，避免影响正常聊天
         
@@ -378,15 +335,8 @@ async def handle_seaking_mode(request: ChatRequest, memory_manager, user_ip: str
             "love_brain_index": 0,  # 海王对战模式下不计算恋爱脑指数
             "love_brain_level": "海王对战",
             "risk_signals": ["海王对战模式"],
-            "memory_stats": memory_manager.get_memory_stats(),  # 保持原有记忆状态
-            "seaking_mode": {
-                "button_type": request.button_type,
-                "persona": persona_config["persona"],
-                "challenge_type": persona_config["challenge_type"],
-                "current_score": new_score,
-                "is_victory": is_victory,
-                "is_first_seaking": False  # 新的Chain不需要首次对话概念
-            },
+            "memory_stats": await resolve_memory(memory_manager.get_memory_stats()),  # 保持原有记忆状态
+            "seaking_mode": build_seaking_mode_info(request, persona_config, new_score, is_victory),
             "routing_info": {
                 "routing_type": "direct_seaking_tool",
                 "success": True
@@ -398,69 +348,153 @@ async def handle_seaking_mode(request: ChatRequest, memory_manager, user_ip: str
         }
         
     except Exception as e:
-        print(f"[Error] Seaking mode failed: {e}")
+        logger.error("Seaking mode failed: %s", e)
         return {
             "response": "海王对战系统暂时故障，请稍后再试...🚬",
             "love_brain_index": 0,
             "love_brain_level": "海王对战",
             "risk_signals": [],
-            "memory_stats": memory_manager.get_memory_stats(),  # 保持原有记忆状态
+            "memory_stats": await resolve_memory(memory_manager.get_memory_stats()),  # 保持原有记忆状态
             "seaking_mode": {
                 "button_type": request.button_type,
                 "error": True
             }
         }
 
-def handle_normal_chat(request: ChatRequest, memory_manager, agent):
-    """处理正常聊天模式 - 全同步架构，简化设计"""
+async def stream_seaking_mode(request: ChatRequest, memory_manager, user_ip: str):
+    """海王对战模式的SSE事件流"""
     import time
     
-    print(f"[DEBUG] handle_normal_chat 被调用，使用全同步架构")
-    
-    # 开始性能计时
     start_time = time.time()
+    try:
+        persona_config = resolve_seaking_persona(request)
+        last_conversation, is_first_round = get_seaking_last_conversation(user_ip)
+        
+        yield sse_event("meta", {
+            "love_brain_index": 0,
+            "love_brain_level": "海王对战",
+            "risk_signals": ["海王对战模式"]
+        })
+        
+        seaking_chain = get_seaking_chain(persona_config["challenge_type"])
+        
+        parser = SeakingStreamParser()
+        first_token_time = None
+        # 边接收边解析：点评、得分、海王台词随段落结束推送；一旦出现通关标记立即结束生成
+        async with contextlib.aclosing(seaking_chain.astream(
+            last_conversation=last_conversation,
+            **seaking_chain_inputs(request, persona_config)
+        )) as stream:
+            async for token in stream:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                yield sse_event("token", {"text": token})
+                for event, data in parser.feed(token):
+                    yield sse_event(event, data)
+                if parser.victory:
+                    break
+        for event, data in parser.close():
+            yield sse_event(event, data)
+        
+        ai_response = VICTORY_MESSAGE if parser.victory else parser.text.strip()
+        new_score, is_victory = finish_seaking_turn(request, user_ip, parser, is_first_round)
+        
+        first_token = (first_token_time or time.time()) - start_time
+        total_time = time.time() - start_time
+        metrics.observe_stages(request.button_type, "", first_token=first_token, total=total_time)
+        
+        yield sse_event("done", {
+            "response": ai_response,
+            "memory_stats": await resolve_memory(memory_manager.get_memory_stats()),
+            "seaking_mode": build_seaking_mode_info(request, persona_config, new_score, is_victory),
+            "performance": {
+                "first_token_ms": int(first_token * 1000),
+                "total_time_ms": int(total_time * 1000)
+            }
+        })
+        
+    except Exception as e:
+        logger.error("Seaking stream failed: %s", e)
+        yield sse_event("error", {"detail": "海王对战系统暂时故障，请稍后再试...🚬"})
+
+async def prepare_normal_chat(request: ChatRequest, memory_manager) -> Dict[str, Any]:
+    """正常聊天的前置步骤：记忆上下文 + severity分析 + 选择路径 + 按token预算组装上下文"""
+    import time
     
     # 获取记忆上下文
-    memory_context = memory_manager.get_memory_context_for_tool()
+    memory_context = await resolve_memory(memory_manager.get_memory_context_for_tool())
     
-    # 🚀 同步severity分析 + 动态人设选择
+    # 🚀 异步severity分析 + 动态人设选择
     analysis_start = time.time()
-    analysis_result = severity_analyzer.analyze_with_answerstyle(request.message, memory_context)
+    analysis_result = await severity_analyzer.analyze_with_answerstyle_async(request.message, memory_context)
     analysis_time = time.time() - analysis_start
     
-    severity_result = SeverityResult(**analysis_result["severity"])
+    # 历史窗口、记忆摘要与用户输入在token预算内去重组装
+    route = chat_router.route(analysis_result)
+    context = context_assembler.assemble(
+        request.message,
+        memory_context,
+        load_chat_history(memory_manager),
+        analysis_result["style_level"],
+        severity_state=analysis_result["severity_state"],
+        persona=request.persona or "",
+        talk=route == ROUTE_TALK
+    )
+    metrics.CONTEXT_TOKENS.observe(context.tokens, path=route, over_budget=str(context.over_budget).lower())
     
-    # 准备传递给Agent的输入
-    if memory_context and memory_context != "无历史记忆":
-        # 检查上下文长度，避免过长
-        if len(memory_context) > 200:
-            memory_context = memory_context[:197] + "..."
-        combined_input = f"记忆上下文: {memory_context}\n用户输入: {request.message}"
-    else:
-        # 没有历史记忆时，直接使用用户输入
-        combined_input = request.message
+    return {
+        "analysis_result": analysis_result,
+        "severity_result": SeverityResult(**analysis_result["severity"]),
+        "route": route,
+        "context": context,
+        "analysis_time": analysis_time
+    }
+
+async def handle_normal_chat(request: ChatRequest, memory_manager):
+    """处理正常聊天模式 - 全异步架构，LLM调用均使用ainvoke"""
+    import time
     
-    # 如果是海王模拟模式，添加persona信息
-    if request.persona and request.persona.strip():
-        combined_input += f"\n\n海王人设: {request.persona}"
+    # 开始性能计时
+    start_time = time.time()
+    
+    prepared = await prepare_normal_chat(request, memory_manager)
+    analysis_result = prepared["analysis_result"]
+    severity_result = prepared["severity_result"]
+    analysis_time = prepared["analysis_time"]
     
-    # 🎯 构建带动态人设的Agent
+    # 🎯 按severity级别选择路径：直连单次生成，或交给Agent决定是否调用工具
     agent_build_start = time.time()
-    enhanced_agent = build_agent(
-        memory_manager=memory_manager,
-        answer_style=analysis_result["dynamic_prompt"]
-    )
+    route = prepared["route"]
+    context = prepared["context"]
+    enhanced_agent = level_agents.get(analysis_result["style_level"]) if route == ROUTE_AGENT else None
     agent_build_time = time.time() - agent_build_start
     
-    # 注意：预分析结果已通过动态人设注入到Agent的system prompt中，无需重复传递
+    # 注意：预分析结果通过 severity_state 注入到system prompt中，无需重复传递
     
-    # 🎯 执行带动态人设的Agent
+    # 🎯 生成回复，调用时绑定本会话记忆
+    call_counter = LLMCallCounter()
     agent_exec_start = time.time()
-    result = enhanced_agent.invoke({
-        "input": combined_input
-    })
+    if enhanced_agent is not None:
+        result = await ainvoke_with_memory(
+            enhanced_agent,
+            memory_manager,
+            context.input,
+            severity_state=analysis_result["severity_state"],
+            callbacks=[call_counter],
+            chat_history=context.chat_history
+        )
+        ai_response = result.get("output", "处理失败，请重试")
+    else:
+        ai_response = await chat_router.ainvoke(
+            route,
+            context.chat_history,
+            context.input,
+            request.message,
+            analysis_result["style_level"],
+            severity_state=analysis_result["severity_state"],
+            callbacks=[call_counter]
+        ) or "处理失败，请重试"
     agent_exec_time = time.time() - agent_exec_start
-    ai_response = result.get("output", "处理失败，请重试")
     
     # 使用预分析结果，无需从中间步骤解析
     love_brain_index = severity_result.index
@@ -468,18 +502,26 @@ def handle_normal_chat(request: ChatRequest, memory_manager, agent):
     risk_signals = severity_result.signals
     
     # 更新记忆中的对话记录
-    memory_manager.add_interaction(
+    await resolve_memory(memory_manager.add_interaction(
         user_input=request.message,
         ai_response=ai_response,
         love_brain_level=love_brain_level,
         risk_signals=risk_signals
-    )
+    ))
     
     # 获取记忆统计
-    memory_stats = memory_manager.get_memory_stats()
+    memory_stats = await resolve_memory(memory_manager.get_memory_stats())
     
     # 计算总耗时
     total_time = time.time() - start_time
+    metrics.observe_stages(
+        "normal", love_brain_level,
+        analysis=analysis_time,
+        agent_build=agent_build_time,
+        agent_exec=agent_exec_time,
+        total=total_time
+    )
+    chat_router.record(route, call_counter.calls, total_time)
     
     return {
         "response": ai_response,
@@ -490,7 +532,9 @@ def handle_normal_chat(request: ChatRequest, memory_manager, agent):
         # "severity_analysis": 已合并到顶层字段，避免重复数据
         # "answerstyle_used": 前端未使用，已移除避免数据冗余
         "routing_info": {
-            "routing_type": "sync_dynamic_persona_agent",
+            "routing_type": "async_dynamic_persona_agent" if route == ROUTE_AGENT else "direct_severity_route",
+            "path": route,
+            "severity_tier": analysis_result["severity_tier"],
             "success": True
         },
         "performance": {
@@ -498,15 +542,19 @@ def handle_normal_chat(request: ChatRequest, memory_manager, agent):
             "analysis_time_ms": int(analysis_time * 1000),
             "agent_build_time_ms": int(agent_build_time * 1000),
             "agent_exec_time_ms": int(agent_exec_time * 1000),
-            "architecture": "sync_optimized",
+            "llm_calls": call_counter.calls,
+            "context_tokens": context.tokens,
+            "context_over_budget": context.over_budget,
+            "architecture": "async_optimized",
             "routing_efficiency": 1.0
         },
         "debug_info": {} if os.getenv("DEBUG", "false").lower() != "true" else {
-            "architecture": "sync_dynamic_persona_agent",
+            "architecture": "async_dynamic_persona_agent",
             "memory_type": AppConfig.MEMORY_STORAGE_TYPE,
             "ip_isolation": AppConfig.ENABLE_IP_ISOLATION,
             "pre_analysis_used": severity_result.index > 0,
             "selected_persona_preview": analysis_result["answerstyle"]["roleset"][:50] + "...",
+            "context": context.to_dict(),
             "performance_breakdown": {
                 "analysis_percentage": int((analysis_time / total_time) * 100),
                 "agent_build_percentage": int((agent_build_time / total_time) * 100),
@@ -515,33 +563,167 @@ def handle_normal_chat(request: ChatRequest, memory_manager, agent):
         }
     }
 
-@app.post("/reset")
-async def reset_chat(req: Request):
-    """重置端点 - 清除短期记忆"""
+async def stream_normal_chat(request: ChatRequest, memory_manager):
+    """正常聊天模式的SSE事件流：首个事件为severity元数据，随后逐token推送，最后推送记忆统计"""
+    import time
+    
+    start_time = time.time()
+    try:
+        prepared = await prepare_normal_chat(request, memory_manager)
+        analysis_result = prepared["analysis_result"]
+        severity_result = prepared["severity_result"]
+        
+        yield sse_event("meta", {
+            "love_brain_index": severity_result.index,
+            "love_brain_level": severity_result.level,
+            "risk_signals": severity_result.signals
+        })
+        
+        route = prepared["route"]
+        context = prepared["context"]
+        call_counter = LLMCallCounter()
+        if route == ROUTE_AGENT:
+            events = astream_with_memory(
+                level_agents.get(analysis_result["style_level"]),
+                memory_manager,
+                context.input,
+                severity_state=analysis_result["severity_state"],
+                callbacks=[call_counter],
+                chat_history=context.chat_history
+            )
+        else:
+            events = chat_router.astream(
+                route,
+                context.chat_history,
+                context.input,
+                request.message,
+                analysis_result["style_level"],
+                severity_state=analysis_result["severity_state"],
+                callbacks=[call_counter]
+            )
+        
+        chunks = []
+        first_token_time = None
+        final_output = None
+        async for kind, value in events:
+            if kind == "token":
+                if first_token_time is None:
+                    first_token_time = time.time()
+                chunks.append(value)
+                yield sse_event("token", {"text": value})
+            else:
+                final_output = value
+        
+        ai_response = final_output or "".join(chunks) or "处理失败，请重试"
+        
+        # 更新记忆中的对话记录
+        await resolve_memory(memory_manager.add_interaction(
+            user_input=request.message,
+            ai_response=ai_response,
+            love_brain_level=severity_result.level,
+            risk_signals=severity_result.signals
+        ))
+        
+        first_token = (first_token_time or time.time()) - start_time
+        total_time = time.time() - start_time
+        metrics.observe_stages(
+            "normal", severity_result.level,
+            analysis=prepared["analysis_time"],
+            first_token=first_token,
+            total=total_time
+        )
+        chat_router.record(route, call_counter.calls, total_time)
+        
+        yield sse_event("done", {
+            "response": ai_response,
+            "memory_stats": await resolve_memory(memory_manager.get_memory_stats()),
+            "performance": {
+                "analysis_time_ms": int(prepared["analysis_time"] * 1000),
+                "first_token_ms": int(first_token * 1000),
+                "total_time_ms": int(total_time * 1000),
+                "path": route,
+                "llm_calls": call_counter.calls,
+                "context_tokens": context.tokens,
+                "context_over_budget": context.over_budget
+            }
+        })
+        
+    except Exception as e:
+        logger.error("Chat stream failed: %s", e)
+        yield sse_event("error", {"detail": str(e)})
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, req: Request):
+    """流式聊天端点 - 以SSE推送meta / token / done 事件"""
     user_ip = get_user_identifier(req)
     
     try:
         user_session = get_memory_manager(user_ip)
         memory_manager = user_session["memory_manager"]
         
-        # 重置记忆
-        memory_manager.clear_session()
+        def produce():
+            if request.button_type and AppConfig.is_seaking_mode(request.button_type):
+                return stream_seaking_mode(request, memory_manager, user_ip)
+            return stream_normal_chat(request, memory_manager)
+        
+        # 同一会话串行处理；相同内容的流在途时订阅同一条事件流
+        events = session_guard.stream(user_ip, request_key(request), produce)
         
-        # 清除海王对战历史
-        seaking_last_conversations.pop(user_ip, None)
+        response = StreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no"  # 禁用反向代理缓冲，保证逐token到达
+            }
+        )
+        
+        # 检查是否需要设置session_id cookie
+        if not req.cookies.get("sid"):
+            response.set_cookie(
+                key="sid", 
+                value=user_ip, 
+                max_age=AppConfig.SESSION_TTL_DAYS*24*3600,  # 使用配置的TTL
+                httponly=True,
+                secure=False,  # 开发环境设为False，生产环境可设为True
+                samesite="lax"
+            )
         
-        # 重新创建Agent (确保使用新的记忆状态)
-        agent = build_agent(memory_manager)
-        user_memory_managers[user_ip]["agent"] = agent
+        return response
         
-        return {
-            "message": "会话已重置，短期记忆已清除",
-            "memory_stats": memory_manager.get_memory_stats(),
-            "routing_enabled": False,
-            "architecture": "direct_agent"
-        }
     except Exception as e:
-        print(f"[Error] Reset failed: {e}")
+        logger.error("Chat stream failed: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/reset")
+async def reset_chat(req: Request):
+    """重置端点 - 清除短期记忆"""
+    user_ip = get_user_identifier(req)
+    
+    try:
+        # 与 /chat 共用会话锁：排在进行中的对话之后执行，避免对话结束时把记忆写回已重置的会话
+        async with session_guard.lock(user_ip):
+            user_session = get_memory_manager(user_ip)
+            memory_manager = user_session["memory_manager"]
+            
+            # 重置记忆
+            await resolve_memory(memory_manager.clear_session())
+            
+            # 清除海王对战历史
+            user_session["seaking_last_conversation"] = None
+            
+            return {
+                "message": "会话已重置，短期记忆已清除",
+                "memory_stats": await resolve_memory(memory_manager.get_memory_stats()),
+                "routing_enabled": False,
+                "architecture": "direct_agent"
+            }
+    except Exception as e:
+        logger.error("Reset failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/system/status")
@@ -555,7 +737,11 @@ async def get_system_status(req: Request):
         
         return {
             "status": "running",
-            "memory_status": memory_manager.get_memory_stats(),
+            "memory_status": await resolve_memory(memory_manager.get_memory_stats()),
+            "llm_pool": llm_registry.get_stats(),
+            "logging": get_log_stats(),
+            "personas": persona_catalog.get_stats(),
+            "static_assets": static_assets.get_stats(),
             "system_config": {
                 "enhanced_routing_enabled": False,
                 "ip_isolation_enabled": AppConfig.ENABLE_IP_ISOLATION,
@@ -564,7 +750,7 @@ async def get_system_status(req: Request):
             }
         }
     except Exception as e:
-        print(f"[Error] Status check failed: {e}")
+        logger.error("Status check failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/system/routing/stats")
@@ -572,15 +758,38 @@ async def get_routing_stats():
     """路由统计端点 - 显示全局路由性能"""
     try:
         return {
-            "total_users": len(user_memory_managers),
-            "enhanced_routing_enabled": False,
-            "architecture": "direct_agent",
-            "per_user_stats": {}
+            "total_users": len(sessions),
+            "sessions": sessions.get_stats(),
+            "routes": metrics.get_route_stats(),
+            "llm": {
+                "calls": sum(metrics.LLM_CALLS.collect().values()),
+                "failures": sum(metrics.LLM_FAILURES.collect().values())
+            },
+            "severity_fallbacks": {key[0]: value for key, value in metrics.SEVERITY_FALLBACKS.collect().items()},
+            "memory_compressions": metrics.MEMORY_COMPRESSIONS.get(),
+            "severity_tiers": severity_analyzer.get_tier_stats(),
+            "severity_batching": (severity_analyzer.batcher.get_stats()
+                                   if severity_analyzer.batcher else {"enabled": False}),
+            "seaking_chains": get_seaking_stats(),
+            "chat_router": chat_router.get_stats(),
+            "session_guard": session_guard.get_stats()
         }
     except Exception as e:
-        print(f"[Error] Routing stats failed: {e}")
+        logger.error("Routing stats failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus指标 - 各阶段耗时直方图（按路由与恋爱脑级别）、LLM调用/失败、降级、会话与压缩计数"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/system/severity/cache")
+async def get_severity_cache_stats():
+    """恋爱脑分析缓存统计 - 命中/未命中/淘汰计数"""
+    if severity_analyzer.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **severity_analyzer.cache.get_stats()}
+
 @app.get("/memory/stats")
 async def get_memory_stats(request: Request):
     """获取记忆统计信息 - 供前端记忆按钮使用"""
@@ -589,7 +798,7 @@ async def get_memory_stats(request: Request):
         user_session = get_memory_manager(user_ip)
         
         # 获取记忆统计
-        memory_stats = user_session["memory_manager"].get_memory_stats()
+        memory_stats = await resolve_memory(user_session["memory_manager"].get_memory_stats())
         
         return {
             "conversation_count": memory_stats.get("conversation_count", 0),
@@ -602,7 +811,7 @@ async def get_memory_stats(request: Request):
             "long_term_count": memory_stats.get("long_term_count", 0)
         }
     except Exception as e:
-        print(f"[Error] Memory stats failed: {e}")
+        logger.error("Memory stats failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/memory/summary")
@@ -612,15 +821,15 @@ async def get_memory_summary(request: Request):
         user_ip = get_user_identifier(request)
         user_session = get_memory_manager(user_ip)
         
-        # 获取记忆统计和上下文摘要
-        memory_stats = user_session["memory_manager"].get_memory_stats()
-        context_summary = user_session["memory_manager"].get_context_summary()
-        
-        # 获取长期记忆详细信息
-        long_term_memory = user_session["memory_manager"].long_term_memory
+        memory_manager = user_session["memory_manager"]
         
-        # 获取用户画像总结
-        user_profile = user_session["memory_manager"].get_user_profile_summary()
+        # 并发获取记忆统计、上下文摘要、长期记忆详细信息和用户画像总结
+        memory_stats, context_summary, long_term_memory, user_profile = await asyncio.gather(
+            resolve_memory(memory_manager.get_memory_stats()),
+            resolve_memory(memory_manager.get_context_summary()),
+            resolve_memory(memory_manager.get_long_term_memory()),
+            resolve_memory(memory_manager.get_user_profile_summary())
+        )
         
         return {
             "stats": {
@@ -643,32 +852,38 @@ async def get_memory_summary(request: Request):
             "user_profile": user_profile
         }
     except Exception as e:
-        print(f"[Error] Memory summary failed: {e}")
+        logger.error("Memory summary failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/seaking/personas")
-async def get_seaking_personas():
-    """获取海王人设库 - 供前端使用"""
-    try:
-        # 从 JSON 文件读取人设配置
-        personas_file = os.path.join("static", "personas.json")
-        with open(personas_file, 'r', encoding='utf-8') as f:
-            personas_data = json.load(f)
-        
-        # 直接返回人设数据，保持与前端期望的结构一致
-        return personas_data
-    except Exception as e:
-        print(f"[Error] Get seaking personas failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+async def get_seaking_personas(req: Request):
+    """获取海王人设库 - 供前端使用（预序列化响应体，ETag未变化时返回304）"""
+    snapshot = persona_catalog.snapshot()
+    if not snapshot.data:
+        raise HTTPException(status_code=500, detail="人设库加载失败")
+    
+    # no-cache：浏览器每次携带If-None-Match重新验证，人设文件更新后立即生效
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if etag_matches(req.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.payload, media_type="application/json", headers=headers)
 
 @app.get("/health")
 async def health_check():
     """健康检查端点 - Railway部署需要"""
     return {"status": "healthy", "service": "anti-love-brain-agent"}
 
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_file(path: str, req: Request):
+    """静态资源（预压缩 + ETag/Last-Modified，内容哈希URL长期缓存）"""
+    response = static_assets.response(path, req)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
+
 @app.get("/favicon.ico")
-async def favicon():
-    return FileResponse('static/favicon.svg')
+async def favicon(req: Request):
+    return static_assets.response("favicon.svg", req)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/chat 并发吞吐基准测试
+
+用固定延迟的模拟LLM后端（LLM_BACKEND=fake）替换真实模型，在进程内通过ASGI直接驱动 /chat，
+观察吞吐随并发客户端数的变化。异步链路下，吞吐应近似随并发线性增长，
+直到受CPU限制；若某处LLM调用仍是同步阻塞，吞吐会停留在 1/延迟 附近。
+
+用法:
+    python benchmarks/concurrency_bench.py --latency 0.2 --requests 64
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENAI_MODEL", "bench-model")
+
+
+def install_fake_llm(latency: float):
+    """在导入app之前切换到模拟LLM后端（固定延迟，见 src/core/fake_llm.py），LangSmith追踪随之关闭"""
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = f"fixed:{latency}"
+
+
+async def run_level(client, concurrency: int, total: int, seaking: bool) -> float:
+    """以给定并发度发送total个请求，返回吞吐(req/s)"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(worker_id: int):
+        sid = f"bench-{concurrency}-{worker_id}"
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {"message": "他不回我消息，我是不是想太多了"}
+            if seaking:
+                payload["button_type"] = "🌊对战海王"
+            resp = await client.post("/chat", json=payload, cookies={"sid": sid})
+            resp.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="/chat 并发吞吐基准")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟LLM单次调用延迟（秒）")
+    parser.add_argument("--requests", type=int, default=64, help="每个并发档位的请求数")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="并发档位，逗号分隔")
+    parser.add_argument("--seaking", action="store_true", help="压测海王对战模式而非正常聊天")
+    args = parser.parse_args()
+
+    install_fake_llm(args.latency)
+
+    import httpx
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    mode = "seaking" if args.seaking else "normal"
+    results = []
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for concurrency in levels:
+            with contextlib.redirect_stdout(io.StringIO()):
+                rps = await run_level(client, concurrency, args.requests, args.seaking)
+            results.append((concurrency, rps))
+
+    baseline = results[0][1] if results else 0
+    print(f"mode={mode} latency={args.latency}s requests/level={args.requests}")
+    print(f"{'concurrency':>12} {'req/s':>10} {'speedup':>8}")
+    for concurrency, rps in results:
+        speedup = rps / baseline if baseline else 0
+        print(f"{concurrency:>12} {rps:>10.2f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OpenAI兼容的本地stub服务器 - 离线压测时代替真实模型服务
+
+提供 /v1/chat/completions（含stream与tools）和 /v1/models，回复内容、延迟分布与
+错误注入与 LLM_BACKEND=fake 的进程内模拟模型一致（见 src/core/fake_llm.py）。
+与进程内模式相比，请求会经过ChatOpenAI、HTTP连接池和SSE解析，可以观察真实的客户端开销。
+
+用法:
+    python benchmarks/fake_openai_server.py --port 8010 --latency lognormal:0.3,0.6 --error-rate 0.01
+    OPENAI_BASE_URL=http://127.0.0.1:8010/v1 OPENAI_API_KEY=fake OPENAI_MODEL=fake python app.py
+
+    # 重尾延迟 + 限流错误
+    python benchmarks/fake_openai_server.py --latency pareto:0.2,1.5 --error-rate 0.02 --error-status 429
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.core.fake_llm import (FAKE_LLM_SEED, FakeLLMProfile, FakeReply, LatencyDistribution, build_reply,
+                               get_default_profile, iter_chunks, new_tool_call_id)
+
+# OpenAI消息角色 -> build_reply 使用的角色
+ROLE_MAP = {"system": "system", "user": "human", "assistant": "ai", "tool": "tool"}
+
+app = FastAPI(title="Fake OpenAI")
+profile: FakeLLMProfile = get_default_profile()
+stats = {"requests": 0, "streams": 0, "tool_calls": 0, "errors_injected": 0}
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """OpenAI消息 -> [(角色, 文本)]，多段content只保留文本部分"""
+    normalized = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        normalized.append((ROLE_MAP.get(message.get("role"), "human"), content))
+    return normalized
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+
+def tool_call_payload(reply: FakeReply) -> List[Dict[str, Any]]:
+    name, args = reply.tool_call
+    return [{
+        "id": new_tool_call_id(),
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)},
+    }]
+
+
+def error_response() -> JSONResponse:
+    stats["errors_injected"] += 1
+    return JSONResponse(status_code=profile.error_status, content={"error": {
+        "message": "Injected failure from fake OpenAI server",
+        "type": "rate_limit_error" if profile.error_status == 429 else "server_error",
+        "code": None,
+    }})
+
+
+def completion_body(completion_id: str, model: str, reply: FakeReply, prompt_tokens: int) -> Dict[str, Any]:
+    message: Dict[str, Any] = {"role": "assistant", "content": reply.content or None}
+    if reply.tool_call is not None:
+        message["tool_calls"] = tool_call_payload(reply)
+    completion_tokens = estimate_tokens(reply.content)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if reply.tool_call is not None else "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+async def stream_body(completion_id: str, model: str, reply: FakeReply) -> AsyncIterator[str]:
+    """按OpenAI流式格式输出SSE：角色 -> 内容/工具调用片段 -> finish_reason -> [DONE]"""
+    created = int(time.time())
+
+    def chunk(delta: Dict[str, Any], finish_reason: Any = None) -> str:
+        body = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    if reply.tool_call is not None:
+        call = tool_call_payload(reply)[0]
+        yield chunk({"tool_calls": [dict(index=0, **call)]})
+        yield chunk({}, "tool_calls")
+    else:
+        for i, text in enumerate(iter_chunks(reply.content)):
+            if i and profile.token_interval:
+                await asyncio.sleep(profile.token_interval)
+            yield chunk({"content": text})
+        yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "local"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    model = body.get("model") or "fake"
+
+    # 首token延迟（流式）或完整响应延迟（非流式）
+    await asyncio.sleep(profile.sample_latency())
+    if profile.should_fail():
+        return error_response()
+
+    messages = normalize_messages(body.get("messages", []))
+    tool_names = [tool.get("function", {}).get("name", "") for tool in body.get("tools") or ()]
+    reply = build_reply(messages, tool_names)
+    if reply.tool_call is not None:
+        stats["tool_calls"] += 1
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    if body.get("stream"):
+        stats["streams"] += 1
+        return StreamingResponse(stream_body(completion_id, model, reply), media_type="text/event-stream")
+
+    prompt_tokens = sum(estimate_tokens(content) for _, content in messages)
+    return completion_body(completion_id, model, reply, prompt_tokens)
+
+
+@app.get("/stats")
+async def get_stats():
+    return {"profile": profile.describe(), **stats}
+
+
+def main():
+    global profile
+    parser = argparse.ArgumentParser(description="OpenAI兼容的本地stub服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", help="延迟分布，如 fixed:0.2 / lognormal:0.3,0.6 / pareto:0.2,1.5（默认读 FAKE_LLM_LATENCY）")
+    parser.add_argument("--latency-max", type=float, help="单次延迟上限（秒）")
+    parser.add_argument("--token-interval", type=float, help="流式片段间隔（秒）")
+    parser.add_argument("--error-rate", type=float, help="注入错误的概率（0~1）")
+    parser.add_argument("--error-status", type=int, help="注入错误的HTTP状态码")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    args = parser.parse_args()
+
+    env = FakeLLMProfile.from_env()
+    latency = env.latency
+    if args.latency or args.latency_max is not None:
+        latency = LatencyDistribution.parse(args.latency or str(env.latency),
+                                            args.latency_max if args.latency_max is not None else env.latency.max_seconds)
+    profile = FakeLLMProfile(
+        latency=latency,
+        error_rate=args.error_rate if args.error_rate is not None else env.error_rate,
+        error_status=args.error_status or env.error_status,
+        token_interval=args.token_interval if args.token_interval is not None else env.token_interval,
+        seed=args.seed if args.seed is not None else (int(FAKE_LLM_SEED) if FAKE_LLM_SEED else None),
+    )
+
+    import uvicorn
+    print(f"[FakeOpenAI] http://{args.host}:{args.port}/v1 {profile.describe()}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/chat 端到端压测
+
+使用模拟LLM后端（LLM_BACKEND=fake，见 src/core/fake_llm.py），在进程内通过ASGI驱动 /chat，
+覆盖正常聊天与全部海王对战模式，按并发档位统计：
+- 延迟 p50/p95/p99、吞吐 req/s、失败数
+- 各处理阶段平均耗时（取自 /metrics 的 antilove_stage_seconds 在本档位内的增量）
+- 每1000个会话的常驻内存（RSS）增量
+
+结果写入JSON文件（附带git提交号与参数），可用 --compare 与之前的结果对比，发现性能回退。
+
+用法:
+    python benchmarks/load_test.py --concurrency 1,8,32 --requests 200 --output results/load_test.json
+    # 重尾延迟 + 1%失败
+    python benchmarks/load_test.py --latency pareto:0.1,1.5 --error-rate 0.01
+    # 与上一次结果对比
+    python benchmarks/load_test.py --compare results/load_test.json --output results/load_test_new.json
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENAI_MODEL", "bench-model")
+
+NORMAL_MODE = "正常聊天"
+
+# 各模式的用户消息（按轮次循环）
+NORMAL_MESSAGES = [
+    "他不回我消息，我是不是想太多了",
+    "今天加班到十点，项目又延期了",
+    "他让我先转账两万，说下个月还",
+    "我每天都在看他朋友圈，停不下来",
+]
+SEAKING_MESSAGES = [
+    "你好呀",
+    "想我？那你昨天怎么不回消息",
+    "这套话术你对几个人说过了",
+    "不好意思，我对海王过敏",
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩百分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def current_rss_mb() -> float:
+    """当前常驻内存（MB），非Linux系统退化为峰值RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def stage_breakdown(before: Dict[Tuple[str, str, str], Dict[str, float]],
+                    after: Dict[Tuple[str, str, str], Dict[str, float]], route: str) -> Dict[str, float]:
+    """两次快照之间某路由各阶段的平均耗时（毫秒），跨恋爱脑级别合并"""
+    totals: Dict[str, List[float]] = {}
+    for key, data in after.items():
+        stage, stage_route, _level = key
+        if stage_route != route:
+            continue
+        prev = before.get(key, {"count": 0, "sum": 0.0})
+        entry = totals.setdefault(stage, [0, 0.0])
+        entry[0] += data["count"] - prev["count"]
+        entry[1] += data["sum"] - prev["sum"]
+    return {stage: round(total / count * 1000, 2) for stage, (count, total) in sorted(totals.items()) if count}
+
+
+async def run_level(client, mode: str, mode_id: int, concurrency: int, total: int, turns: int) -> Dict[str, Any]:
+    """以给定并发度发送total个请求；海王模式下每个会话连续对战turns轮，得分沿用上一轮返回值
+
+    mode_id 用于生成会话ID（cookie只能是ASCII，不能直接使用模式名）
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+    latencies: List[float] = []
+    errors = 0
+    seaking = mode != NORMAL_MODE
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        session_round = 0
+        session_index = 0
+        score = 0
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if session_round >= turns:
+                session_round, score = 0, 0
+                session_index += 1
+            sid = f"load-{mode_id}-{concurrency}-{worker_id}-{session_index}"
+
+            if seaking:
+                payload = {"message": SEAKING_MESSAGES[session_round % len(SEAKING_MESSAGES)],
+                           "button_type": mode, "seaking_score": score,
+                           "is_first_seaking": session_round == 0}
+            else:
+                payload = {"message": NORMAL_MESSAGES[i % len(NORMAL_MESSAGES)]}
+
+            start = time.perf_counter()
+            resp = await client.post("/chat", json=payload, headers={"Cookie": f"sid={sid}"})
+            elapsed = (time.perf_counter() - start) * 1000
+            session_round += 1
+            if resp.status_code != 200:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            if seaking:
+                score = resp.json().get("seaking_mode", {}).get("current_score", score)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "rps": round(total / duration, 2) if duration else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+async def measure_session_memory(client, sessions: int, concurrency: int) -> Dict[str, float]:
+    """新建sessions个会话（每个会话一轮正常聊天），统计RSS增量并折算为每1000个会话"""
+    gc.collect()
+    before = current_rss_mb()
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(sessions):
+        queue.put_nowait(i)
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await client.post("/chat", json={"message": NORMAL_MESSAGES[i % len(NORMAL_MESSAGES)]},
+                              headers={"Cookie": f"sid=rss-{i}"})
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    gc.collect()
+    after = current_rss_mb()
+    return {
+        "sessions": sessions,
+        "rss_before_mb": round(before, 2),
+        "rss_after_mb": round(after, 2),
+        "rss_per_1k_sessions_mb": round((after - before) / sessions * 1000, 2) if sessions else 0.0,
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    meta = report["meta"]
+    print(f"commit={meta['commit']} latency={meta['latency']} error_rate={meta['error_rate']}")
+    base_index = {(r["mode"], r["concurrency"]): r for r in (baseline or {}).get("results", [])}
+    header = f"{'mode':<16} {'conc':>5} {'req/s':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'errors':>7}"
+    if baseline:
+        header += f" {'Δp95':>8} {'Δreq/s':>8}"
+    print(header)
+    for r in report["results"]:
+        line = (f"{r['mode']:<16} {r['concurrency']:>5} {r['rps']:>9.1f} {r['p50_ms']:>9.1f} "
+                f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['errors']:>7}")
+        base = base_index.get((r["mode"], r["concurrency"]))
+        if base:
+            line += f" {r['p95_ms'] - base['p95_ms']:>+8.1f} {r['rps'] - base['rps']:>+8.1f}"
+        print(line)
+        if r["stages"]:
+            print(" " * 23 + "  ".join(f"{stage}={ms}ms" for stage, ms in r["stages"].items()))
+    memory = report.get("memory")
+    if memory:
+        line = f"RSS: {memory['rss_per_1k_sessions_mb']} MB / 1k sessions ({memory['sessions']} sessions)"
+        base_memory = (baseline or {}).get("memory")
+        if base_memory:
+            line += f" Δ{memory['rss_per_1k_sessions_mb'] - base_memory['rss_per_1k_sessions_mb']:+.2f}"
+        print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="/chat 端到端压测")
+    parser.add_argument("--latency", default="fixed:0.2",
+                        help="模拟LLM延迟分布：fixed:秒 / lognormal:中位数,sigma / pareto:最小值,alpha")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟LLM调用失败概率")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子（延迟与错误序列可复现）")
+    parser.add_argument("--concurrency", default="1,8,32", help="并发档位，逗号分隔")
+    parser.add_argument("--requests", type=int, default=100, help="每个模式、每个并发档位的请求数")
+    parser.add_argument("--modes", default="", help="压测的模式，逗号分隔（默认正常聊天+全部海王模式）")
+    parser.add_argument("--turns", type=int, default=4, help="海王模式每个会话连续对战的轮数")
+    parser.add_argument("--sessions", type=int, default=1000, help="内存测量新建的会话数，0为跳过")
+    parser.add_argument("--output", default="load_test_results.json", help="JSON结果文件")
+    parser.add_argument("--compare", help="用于对比的历史结果JSON")
+    args = parser.parse_args()
+
+    # 必须在导入应用之前设置（配置在模块导入时读取）
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = args.latency
+    os.environ["FAKE_LLM_ERROR_RATE"] = str(args.error_rate)
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+
+    import httpx
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+    from src.core import metrics
+    from src.core.app_config import AppConfig
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()] or [NORMAL_MODE] + AppConfig.SEAKING_MODES
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+
+    results = []
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=120) as client:
+        for mode_id, mode in enumerate(modes):
+            route = "normal" if mode == NORMAL_MODE else mode
+            for concurrency in levels:
+                before = metrics.STAGE_SECONDS.collect()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = await run_level(client, mode, mode_id, concurrency, args.requests, args.turns)
+                result["stages"] = stage_breakdown(before, metrics.STAGE_SECONDS.collect(), route)
+                results.append(result)
+
+        memory = None
+        if args.sessions:
+            with contextlib.redirect_stdout(io.StringIO()):
+                memory = await measure_session_memory(client, args.sessions, max(levels))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+            "requests_per_level": args.requests,
+            "seaking_turns": args.turns,
+            "memory_storage": AppConfig.MEMORY_STORAGE_TYPE,
+        },
+        "results": results,
+        "memory": memory,
+    }
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
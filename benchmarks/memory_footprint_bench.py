@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每会话记忆占用对比
+
+原实现：短期记忆为ConversationBufferWindowMemory默认的消息列表，窗口缩到下限(4)后
+不再重建memory实例，chat_memory.messages随对话持续增长（k只限制读取条数）；
+长期记忆列表在压缩时按切片截断。
+新实现：环形缓冲区中固定容量的__slots__消息记录 + 定长deque。
+
+用tracemalloc统计构造 sessions 个会话、每个会话写入 turns 轮对话后的内存增量。
+
+用法:
+    python benchmarks/memory_footprint_bench.py --sessions 200 --turns 10,50,200
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENAI_MODEL", "bench-model")
+
+from langchain.memory import ConversationBufferWindowMemory
+
+from src.memory.memory_manager import SmartMemoryManager
+
+USER_TEXT = "他今天又没回我消息，我是不是想太多了？昨天还给他转了520 red packet，他说下个月还我"
+AI_TEXT = "姐妹，已读不回就是答案，别再给自己加戏了。钱的事先停一停，看清楚再说。"
+
+
+def legacy_session(turns: int):
+    """原实现的数据结构：窗口下限后消息列表只增不减，长期记忆按切片截断"""
+    memory = ConversationBufferWindowMemory(
+        memory_key="chat_history",
+        return_messages=True,
+        k=4,
+        ai_prefix="拽姐",
+        human_prefix="用户",
+        output_key="output"
+    )
+    long_term_memory = {
+        "user_patterns": {},
+        "risk_history": [],
+        "key_insights": [],
+        "persona_preferences": {},
+        "compressed_summaries": []
+    }
+    for i in range(turns):
+        memory.save_context({"input": f"{USER_TEXT}{i}"}, {"output": AI_TEXT})
+        long_term_memory["risk_history"].append({"round": i + 1, "level": "重", "signals": ["大额转账"]})
+        long_term_memory["key_insights"].append(f"第{i + 1}轮：重级风险 - {USER_TEXT[:50]}...")
+        long_term_memory["compressed_summaries"].append({"round": i + 1, "summary": f"用户: {USER_TEXT[:50]}...", "window_size": 4})
+        long_term_memory["risk_history"] = long_term_memory["risk_history"][-20:]
+        long_term_memory["key_insights"] = long_term_memory["key_insights"][-10:]
+        long_term_memory["compressed_summaries"] = long_term_memory["compressed_summaries"][-5:]
+    return memory, long_term_memory
+
+
+def ring_session(turns: int) -> SmartMemoryManager:
+    """新实现：SmartMemoryManager完整写入流程（含压缩）"""
+    manager = SmartMemoryManager()
+    for i in range(turns):
+        manager.add_interaction(f"{USER_TEXT}{i}", AI_TEXT, love_brain_level="重", risk_signals=["大额转账"])
+    return manager
+
+
+def measure(build, sessions: int, turns: int):
+    """返回每会话占用的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        kept = [build(turns) for _ in range(sessions)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="每会话记忆占用对比")
+    parser.add_argument("--sessions", type=int, default=200, help="会话数")
+    parser.add_argument("--turns", default="10,50,200", help="每个会话的对话轮数，逗号分隔")
+    args = parser.parse_args()
+
+    print(f"sessions={args.sessions}")
+    print(f"{'turns':>6} {'legacy(KB)':>12} {'ring(KB)':>10} {'ratio':>7}")
+    for turns in [int(x) for x in args.turns.split(",") if x.strip()]:
+        legacy_bytes = measure(legacy_session, args.sessions, turns)
+        ring_bytes = measure(ring_session, args.sessions, turns)
+        print(f"{turns:>6} {legacy_bytes / 1024:>12.1f} {ring_bytes / 1024:>10.1f} {legacy_bytes / ring_bytes:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
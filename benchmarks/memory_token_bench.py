@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SmartMemoryManager token统计基准
+
+对比原实现（每次统计都用三个正则重新扫描全部短期记忆消息，并重新序列化
+长期记忆）与增量统计（每条消息只计算一次，维护累计值）在长历史下的耗时：
+- estimate: 一次 _estimate_token_count（get_memory_stats 与压缩检查都会调用）
+- add_interaction: 一轮完整的对话写入（包含压缩检查）
+
+用法:
+    python benchmarks/memory_token_bench.py --messages 1000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENAI_MODEL", "bench-model")
+
+from langchain.schema import AIMessage, HumanMessage
+
+from src.memory.memory_manager import SmartMemoryManager
+
+USER_TEXT = "他今天又没回我消息，我是不是想太多了？昨天还给他转了520 red packet..."
+AI_TEXT = "姐妹，已读不回就是答案，别再给自己加戏了。Stop it!"
+
+
+def legacy_count_tokens(text: str) -> int:
+    """原实现：三次re.findall"""
+    if not text:
+        return 0
+    chinese_chars = len(re.findall(r'[一-鿿　-〿＀-￯]', text))
+    english_chars = len(re.findall(r'[a-zA-Z0-9]', text))
+    spaces_punct = len(re.findall(r'[\s\.,!?;:()\[\]{}"\'-]', text))
+    return int(chinese_chars / 1.5) + int(english_chars / 4) + spaces_punct
+
+
+def legacy_estimate(manager: SmartMemoryManager) -> int:
+    """原实现：每次全量扫描短期记忆 + 重新序列化长期记忆"""
+    total = 0
+    for msg in manager.memory.chat_memory.messages:
+        if hasattr(msg, 'content'):
+            total += legacy_count_tokens(str(msg.content))
+
+    memory = manager.long_term_memory
+    if memory["user_patterns"]:
+        total += legacy_count_tokens(json.dumps(memory["user_patterns"], ensure_ascii=False))
+    if memory["risk_history"]:
+        total += legacy_count_tokens(json.dumps(list(memory["risk_history"])[-5:], ensure_ascii=False))
+    if memory["key_insights"]:
+        total += legacy_count_tokens(" ".join(list(memory["key_insights"])[-3:]))
+    if memory["compressed_summaries"]:
+        total += legacy_count_tokens(" ".join(s["summary"] for s in list(memory["compressed_summaries"])[-2:]))
+    return total
+
+
+def build_manager(messages: int, legacy: bool) -> SmartMemoryManager:
+    """构造一个短期记忆中已有messages条消息的管理器"""
+    manager = SmartMemoryManager()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(3):
+            manager.add_interaction(USER_TEXT, AI_TEXT, love_brain_level="中", risk_signals=["情绪焦虑"])
+    # 窗口已缩到下限，环形缓冲区只保留最近4轮消息
+    manager.current_window_size = 4
+    for i in range(messages // 2):
+        manager.memory.chat_memory.add_message(HumanMessage(content=f"{USER_TEXT}{i}"))
+        manager.memory.chat_memory.add_message(AIMessage(content=AI_TEXT))
+    if legacy:
+        manager._estimate_token_count = lambda: legacy_estimate(manager)
+    return manager
+
+
+def timeit(func, rounds: int) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(rounds):
+            func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartMemoryManager token统计基准")
+    parser.add_argument("--messages", type=int, default=1000, help="短期记忆中的消息数")
+    parser.add_argument("--rounds", type=int, default=200, help="每项计时的重复次数")
+    args = parser.parse_args()
+
+    legacy = build_manager(args.messages, legacy=True)
+    incremental = build_manager(args.messages, legacy=False)
+    assert legacy_estimate(incremental) == incremental._estimate_token_count()
+
+    results = [
+        ("estimate", timeit(legacy._estimate_token_count, args.rounds),
+         timeit(incremental._estimate_token_count, args.rounds)),
+        ("add_interaction",
+         timeit(lambda: legacy.add_interaction(USER_TEXT, AI_TEXT, "中", ["情绪焦虑"]), args.rounds),
+         timeit(lambda: incremental.add_interaction(USER_TEXT, AI_TEXT, "中", ["情绪焦虑"]), args.rounds)),
+    ]
+    assert legacy_estimate(incremental) == incremental._estimate_token_count()
+
+    print(f"messages={args.messages} rounds={args.rounds}")
+    print(f"{'operation':>16} {'legacy(us)':>12} {'incremental(us)':>16} {'speedup':>8}")
+    for name, old, new in results:
+        print(f"{name:>16} {old:>12.1f} {new:>16.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RedisMemoryManager.add_interaction 往返次数与延迟基准
+
+对比原实现（HINCRBY、LPUSH/LTRIM、逐模式HINCRBY、5次EXPIRE逐条发送）
+与Lua脚本一次往返写入，统计每轮对话的网络往返次数和耗时。
+需要本地可访问的 redis-server（按 REDIS_HOST/REDIS_PORT/REDIS_DB 连接），
+测试数据写在 bench: 前缀下，结束后删除。
+
+用法:
+    redis-server --daemonize yes
+    python benchmarks/redis_memory_bench.py --turns 500
+    # 模拟跨机房网络延迟（每次往返额外等待）
+    python benchmarks/redis_memory_bench.py --turns 200 --simulated-rtt-ms 1
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENAI_MODEL", "bench-model")
+
+import redis
+
+from src.memory.redis_memory_manager import RedisMemoryManager
+
+TURNS = [
+    ("他让我给他转账两万块，说下个月还", "重", ["大额转账"]),
+    ("他一直不回我消息，我整天焦虑失眠", "危", ["情绪依赖", "失眠"]),
+    ("今天又想他了", "轻", ["情绪焦虑"]),
+]
+
+
+class CountingConnection(redis.Connection):
+    """统计网络往返次数（每次发送一个打包的命令/管道即一次往返）"""
+
+    round_trips = 0
+    simulated_rtt = 0.0
+
+    def send_packed_command(self, command, check_health=True):
+        CountingConnection.round_trips += 1
+        if CountingConnection.simulated_rtt:
+            time.sleep(CountingConnection.simulated_rtt)
+        return super().send_packed_command(command, check_health)
+
+
+def legacy_add_interaction(manager: RedisMemoryManager, user_input: str, ai_response: str,
+                           love_brain_level: str, risk_signals: list):
+    """原实现：逐条发送命令"""
+    client = manager.redis_client
+    prefix = manager.key_prefix
+    round_num = client.hincrby(f"{prefix}:metadata", "conversation_count", 1)
+    manager.memory.save_context({"input": user_input}, {"output": ai_response})
+
+    if love_brain_level in ["重", "危"]:
+        for pattern in manager._detect_patterns(user_input):
+            client.hincrby(f"{prefix}:user_patterns", pattern, 1)
+
+    if love_brain_level:
+        record = {
+            "round": round_num,
+            "level": love_brain_level,
+            "timestamp": datetime.now().isoformat(),
+            "signals": risk_signals or [],
+            "input_preview": user_input[:100]
+        }
+        client.lpush(f"{prefix}:risk_history", json.dumps(record, ensure_ascii=False))
+        client.ltrim(f"{prefix}:risk_history", 0, 49)
+
+    if love_brain_level in ["重", "危"]:
+        insight = {
+            "round": round_num,
+            "level": love_brain_level,
+            "content": f"第{round_num}轮：{love_brain_level}级风险 - {user_input[:50]}...",
+            "timestamp": datetime.now().isoformat()
+        }
+        client.lpush(f"{prefix}:key_insights", json.dumps(insight, ensure_ascii=False))
+        client.ltrim(f"{prefix}:key_insights", 0, 19)
+
+    for key in manager._memory_keys():
+        client.expire(key, manager.memory_ttl)
+
+
+def run(manager: RedisMemoryManager, turns: int, add) -> dict:
+    latencies = []
+    CountingConnection.round_trips = 0
+    for i in range(turns):
+        user_input, level, signals = TURNS[i % len(TURNS)]
+        start = time.perf_counter()
+        add(manager, user_input, "姐觉得你该清醒了", level, signals)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "round_trips_per_turn": CountingConnection.round_trips / turns,
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RedisMemoryManager.add_interaction 往返基准")
+    parser.add_argument("--turns", type=int, default=500, help="每种实现写入的对话轮数")
+    parser.add_argument("--simulated-rtt-ms", type=float, default=0.0, help="每次往返额外模拟的网络延迟（毫秒）")
+    args = parser.parse_args()
+
+    client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        password=os.getenv("REDIS_PASSWORD"),
+        decode_responses=True,
+        connection_class=CountingConnection,
+    )
+    try:
+        client.ping()
+    except redis.RedisError as e:
+        print(f"[Error] 无法连接Redis，请先启动本地redis-server: {e}")
+        sys.exit(1)
+
+    legacy = RedisMemoryManager(user_id="bench:legacy", redis_client=client)
+    scripted = RedisMemoryManager(user_id="bench:scripted", redis_client=client)
+    # 预热：加载Lua脚本并建立连接
+    scripted.add_interaction("预热", "ok", "轻", [])
+
+    CountingConnection.simulated_rtt = args.simulated_rtt_ms / 1000
+    results = {
+        "legacy": run(legacy, args.turns, legacy_add_interaction),
+        "lua_script": run(scripted, args.turns, RedisMemoryManager.add_interaction),
+    }
+    CountingConnection.simulated_rtt = 0.0
+
+    # 两种实现写入的数据结构应一致
+    legacy_data = legacy.export_memory_from_redis()
+    scripted_data = scripted.export_memory_from_redis()
+    assert legacy_data["user_patterns"] == scripted_data["user_patterns"]
+    assert len(legacy_data["risk_history"]) == len(scripted_data["risk_history"])
+    assert [r["round"] for r in legacy_data["key_insights"]] == [r["round"] - 1 for r in scripted_data["key_insights"]]
+
+    legacy.clear_all_memory()
+    scripted.clear_all_memory()
+
+    print(f"turns={args.turns} simulated_rtt={args.simulated_rtt_ms}ms")
+    print(f"{'implementation':>16} {'round_trips':>12} {'mean(ms)':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for name, r in results.items():
+        print(f"{name:>16} {r['round_trips_per_turn']:>12.1f} {r['mean_ms']:>10.3f} "
+              f"{r['p50_ms']:>10.3f} {r['p99_ms']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+直连路由兜底校验
+
+severity分析失败（LLM报错或返回无法解析的JSON）时得到的是关键词兜底结果，置信度可能高于
+CHAT_ROUTER_MIN_CONFIDENCE。这里用模拟LLM后端逐条走同步、异步、微批三种分析路径，
+校验兜底结果在 direct 模式下一律交给Agent，而LLM正常解析的闲聊结果仍直连闲聊prompt。
+
+用法:
+    python benchmarks/router_check.py
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY", "fixed:0")
+
+from langchain_core.messages import AIMessage
+
+from src.core.chat_router import ROUTE_AGENT, ROUTE_TALK, DirectChatRouter
+from src.core.severity_analyzer import SeverityAnalyzer
+from src.core.severity_batcher import SeverityBatcher
+
+MESSAGES = [
+    "",
+    "今天天气不错",
+    "我真的不想活了，想死",
+    "他让我先转账两万，说下个月还",
+]
+
+
+class ScriptedLLM:
+    """按固定内容回复或抛出异常的LLM"""
+
+    def __init__(self, content: str = "", error: bool = False):
+        self.content = content
+        self.error = error
+
+    def _reply(self):
+        if self.error:
+            raise RuntimeError("模拟LLM调用失败")
+        return AIMessage(content=self.content)
+
+    def invoke(self, prompt, **kwargs):
+        return self._reply()
+
+    async def ainvoke(self, prompt, **kwargs):
+        return self._reply()
+
+
+def make_analyzer(scripted: ScriptedLLM, batched: bool = False) -> SeverityAnalyzer:
+    analyzer = SeverityAnalyzer()
+    analyzer.llm = scripted
+    analyzer.cache = None
+    analyzer.batcher = SeverityBatcher(analyzer) if batched else None
+    return analyzer
+
+
+async def analyze_all(analyzer: SeverityAnalyzer, text: str):
+    yield "sync", analyzer.analyze(text)
+    yield "async", await analyzer.analyze_async(text)
+
+
+async def check_fallbacks(router: DirectChatRouter) -> int:
+    cases = {
+        "parse_error": ScriptedLLM("抱歉，我无法给出JSON"),
+        "llm_error": ScriptedLLM(error=True),
+    }
+    checked = 0
+    for reason, scripted in cases.items():
+        for batched in (False, True):
+            analyzer = make_analyzer(scripted, batched)
+            for text in MESSAGES:
+                async for path, result in analyze_all(analyzer, text):
+                    if batched and path == "sync":
+                        continue
+                    label = f"{reason}/{'batched' if batched else path}/{text!r}"
+                    assert result.fallback, f"{label}: 未标记为兜底结果"
+                    route = router.route(analyzer._compose_style_result(result))
+                    assert route == ROUTE_AGENT, f"{label}: 兜底结果被路由到 {route}"
+                    checked += 1
+    return checked
+
+
+def check_parsed_talk(router: DirectChatRouter):
+    """LLM正常解析的闲聊结果不受影响"""
+    analyzer = make_analyzer(ScriptedLLM('{"index": 0, "level": "无", "signals": [], "switch_to_help": false}'))
+    result = analyzer.analyze("今天天气不错")
+    assert not result.fallback
+    route = router.route(analyzer._compose_style_result(result))
+    assert route == ROUTE_TALK, f"正常解析的闲聊结果被路由到 {route}"
+
+
+async def main():
+    analyzer = make_analyzer(ScriptedLLM())
+    style_prompts = {level: analyzer.build_style_prompt(style) for level, style in analyzer.answerstyle.items()}
+    router = DirectChatRouter(style_prompts, mode="direct")
+
+    checked = await check_fallbacks(router)
+    check_parsed_talk(router)
+    print(f"OK: {checked} 条兜底结果全部交给Agent，正常解析的闲聊结果直连闲聊prompt")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,5 @@
 # Core module - 核心架构模块
-from .agent import build_agent, get_memory_manager, reset_memory
+from .agent import build_agent, get_memory_manager, reset_memory, LevelAgentCache, ainvoke_with_memory, astream_with_memory
 from .config import llm
 
-__all__ = ['build_agent', 'get_memory_manager', 'reset_memory', 'llm']
+__all__ = ['build_agent', 'get_memory_manager', 'reset_memory', 'LevelAgentCache', 'ainvoke_with_memory', 'astream_with_memory', 'llm']
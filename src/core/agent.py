@@ -1,13 +1,18 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import BaseMessage
 
 from ..prompts.prompts import GLOBAL_SYSTEM_PROMPT
 from .config import llm
+from .log import get_logger
 from ..memory.memory_manager import SmartMemoryManager
 # from ..tools.severity import SeverityTool  # 已移除：现在在app.py中直接进行预分析 
 
 from ..tools.talk import TalkTool
 
+logger = get_logger("agent")
 
 
 # 全局记忆管理器实例（用于向后兼容）
@@ -47,7 +52,7 @@ def build_agent(memory_manager=None, answer_style: str = "") -> AgentExecutor:
         agent=agent, 
         tools=tools, 
         memory=memory_manager.memory,  # 直接使用传入的记忆实例
-        verbose=True,  # 启用调试信息
+        verbose=False,  # 调试信息走日志模块，不同步打印到stdout
         return_intermediate_steps=True,  # 返回中间步骤
         handle_parsing_errors=True,  # 处理解析错误
         max_iterations=3,  # 减少最大迭代次数
@@ -56,15 +61,131 @@ def build_agent(memory_manager=None, answer_style: str = "") -> AgentExecutor:
     
     # 验证记忆绑定是否成功（调试用）- 使用type检查而不是is检查
     if type(executor.memory) != type(memory_manager.memory):
-        print(f"⚠️ 警告：Agent记忆类型不匹配，将强制设置")
+        logger.warning("Agent记忆类型不匹配，将强制设置")
         executor.memory = memory_manager.memory
     elif hasattr(executor.memory, 'memory_key') and hasattr(memory_manager.memory, 'memory_key'):
         if executor.memory.memory_key != memory_manager.memory.memory_key:
-            print(f"⚠️ 警告：Agent记忆配置不匹配，将强制设置")
+            logger.warning("Agent记忆配置不匹配，将强制设置")
             executor.memory = memory_manager.memory
         
     return executor
 
+# 流式输出时用于识别Agent主LLM调用的标签
+AGENT_LLM_TAG = "agent_llm"
+
+class LevelAgentCache:
+    """按恋爱脑级别预编译的Agent缓存
+
+    人设模板只有少数几个级别，每个级别的system prompt、工具和openai-tools
+    Agent在启动时编译一次；每轮变化的用户状态通过 {severity_state} 变量注入，
+    会话记忆在调用时绑定，不再为每条消息重建AgentExecutor。
+    """
+
+    def __init__(self, style_prompts: Dict[str, str], default_level: str = "轻"):
+        """
+        Args:
+            style_prompts: 级别 -> 该级别固定的人设prompt片段
+            default_level: 未知级别时使用的默认级别
+        """
+        self.default_level = default_level
+        self.tools = [TalkTool()]
+        self.executors: Dict[str, AgentExecutor] = {
+            level: self._compile(style_prompt)
+            for level, style_prompt in style_prompts.items()
+        }
+
+    def _compile(self, style_prompt: str) -> AgentExecutor:
+        """编译单个级别的Agent（不绑定记忆）"""
+        # 固定人设直接展开进system prompt，每轮变化的用户状态保留为模板变量
+        enhanced_system_prompt = GLOBAL_SYSTEM_PROMPT.format(
+            answer_style=style_prompt + "{severity_state}"
+        )
+        
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", enhanced_system_prompt),
+            MessagesPlaceholder("chat_history"),
+            ("human", "{input}"),
+            MessagesPlaceholder("agent_scratchpad"),
+        ])
+
+        # 打标签以便流式输出时只转发Agent自身的token（不含工具内部的LLM调用）
+        agent_llm = llm(temperature=0.1).with_config(tags=[AGENT_LLM_TAG])
+        agent = create_openai_tools_agent(agent_llm, self.tools, prompt)
+        
+        return AgentExecutor(
+            agent=agent,
+            tools=self.tools,
+            verbose=False,  # 调试信息走日志模块，不同步打印到stdout
+            return_intermediate_steps=True,  # 返回中间步骤
+            handle_parsing_errors=True,  # 处理解析错误
+            max_iterations=3,  # 减少最大迭代次数
+            early_stopping_method="generate"  # 使用生成停止方法
+        )
+
+    def get(self, level: str) -> AgentExecutor:
+        """获取指定级别的预编译Agent"""
+        return self.executors.get(level) or self.executors[self.default_level]
+
+def load_chat_history(memory_manager) -> List[BaseMessage]:
+    """读取会话记忆窗口中的历史消息"""
+    memory = memory_manager.memory
+    return memory.load_memory_variables({})[memory.memory_key]
+
+async def ainvoke_with_memory(executor: AgentExecutor, memory_manager, agent_input: str, severity_state: str = "",
+                              callbacks: Optional[List[Any]] = None,
+                              chat_history: Optional[List[BaseMessage]] = None) -> Dict[str, Any]:
+    """
+    执行预编译Agent，调用时绑定会话记忆
+    
+    本轮对话由调用方通过 memory_manager.add_interaction 写回记忆（只写一次，不含记忆上下文包装）。
+    
+    Args:
+        executor: 预编译的Agent（不含记忆）
+        memory_manager: 当前会话的记忆管理器
+        agent_input: 传给Agent的输入
+        severity_state: 当前用户状态prompt片段
+        callbacks: 本次调用附加的回调（如统计LLM调用次数）
+        chat_history: 已组装好的历史消息，未提供时读取记忆窗口
+    """
+    if chat_history is None:
+        chat_history = load_chat_history(memory_manager)
+    
+    return await executor.ainvoke({
+        "input": agent_input,
+        "severity_state": severity_state,
+        "chat_history": chat_history,
+    }, config={"callbacks": callbacks or []})
+
+async def astream_with_memory(executor: AgentExecutor, memory_manager, agent_input: str, severity_state: str = "",
+                              callbacks: Optional[List[Any]] = None,
+                              chat_history: Optional[List[BaseMessage]] = None) -> AsyncIterator[Tuple[str, str]]:
+    """
+    流式执行预编译Agent，调用时绑定会话记忆
+    
+    依次产出 ("token", 文本片段)，结束时产出一次 ("output", 最终回复)；参数与 ainvoke_with_memory 相同。
+    """
+    if chat_history is None:
+        chat_history = load_chat_history(memory_manager)
+    
+    root_run_id = None
+    output = ""
+    async for event in executor.astream_events({
+        "input": agent_input,
+        "severity_state": severity_state,
+        "chat_history": chat_history,
+    }, config={"callbacks": callbacks or []}, version="v2"):
+        if root_run_id is None:
+            root_run_id = event["run_id"]
+        
+        if event["event"] == "on_chat_model_stream" and AGENT_LLM_TAG in event.get("tags", []):
+            content = event["data"]["chunk"].content
+            if content:
+                yield "token", content
+        elif event["event"] == "on_chain_end" and event["run_id"] == root_run_id:
+            output = event["data"]["output"].get("output", "")
+    
+    yield "output", output
+
 def get_memory_manager() -> SmartMemoryManager:
     """获取全局记忆管理器实例"""
     return smart_memory
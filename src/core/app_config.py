@@ -2,9 +2,13 @@
 应用配置管理模块
 """
 import os
-import json
 from typing import Dict, List, Any
 
+from .log import get_logger
+from .persona_catalog import persona_catalog
+
+logger = get_logger("config")
+
 
 class AppConfig:
     """应用配置管理类"""
@@ -18,12 +22,14 @@ class AppConfig:
     
     # Session配置
     SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "7"))  # Session过期天数
+    SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))  # 最大会话数，超出后淘汰最久未访问的会话
+    SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # 过期清理间隔（秒）
     
     # 环境检测
     IS_DEVELOPMENT = os.getenv("RAILWAY_ENVIRONMENT") is None and os.getenv("PORT") is None
     
-    # LangSmith 配置
-    LANGCHAIN_TRACING_V2 = "true"
+    # LangSmith 配置（模拟LLM后端用于离线压测，不上报追踪）
+    LANGCHAIN_TRACING_V2 = "false" if os.getenv("LLM_BACKEND", "openai").lower() == "fake" else "true"
     LANGCHAIN_ENDPOINT = "https://api.smith.langchain.com"
     LANGCHAIN_PROJECT = "anti-love-test"
     
@@ -36,14 +42,8 @@ class AppConfig:
     
     @classmethod
     def load_personas(cls) -> Dict[str, Any]:
-        """加载海王人设配置"""
-        try:
-            personas_file = os.path.join("static", "personas.json")
-            with open(personas_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"[Error] Failed to load personas: {e}")
-            return {}
+        """加载海王人设配置（来自进程内人设库，文件更新后自动重新加载）"""
+        return persona_catalog.get_data()
     
     @classmethod
     def is_seaking_mode(cls, button_type: str) -> bool:
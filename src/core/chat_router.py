@@ -0,0 +1,164 @@
+"""
+正常聊天的直连路由 - 按severity级别直接选择prompt，一次LLM生成出回复
+
+openai-tools Agent模式下一轮正常聊天最多串行3次LLM调用：severity分析 -> Agent决策 ->
+TalkTool内部生成（工具结果再交回Agent）。severity级别已经给出了该走哪条路：
+
+- talk：级别为"无"，即 talk_tool 描述里的非恋爱日常闲聊，直接用闲聊prompt生成
+- persona：轻/中/重/危，直接用该级别的人设system prompt生成（不绑定工具）
+- agent：severity是LLM分析失败后的关键词兜底结果，或置信度不足时，级别不足以判断路径，
+  仍交给Agent决定是否调用工具（兜底结果无论置信度高低都不直连，避免危机消息分析失败后
+  被当作闲聊回复）
+
+CHAT_ROUTER_MODE=agent 时所有消息仍走Agent，便于对照两种模式的LLM调用次数与耗时。
+"""
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import BaseMessage
+
+from ..prompts.prompts import GLOBAL_SYSTEM_PROMPT, TALK_INNER_GUIDE
+from ..prompts.prompt_config import TALK_EXECUTION_PROMPT
+from .config import llm
+from .metrics import CHAT_TURN_LLM_CALLS, CHAT_TURN_SECONDS
+
+# 路由配置
+CHAT_ROUTER_MODE = os.getenv("CHAT_ROUTER_MODE", "agent").lower()  # agent / direct
+CHAT_ROUTER_MIN_CONFIDENCE = float(os.getenv("CHAT_ROUTER_MIN_CONFIDENCE", "0.7"))
+
+ROUTE_AGENT = "agent"
+ROUTE_TALK = "talk"
+ROUTE_PERSONA = "persona"
+ROUTES = (ROUTE_AGENT, ROUTE_TALK, ROUTE_PERSONA)
+
+# 与 talk_tool 的使用条件一致：非恋爱话题的日常闲聊走闲聊prompt
+TALK_LEVEL = "无"
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """统计单轮对话内发起的LLM调用次数（含工具内部的调用）"""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.calls += 1
+
+
+class DirectChatRouter:
+    """按severity级别直连单次LLM生成的路由器
+
+    各级别的人设prompt与闲聊prompt在启动时编译一次；历史消息在调用时传入，
+    与 ainvoke_with_memory 一样由调用方通过 add_interaction 写回记忆。
+    """
+
+    def __init__(self, style_prompts: Dict[str, str], default_level: str = "轻",
+                 mode: str = CHAT_ROUTER_MODE, min_confidence: float = CHAT_ROUTER_MIN_CONFIDENCE):
+        """
+        Args:
+            style_prompts: 级别 -> 该级别固定的人设prompt片段（与LevelAgentCache相同）
+            default_level: 未知级别时使用的默认级别
+            mode: direct 启用直连路由，其他值全部走Agent
+            min_confidence: severity置信度低于该值时交给Agent（关键词兜底结果始终交给Agent）
+        """
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.default_level = default_level
+        self.chains = {level: self._compile_persona(style_prompt) for level, style_prompt in style_prompts.items()}
+        self.talk_chain = self._compile_talk()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode == "direct"
+
+    @staticmethod
+    def _compile_persona(style_prompt: str):
+        """单个级别的人设prompt（与Agent同一份system prompt，但不绑定工具，一次生成即为最终回复）"""
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", GLOBAL_SYSTEM_PROMPT.format(answer_style=style_prompt + "{severity_state}")),
+            MessagesPlaceholder("chat_history"),
+            ("human", "{input}"),
+        ])
+        return prompt | llm(temperature=0.1)
+
+    @staticmethod
+    def _compile_talk():
+        """闲聊prompt（TalkTool同款），附带会话历史"""
+        talk_prompt = TALK_EXECUTION_PROMPT.replace("{talk_guide}", TALK_INNER_GUIDE.replace("{", "{{").replace("}", "}}"))
+        prompt = ChatPromptTemplate.from_messages([
+            MessagesPlaceholder("chat_history"),
+            ("human", talk_prompt),
+        ])
+        return prompt | llm(temperature=0.1)
+
+    def route(self, analysis_result: Dict[str, Any]) -> str:
+        """根据severity分析结果选择路径"""
+        if not self.enabled:
+            return ROUTE_AGENT
+        severity = analysis_result["severity"]
+        if severity.get("fallback") or severity.get("confidence", 0.0) < self.min_confidence:
+            return ROUTE_AGENT
+        return ROUTE_TALK if severity.get("level") == TALK_LEVEL else ROUTE_PERSONA
+
+    @staticmethod
+    def _inputs(route: str, chat_history: List[BaseMessage], agent_input: str, user_text: str, severity_state: str) -> Dict[str, Any]:
+        if route == ROUTE_TALK:
+            return {"user_text": user_text, "chat_history": chat_history}
+        return {"input": agent_input, "severity_state": severity_state, "chat_history": chat_history}
+
+    def _chain(self, route: str, style_level: str):
+        if route == ROUTE_TALK:
+            return self.talk_chain
+        return self.chains.get(style_level) or self.chains[self.default_level]
+
+    async def ainvoke(self, route: str, chat_history: List[BaseMessage], agent_input: str, user_text: str,
+                      style_level: str, severity_state: str = "", callbacks: Optional[List[Any]] = None) -> str:
+        """直连路径单次生成，返回最终回复"""
+        result = await self._chain(route, style_level).ainvoke(
+            self._inputs(route, chat_history, agent_input, user_text, severity_state),
+            config={"callbacks": callbacks or []}
+        )
+        return result.content if hasattr(result, "content") else str(result)
+
+    async def astream(self, route: str, chat_history: List[BaseMessage], agent_input: str, user_text: str,
+                      style_level: str, severity_state: str = "",
+                      callbacks: Optional[List[Any]] = None) -> AsyncIterator[Tuple[str, str]]:
+        """直连路径流式生成，产出格式与 astream_with_memory 相同：("token", 片段)... ("output", 最终回复)"""
+        chunks = []
+        async for chunk in self._chain(route, style_level).astream(
+            self._inputs(route, chat_history, agent_input, user_text, severity_state),
+            config={"callbacks": callbacks or []}
+        ):
+            content = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if content:
+                chunks.append(content)
+                yield "token", content
+        yield "output", "".join(chunks)
+
+    def record(self, route: str, llm_calls: int, seconds: float):
+        """记录一轮对话的路径、生成阶段LLM调用次数与总耗时"""
+        CHAT_TURN_LLM_CALLS.inc(llm_calls, path=route)
+        CHAT_TURN_SECONDS.observe(seconds, path=route)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各路径的轮数、每轮平均LLM调用次数与平均耗时"""
+        turns = CHAT_TURN_SECONDS.collect()
+        paths = {}
+        for route in ROUTES:
+            data = turns.get((route,), {"count": 0, "sum": 0.0})
+            count = data["count"]
+            llm_calls = CHAT_TURN_LLM_CALLS.get(path=route)
+            paths[route] = {
+                "turns": count,
+                "llm_calls": llm_calls,
+                "avg_llm_calls": round(llm_calls / count, 2) if count else 0.0,
+                "avg_total_ms": round(data["sum"] / count * 1000, 1) if count else 0.0,
+            }
+        return {"mode": self.mode, "min_confidence": self.min_confidence, "paths": paths}
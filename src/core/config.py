@@ -1,18 +1,191 @@
 import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
 from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 
+from .fake_llm import FakeChatModel, get_default_profile
+from .metrics import LLM_CALLS, LLM_FAILURES
+
 load_dotenv()
 
 BASE_URL = os.getenv("OPENAI_BASE_URL")
 MODEL = os.getenv("OPENAI_MODEL")
 
+# LLM后端："openai"（默认，调用OPENAI_BASE_URL）或 "fake"（进程内模拟模型，见 fake_llm.py）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+
+# LLM HTTP连接池配置
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+
+class ConnectionStats:
+    """LLM HTTP连接计数器 - 通过httpcore的trace扩展统计新建连接数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def _record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def _record_open(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def _trace(self, event_name: str, info: Dict[str, Any]):
+        if event_name == "connection.connect_tcp.complete":
+            self._record_open()
+
+    async def _atrace(self, event_name: str, info: Dict[str, Any]):
+        self._trace(event_name, info)
+
+    def on_request(self, request: httpx.Request):
+        """同步客户端请求钩子"""
+        self._record_request()
+        request.extensions["trace"] = self._trace
+
+    async def on_request_async(self, request: httpx.Request):
+        """异步客户端请求钩子"""
+        self._record_request()
+        request.extensions["trace"] = self._atrace
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": max(0, self.requests - self.connections_opened),
+            }
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """统计LLM调用次数与失败次数（同步执行，不经过线程池）"""
+
+    run_inline = True
+
+    def __init__(self, model: Optional[str]):
+        self.model = model or "unknown"
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        LLM_CALLS.inc(model=self.model)
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        LLM_CALLS.inc(model=self.model)
+
+    def on_llm_error(self, error, **kwargs):
+        LLM_FAILURES.inc(model=self.model)
+
+
+class LLMClientRegistry:
+    """进程级LLM客户端注册表 - 按(model, temperature, base_url)复用ChatOpenAI实例
+
+    同一base_url下的所有模型实例共享一对keep-alive连接池（同步/异步各一个），
+    避免每次调用都重新建立TCP/TLS连接。
+    """
+
+    def __init__(self,
+                 backend: str = LLM_BACKEND,
+                 max_connections: int = LLM_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.backend = backend
+        self.stats = ConnectionStats()
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[Optional[str], float, Optional[str]], BaseChatModel] = {}
+        self._http_clients: Dict[Optional[str], Tuple[httpx.Client, httpx.AsyncClient]] = {}
+
+    def _get_http_clients(self, base_url: Optional[str]) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """获取（或创建）指定base_url的共享HTTP客户端，调用方需持有锁"""
+        clients = self._http_clients.get(base_url)
+        if clients is None:
+            timeout = httpx.Timeout(60.0, connect=10.0)
+            clients = (
+                httpx.Client(limits=self.limits, timeout=timeout,
+                             event_hooks={"request": [self.stats.on_request]}),
+                httpx.AsyncClient(limits=self.limits, timeout=timeout,
+                                  event_hooks={"request": [self.stats.on_request_async]}),
+            )
+            self._http_clients[base_url] = clients
+        return clients
+
+    def get(self, temperature: float = 0, model: Optional[str] = None,
+            base_url: Optional[str] = None) -> BaseChatModel:
+        """获取共享的ChatOpenAI实例（fake后端时为模拟模型）"""
+        model = model or MODEL
+        base_url = base_url or BASE_URL
+        key = (model, float(temperature), base_url)
+
+        client = self._models.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._models.get(key)
+            if client is None and self.backend == "fake":
+                client = FakeChatModel(
+                    model_name=model or "fake",
+                    profile=get_default_profile(),
+                    callbacks=[LLMMetricsCallback(model)],
+                )
+                self._models[key] = client
+            elif client is None:
+                http_client, http_async_client = self._get_http_clients(base_url)
+                client = ChatOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=base_url,
+                    model=model,
+                    temperature=temperature,
+                    timeout=60,
+                    max_retries=3,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    callbacks=[LLMMetricsCallback(model)],
+                )
+                self._models[key] = client
+        return client
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取注册表与连接复用统计"""
+        stats = self.stats.snapshot()
+        stats.update({
+            "backend": self.backend,
+            "cached_models": len(self._models),
+            "connection_pools": len(self._http_clients),
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+        })
+        if self.backend == "fake":
+            stats["fake_llm"] = get_default_profile().describe()
+        return stats
+
+    async def aclose(self):
+        """关闭所有共享连接池（应用退出时调用）"""
+        with self._lock:
+            clients = list(self._http_clients.values())
+            self._http_clients.clear()
+            self._models.clear()
+        for http_client, http_async_client in clients:
+            http_client.close()
+            await http_async_client.aclose()
+
+
+# 全局客户端注册表
+llm_registry = LLMClientRegistry()
+
+
 def llm(temperature: float = 0):
-    return ChatOpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=BASE_URL,
-        model=MODEL,
-        temperature=temperature,
-        timeout=60,
-        max_retries=3,
-    )
+    return llm_registry.get(temperature=temperature)
@@ -0,0 +1,208 @@
+"""
+上下文组装 - 在显式token预算内拼出一轮正常聊天发给LLM的全部上下文
+
+组成部分按优先级依次放入预算：
+1. 必选：system prompt（全局人设 + 级别人设）、本轮用户状态、用户输入
+2. 最近一轮历史对话
+3. 记忆摘要（memory_context，去掉与已放入历史重复的片段）
+4. 更早的历史对话（由新到旧，遇到放不下的一轮即停止，保持历史连续）
+
+历史中完全相同的轮次、以及旧版本写入的"记忆上下文: ...\\n用户输入: ..."包装只保留一份。
+token数使用记忆模块的 count_tokens 估算（不含工具schema）。
+
+必选部分本身超出预算时不做截断：历史与记忆摘要全部放弃，结果标记为 over_budget 并记录告警。
+"""
+import os
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from ..memory.memory_manager import count_tokens
+from ..prompts.prompts import GLOBAL_SYSTEM_PROMPT, TALK_INNER_GUIDE
+from ..prompts.prompt_config import TALK_EXECUTION_PROMPT
+from .log import get_logger
+
+logger = get_logger("context")
+
+# 上下文预算配置
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_DIGEST_MAX_TOKENS = int(os.getenv("CONTEXT_DIGEST_MAX_TOKENS", "100"))
+
+# 记忆摘要以 " | " 分段，每段形如 "上轮: xxx..."
+DIGEST_SEPARATOR = " | "
+# 记忆摘要拼进用户输入时的包装（旧版本也以此格式写入过短期记忆）
+_WRAPPED_INPUT_MARKER = "\n用户输入: "
+_WRAPPER_TOKENS = count_tokens("记忆上下文: " + _WRAPPED_INPUT_MARKER)
+
+
+def unwrap_user_input(content: str) -> str:
+    """去掉"记忆上下文: ...\\n用户输入: "包装，只保留用户原话"""
+    if content.startswith("记忆上下文: ") and _WRAPPED_INPUT_MARKER in content:
+        return content.split(_WRAPPED_INPUT_MARKER, 1)[1]
+    return content
+
+
+class AssembledContext:
+    """一轮对话组装好的上下文及其token统计"""
+
+    __slots__ = ("input", "chat_history", "tokens", "budget", "breakdown", "dropped")
+
+    def __init__(self, input: str, chat_history: List[BaseMessage], tokens: int, budget: int,
+                 breakdown: Dict[str, int], dropped: Dict[str, int]):
+        self.input = input
+        self.chat_history = chat_history
+        self.tokens = tokens
+        self.budget = budget
+        self.breakdown = breakdown
+        self.dropped = dropped
+
+    @property
+    def over_budget(self) -> bool:
+        """必选部分（system prompt + 用户状态 + 用户输入）已超出预算"""
+        return self.tokens > self.budget
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "over_budget": self.over_budget,
+            "breakdown": dict(self.breakdown),
+            "dropped": dict(self.dropped),
+        }
+
+
+class ContextAssembler:
+    """按token预算组装上下文：去重 + 按优先级裁剪"""
+
+    def __init__(self, style_prompts: Dict[str, str], default_level: str = "轻",
+                 budget: int = CONTEXT_TOKEN_BUDGET, digest_max_tokens: int = CONTEXT_DIGEST_MAX_TOKENS):
+        """
+        Args:
+            style_prompts: 级别 -> 该级别固定的人设prompt片段（与LevelAgentCache相同）
+            default_level: 未知级别时使用的默认级别
+            budget: 每轮上下文的token预算
+            digest_max_tokens: 记忆摘要最多占用的token数
+        """
+        self.budget = budget
+        self.digest_max_tokens = digest_max_tokens
+        self.default_level = default_level
+        # 固定prompt的token数启动时算好
+        self.system_tokens = {
+            level: count_tokens(GLOBAL_SYSTEM_PROMPT.format(answer_style=style_prompt))
+            for level, style_prompt in style_prompts.items()
+        }
+        self.talk_tokens = count_tokens(TALK_EXECUTION_PROMPT.format(user_text="", talk_guide=TALK_INNER_GUIDE))
+
+    def assemble(self, user_text: str, memory_context: str, chat_history: List[BaseMessage],
+                 style_level: str, severity_state: str = "", persona: str = "", talk: bool = False) -> AssembledContext:
+        """
+        组装一轮对话的上下文
+
+        Args:
+            user_text: 用户本轮原话
+            memory_context: 记忆摘要（get_memory_context_for_tool 的输出）
+            chat_history: 记忆窗口中的历史消息（旧 -> 新）
+            style_level: 人设级别
+            severity_state: 本轮用户状态prompt片段
+            persona: 海王人设（可选）
+            talk: 是否走闲聊prompt（闲聊prompt不含人设与记忆摘要）
+        """
+        breakdown = {"system": 0, "state": 0, "input": 0, "digest": 0, "history": 0}
+        dropped = {"duplicates": 0, "history_messages": 0, "digest_parts": 0}
+
+        # 1. 必选部分
+        if talk:
+            breakdown["system"] = self.talk_tokens
+        else:
+            breakdown["system"] = self.system_tokens.get(style_level) or self.system_tokens[self.default_level]
+            breakdown["state"] = count_tokens(severity_state)
+        persona_suffix = f"\n\n海王人设: {persona}" if not talk and persona and persona.strip() else ""
+        breakdown["input"] = count_tokens(user_text + persona_suffix)
+        required = sum(breakdown.values())
+        if required > self.budget:
+            logger.warning("必选上下文超出token预算: %d > %d（system=%d, state=%d, input=%d），历史与记忆摘要全部放弃",
+                           required, self.budget, breakdown["system"], breakdown["state"], breakdown["input"])
+        remaining = max(self.budget - required, 0)
+
+        # 历史按轮去重，并记下每轮的token数（新 -> 旧）
+        turns = self._dedup_turns(chat_history, dropped)
+        kept_turns: List[List[BaseMessage]] = []
+        turn_tokens = [sum(count_tokens(message.content) for message in turn) for turn in turns]
+
+        # 2. 最近一轮历史
+        if turns and turn_tokens[0] <= remaining:
+            kept_turns.append(turns[0])
+            remaining -= turn_tokens[0]
+            breakdown["history"] += turn_tokens[0]
+
+        # 3. 记忆摘要（闲聊prompt不使用）
+        digest = ""
+        if not talk and memory_context and memory_context != "无历史记忆":
+            history_text = "\n".join(message.content for turn in kept_turns for message in turn)
+            digest, digest_tokens = self._fit_digest(memory_context, history_text,
+                                                     min(remaining, self.digest_max_tokens) - _WRAPPER_TOKENS, dropped)
+            if digest:
+                digest_tokens += _WRAPPER_TOKENS
+            remaining -= digest_tokens
+            breakdown["digest"] = digest_tokens
+
+        # 4. 更早的历史，放不下即停止
+        for index in range(len(kept_turns), len(turns)):
+            if turn_tokens[index] > remaining:
+                dropped["history_messages"] += sum(len(turn) for turn in turns[index:])
+                break
+            kept_turns.append(turns[index])
+            remaining -= turn_tokens[index]
+            breakdown["history"] += turn_tokens[index]
+        if not kept_turns and turns:
+            dropped["history_messages"] = sum(len(turn) for turn in turns)
+
+        combined_input = (f"记忆上下文: {digest}\n用户输入: {user_text}" if digest else user_text) + persona_suffix
+
+        history = [message for turn in reversed(kept_turns) for message in turn]
+        return AssembledContext(combined_input, history, sum(breakdown.values()), self.budget, breakdown, dropped)
+
+    @staticmethod
+    def _dedup_turns(chat_history: List[BaseMessage], dropped: Dict[str, int]) -> List[List[BaseMessage]]:
+        """按"用户消息 + 后续回复"切分为轮次（新 -> 旧），去掉完全相同的重复轮次"""
+        turns: List[List[BaseMessage]] = []
+        for message in chat_history:
+            if isinstance(message, HumanMessage):
+                content = unwrap_user_input(message.content)
+                if content != message.content:
+                    message = HumanMessage(content=content)
+                turns.append([message])
+            elif turns:
+                turns[-1].append(message)
+            else:
+                turns.append([message])
+
+        seen = set()
+        unique: List[List[BaseMessage]] = []
+        for turn in reversed(turns):
+            key = tuple((message.type, message.content) for message in turn)
+            if key in seen:
+                dropped["duplicates"] += len(turn)
+                continue
+            seen.add(key)
+            unique.append(turn)
+        return unique
+
+    @staticmethod
+    def _fit_digest(memory_context: str, history_text: str, limit: int, dropped: Dict[str, int]) -> Tuple[str, int]:
+        """记忆摘要去掉已在历史中出现的片段，再按顺序放入不超过limit的部分"""
+        parts: List[str] = []
+        tokens = 0
+        for part in memory_context.split(DIGEST_SEPARATOR):
+            # "上轮: xxx..." 这类片段的正文已在历史中出现时跳过
+            body = part.split(": ", 1)[-1].rstrip(".").strip()
+            if body and body in history_text:
+                dropped["digest_parts"] += 1
+                continue
+            part_tokens = count_tokens(part) + (count_tokens(DIGEST_SEPARATOR) if parts else 0)
+            if tokens + part_tokens > limit:
+                dropped["digest_parts"] += 1
+                continue
+            parts.append(part)
+            tokens += part_tokens
+        return DIGEST_SEPARATOR.join(parts), tokens
@@ -0,0 +1,332 @@
+"""
+离线模拟LLM - 无需真实API即可压测与基准测试
+
+- LLM_BACKEND=fake 时 config.llm 返回 FakeChatModel，进程内直接生成回复
+- benchmarks/fake_openai_server.py 用同一套回复与延迟逻辑提供 OpenAI 兼容的
+  /v1/chat/completions，ChatOpenAI 通过 OPENAI_BASE_URL 指向它即可走完整HTTP链路
+
+回复按prompt类型生成，格式与真实模型一致：恋爱脑分析返回符合schema的JSON（含批量数组），
+海王对战返回【拽姐旁白】/【海王】格式，Agent对非恋爱话题调用 talk_tool。
+
+延迟与错误注入（环境变量）：
+- FAKE_LLM_LATENCY：首token延迟分布
+    fixed:0.2            固定0.2秒
+    lognormal:0.3,0.6    对数正态，中位数0.3秒，sigma=0.6
+    pareto:0.2,1.5       重尾（帕累托），最小0.2秒，alpha=1.5（越小尾部越重）
+- FAKE_LLM_LATENCY_MAX：单次延迟上限（秒），截断重尾分布的极端值
+- FAKE_LLM_TOKEN_INTERVAL：流式输出时相邻片段的间隔（秒）
+- FAKE_LLM_ERROR_RATE：调用失败概率（0~1）
+- FAKE_LLM_ERROR_STATUS：stub服务器注入错误时返回的HTTP状态码（如500、429）
+- FAKE_LLM_SEED：随机种子，设置后延迟与错误序列可复现
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .keyword_engine import scan_keywords
+
+# 模拟LLM配置
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "fixed:0.2")
+FAKE_LLM_LATENCY_MAX = float(os.getenv("FAKE_LLM_LATENCY_MAX", "30"))
+FAKE_LLM_TOKEN_INTERVAL = float(os.getenv("FAKE_LLM_TOKEN_INTERVAL", "0"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_ERROR_STATUS = int(os.getenv("FAKE_LLM_ERROR_STATUS", "500"))
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+
+# 流式输出时每个片段的字符数
+STREAM_CHUNK_CHARS = 4
+
+# 各级别的Agent回复
+AGENT_REPLIES = {
+    "无": "哈哈这事儿姐懂，先吃饱再说！",
+    "轻": "姐觉得你该睡觉了，别盯着手机了。",
+    "中": "清醒点，他要真在乎你还用你猜？",
+    "重": "钱和前途都别交出去，这是在拿你当提款机。",
+    "危": "先保护好自己！马上联系家人或拨打110，心理援助热线：400-161-9995。",
+}
+
+SEAKING_LINES = [
+    "在干嘛呢，突然有点想你了",
+    "你和别人不一样，跟你聊天特别放松",
+    "今晚月色真好，可惜你不在身边",
+    "别多想，我对谁都没对你这么上心",
+]
+
+_USER_INPUT_RE = re.compile(r"用户发言：(.*?)\n")
+_SEAKING_INPUT_RE = re.compile(r"【用户本轮回复】(.*?)\n")
+_SEAKING_SCORE_RE = re.compile(r"用户当前总得分：(\d+)分")
+_TALK_INPUT_RE = re.compile(r"用户：(.*?)\n")
+
+
+class FakeLLMError(RuntimeError):
+    """注入的模拟调用失败"""
+
+
+class LatencyDistribution:
+    """延迟分布：fixed / lognormal / pareto，采样结果截断到 [0, max_seconds]"""
+
+    KINDS = ("fixed", "lognormal", "pareto")
+
+    def __init__(self, kind: str, params: Sequence[float], max_seconds: float = FAKE_LLM_LATENCY_MAX):
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的延迟分布: {kind}（可选 {', '.join(self.KINDS)}）")
+        expected = 1 if kind == "fixed" else 2
+        if len(params) != expected:
+            raise ValueError(f"延迟分布 {kind} 需要 {expected} 个参数")
+        self.kind = kind
+        self.params = tuple(params)
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def parse(cls, spec: str, max_seconds: float = FAKE_LLM_LATENCY_MAX) -> "LatencyDistribution":
+        """解析 "kind:p1,p2" 格式，只写数字时视为固定延迟"""
+        kind, _, params = spec.strip().partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        return cls(kind.strip().lower(), [float(p) for p in params.split(",") if p.strip()], max_seconds)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        else:
+            minimum, alpha = self.params
+            value = minimum * rng.paretovariate(alpha)
+        return max(0.0, min(value, self.max_seconds))
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(str(p) for p in self.params)}"
+
+
+class FakeLLMProfile:
+    """延迟与错误注入配置（进程内模型与stub服务器共用）"""
+
+    def __init__(self,
+                 latency: LatencyDistribution,
+                 error_rate: float = 0.0,
+                 error_status: int = 500,
+                 token_interval: float = 0.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = min(1.0, max(0.0, error_rate))
+        self.error_status = error_status
+        self.token_interval = token_interval
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMProfile":
+        return cls(
+            latency=LatencyDistribution.parse(FAKE_LLM_LATENCY),
+            error_rate=FAKE_LLM_ERROR_RATE,
+            error_status=FAKE_LLM_ERROR_STATUS,
+            token_interval=FAKE_LLM_TOKEN_INTERVAL,
+            seed=int(FAKE_LLM_SEED) if FAKE_LLM_SEED else None,
+        )
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            return self.latency.sample(self._rng)
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "latency": str(self.latency),
+            "latency_max": self.latency.max_seconds,
+            "token_interval": self.token_interval,
+            "error_rate": self.error_rate,
+            "error_status": self.error_status,
+        }
+
+
+class FakeReply(NamedTuple):
+    """一次模拟回复：文本内容，或一次工具调用 (工具名, 参数)"""
+    content: str
+    tool_call: Optional[Tuple[str, Dict[str, Any]]] = None
+
+
+def _severity(text: str) -> Dict[str, Any]:
+    """按关键词给出恋爱脑分析结果（与真实模型输出的JSON字段一致）"""
+    hits = scan_keywords(text, ("love", "risk"))
+    if not hits.has("love"):
+        return {"index": 0, "level": "无", "signals": [], "switch_to_help": False}
+
+    risk_hits = hits.group("risk")
+    score = sum(hit.weight for hit in risk_hits)
+    signals = [hit.keyword for hit in risk_hits] or ["情绪焦虑"]
+    if score >= 3.0:
+        level, index = "危", 95
+    elif score >= 2.0:
+        level, index = "重", 80
+    elif score >= 1.0:
+        level, index = "中", 55
+    else:
+        level, index = "轻", 30
+    return {"index": index, "level": level, "signals": signals, "switch_to_help": level in ("重", "危")}
+
+
+def _severity_reply(prompt: str) -> str:
+    inputs = _USER_INPUT_RE.findall(prompt)
+    if "相互独立的发言" in prompt:
+        results = [dict(id=i, **_severity(text)) for i, text in enumerate(inputs, 1)]
+        return json.dumps(results, ensure_ascii=False)
+    return json.dumps(_severity(inputs[0] if inputs else ""), ensure_ascii=False)
+
+
+def _seaking_reply(prompt: str) -> str:
+    line = SEAKING_LINES[len(prompt) % len(SEAKING_LINES)]
+    if "【上一轮完整对话】（这是第一轮对话）" in prompt:
+        return f"【挑战目标】识破海王套路，机智回应得满分！\n【海王】{line}\n【拽姐旁白】🎯准备好了吗？开始你的反套路表演！"
+
+    match = _SEAKING_SCORE_RE.search(prompt)
+    current_score = int(match.group(1)) if match else 0
+    user_input = (_SEAKING_INPUT_RE.findall(prompt) or [""])[0]
+    gained = 40 if len(user_input) >= 10 else 20
+    return f"【拽姐旁白】点评：回得还行，继续保持 当前得分：{min(100, current_score + gained)}\n【海王】{line}"
+
+
+def _agent_reply(messages: Sequence[Tuple[str, str]], tool_names: Sequence[str]) -> FakeReply:
+    # 工具已返回结果：以工具输出作为最终回复
+    if messages and messages[-1][0] == "tool":
+        return FakeReply(messages[-1][1])
+
+    user_text = next((content for role, content in reversed(messages) if role == "human"), "")
+    severity = _severity(user_text)
+    if severity["level"] == "无" and "talk_tool" in tool_names:
+        return FakeReply("", ("talk_tool", {"user_text": user_text}))
+    return FakeReply(AGENT_REPLIES[severity["level"]])
+
+
+def build_reply(messages: Sequence[Tuple[str, str]], tool_names: Sequence[str] = ()) -> FakeReply:
+    """
+    根据prompt类型生成回复
+
+    Args:
+        messages: [(角色, 内容)]，角色为 system / human / ai / tool
+        tool_names: 本次调用绑定的工具名
+    """
+    prompt = "\n".join(content for _, content in messages)
+    if "恋爱脑程度识别器" in prompt:
+        return FakeReply(_severity_reply(prompt))
+    if "海王模拟器" in prompt:
+        return FakeReply(_seaking_reply(prompt))
+    if "闺蜜吹水搭子的口吻" in prompt:
+        user_text = (_TALK_INPUT_RE.findall(prompt) or [""])[0]
+        return FakeReply(f"{user_text[:10]}？这事儿姐必须吐槽两句，太真实了！")
+    return _agent_reply(messages, tool_names)
+
+
+def iter_chunks(text: str, size: int = STREAM_CHUNK_CHARS) -> Iterator[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def new_tool_call_id() -> str:
+    return f"call_{uuid.uuid4().hex[:24]}"
+
+
+def _tool_names(tools: Optional[Sequence[Dict[str, Any]]]) -> List[str]:
+    return [tool.get("function", {}).get("name", "") for tool in tools or ()]
+
+
+def _normalize(messages: Sequence[BaseMessage]) -> List[Tuple[str, str]]:
+    return [(message.type, message.content if isinstance(message.content, str) else str(message.content))
+            for message in messages]
+
+
+class FakeChatModel(BaseChatModel):
+    """进程内模拟模型：按 FakeLLMProfile 延迟/失败，回复由 build_reply 生成
+
+    支持 bind(tools=...)（openai-tools Agent的绑定方式），返回的工具调用与
+    ChatOpenAI 的 AIMessage.tool_calls 结构一致。
+    """
+
+    model_name: str = "fake"
+    profile: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-openai"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _reply(self, messages: List[BaseMessage], kwargs: Dict[str, Any]) -> FakeReply:
+        return build_reply(_normalize(messages), _tool_names(kwargs.get("tools")))
+
+    def _fail(self):
+        raise FakeLLMError("模拟LLM调用失败（FAKE_LLM_ERROR_RATE）")
+
+    @staticmethod
+    def _message(reply: FakeReply) -> AIMessage:
+        if reply.tool_call is None:
+            return AIMessage(content=reply.content)
+        name, args = reply.tool_call
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": new_tool_call_id()}])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.profile.sample_latency())
+        if self.profile.should_fail():
+            self._fail()
+        return ChatResult(generations=[ChatGeneration(message=self._message(self._reply(messages, kwargs)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.profile.sample_latency())
+        if self.profile.should_fail():
+            self._fail()
+        return ChatResult(generations=[ChatGeneration(message=self._message(self._reply(messages, kwargs)))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # 首个片段前等待采样的延迟，之后按 token_interval 逐片段输出
+        await asyncio.sleep(self.profile.sample_latency())
+        if self.profile.should_fail():
+            self._fail()
+
+        reply = self._reply(messages, kwargs)
+        if reply.tool_call is not None:
+            name, args = reply.tool_call
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                "name": name, "args": json.dumps(args, ensure_ascii=False), "id": new_tool_call_id(), "index": 0
+            }]))
+            return
+
+        for i, text in enumerate(iter_chunks(reply.content)):
+            if i and self.profile.token_interval:
+                await asyncio.sleep(self.profile.token_interval)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+
+# 进程级共享配置（随机数序列在所有模型实例间共享，FAKE_LLM_SEED 下可复现）
+_default_profile: Optional[FakeLLMProfile] = None
+
+
+def get_default_profile() -> FakeLLMProfile:
+    global _default_profile
+    if _default_profile is None:
+        _default_profile = FakeLLMProfile.from_env()
+    return _default_profile
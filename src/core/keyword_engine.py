@@ -0,0 +1,209 @@
+"""
+关键词引擎 - 把所有关键词表编译成一个多模式匹配器，一次扫描返回全部命中
+
+恋爱脑降级分析、本地记忆模式检测、Redis记忆模式检测原先各自用
+`any(keyword in text ...)` 逐个关键词扫描整段文本。这里在导入时把所有表合并为
+一棵前缀树，并编译成一个正则（每个分支以字面量开头，re 可按首字符快速跳过），
+对文本做一次扫描即可得到每个命中关键词及其所属表、类别和权重。
+"""
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+# 风险关键词：类别为风险等级，值为权重
+RISK_KEYWORDS: Dict[str, Dict[str, float]] = {
+    # 危险信号 (3.0)
+    "危": {'自杀': 3.0, '自残': 3.0, '自伤': 3.0, '想死': 3.0,
+          '暴力': 3.0, '威胁': 3.0, '裸聊': 3.0, '未成年': 3.0},
+    # 重度信号 (2.0)
+    "重": {'转账': 2.0, '借钱': 2.0, '万': 2.0, '辞职': 2.0,
+          '跟踪': 2.0, '监控': 2.0, '操控': 2.0},
+    # 中度信号 (1.5)
+    "中": {'礼物': 1.5, '隐瞒': 1.5, '依赖': 1.5},
+    # 轻度信号 (1.0)
+    "轻": {'焦虑': 1.0, '担心': 1.0, '消息': 1.0, '回复': 1.0},
+}
+
+# 恋爱相关关键词
+LOVE_KEYWORDS = ['他', '她', '男朋友', '女朋友', '恋爱', '分手', '复合', '挽回',
+                 '喜欢', '爱', '不爱', '出轨', '背叛', '冷暴力', 'PUA', '控制',
+                 '依赖', '焦虑', '消息', '回复', '朋友圈', '约会', '礼物', '转账',
+                 '借钱', '结婚', '离婚']
+
+# 大额转账意愿（需同时出现数字）
+LARGE_AMOUNT_KEYWORDS = ['万', '千', '转账', '借钱']
+
+# 日常话题（用于本地分类判断非恋爱话题）
+DAILY_TOPIC_KEYWORDS = ['天气', '工作', '学习', '娱乐', '生活', '加班', '项目', '考试',
+                        '游戏', '购物', '旅游', '美食', '健身']
+
+# 本地记忆的用户行为模式
+USER_PATTERN_KEYWORDS = {
+    "金钱依赖": ["转账", "借钱", "投资", "买单", "花钱", "钱", "经济"],
+    "情绪依赖": ["想念", "焦虑", "失眠", "心情", "情绪", "难过", "伤心", "痛苦"],
+    "社交隔离": ["朋友", "家人", "同事", "社交", "联系", "孤立", "孤独"],
+    "时间沉迷": ["整天", "一直", "24小时", "不停", "总是", "时刻", "每时每刻"],
+    "自我怀疑": ["我是不是", "我配吗", "我错了", "我不够好", "自卑"],
+    "过度理想化": ["完美", "理想", "童话", "王子", "公主", "命中注定"],
+    "控制欲": ["管我", "限制", "不允许", "必须", "应该", "要求"]
+}
+
+# Redis记忆的用户行为模式
+REDIS_PATTERN_KEYWORDS = {
+    "金钱依赖": ["转账", "借钱", "投资", "买单", "花钱", "红包", "转钱"],
+    "情绪依赖": ["想念", "焦虑", "失眠", "心情", "情绪", "难过", "开心"],
+    "社交隔离": ["朋友", "家人", "同事", "社交", "联系", "孤独", "alone"],
+    "时间沉迷": ["整天", "一直", "24小时", "不停", "总是", "每天", "时刻"]
+}
+
+
+class KeywordHit(NamedTuple):
+    """一次关键词命中"""
+    keyword: str
+    group: str      # 所属关键词表
+    category: str   # 表内类别（风险等级 / 行为模式）
+    weight: float
+
+
+class ScanResult:
+    """一次扫描的全部命中，按关键词表中的定义顺序排列"""
+
+    __slots__ = ("hits", "_groups", "_categories")
+
+    def __init__(self, hits: Tuple[KeywordHit, ...]):
+        self.hits = hits
+        self._groups: Dict[str, List[KeywordHit]] = {}
+        for hit in hits:
+            self._groups.setdefault(hit.group, []).append(hit)
+        self._categories = {
+            group: list(dict.fromkeys(hit.category for hit in group_hits))
+            for group, group_hits in self._groups.items()
+        }
+
+    def group(self, name: str) -> List[KeywordHit]:
+        """某张表的全部命中"""
+        return list(self._groups.get(name, ()))
+
+    def has(self, name: str) -> bool:
+        """某张表是否有命中"""
+        return name in self._groups
+
+    def categories(self, name: str) -> List[str]:
+        """某张表命中的类别（去重，保持定义顺序）"""
+        return list(self._categories.get(name, ()))
+
+
+class KeywordEngine:
+    """多模式关键词匹配器
+
+    所有关键词先合并成前缀树，再编译为嵌套分支的正则：同一起点只会匹配
+    最长的关键词，它的全部子串关键词（如"借钱"里的"钱"）必然同时出现，
+    由预先计算的闭包补齐；每次命中后从起点+1继续搜索，保证重叠的关键词
+    （如"男朋友圈"中的"男朋友"和"朋友圈"）都能找到。
+    """
+
+    def __init__(self, tables: Dict[str, Dict[str, Dict[str, float]]]):
+        """
+        Args:
+            tables: {表名: {类别: {关键词: 权重}}}
+        """
+        self._hits: Dict[str, List[Tuple[int, KeywordHit]]] = {}
+        order = 0
+        for group, categories in tables.items():
+            for category, keywords in categories.items():
+                for keyword, weight in keywords.items():
+                    self._hits.setdefault(keyword, []).append(
+                        (order, KeywordHit(keyword, group, category, weight)))
+                    order += 1
+
+        self._groups = tuple(tables)
+        # 按调用方需要的表组合分别编译，避免为用不到的表（如日常话题）付出匹配开销
+        self._matchers: Dict[FrozenSet[str], Tuple["re.Pattern[str]", Dict[str, Tuple[str, ...]]]] = {}
+        self._matcher(frozenset(self._groups))
+
+    def _matcher(self, groups: FrozenSet[str]):
+        matcher = self._matchers.get(groups)
+        if matcher is None:
+            unknown = groups.difference(self._groups)
+            if unknown:
+                raise KeyError(f"未知的关键词表: {sorted(unknown)}")
+            keywords = [keyword for keyword, entries in self._hits.items()
+                        if any(hit.group in groups for _, hit in entries)]
+            closure = {keyword: tuple(k for k in keywords if k in keyword) for keyword in keywords}
+            matcher = self._matchers[groups] = (self._compile(keywords), closure)
+        return matcher
+
+    @staticmethod
+    def _compile(keywords: Iterable[str]) -> "re.Pattern[str]":
+        trie: Dict[str, dict] = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def branch(node: Dict[str, dict]) -> str:
+            children = [re.escape(char) + branch(child) for char, child in node.items() if char]
+            if not children:
+                return ""
+            body = "(?:" + "|".join(children) + ")"
+            return body + "?" if "" in node else body
+
+        return re.compile("|".join(re.escape(char) + branch(child) for char, child in trie.items()))
+
+    def scan(self, text: str, groups: Optional[Iterable[str]] = None) -> ScanResult:
+        """扫描文本，返回全部命中
+
+        Args:
+            text: 待扫描文本
+            groups: 只匹配这些关键词表，默认全部
+        """
+        groups = frozenset(self._groups if groups is None else groups)
+        pattern, closure = self._matcher(groups)
+        found = set()
+        search = pattern.search
+        pos = 0
+        while True:
+            match = search(text, pos)
+            if match is None:
+                break
+            found.update(closure[match.group()])
+            pos = match.start() + 1
+        return self._assemble(frozenset(found), groups)
+
+    @lru_cache(maxsize=4096)
+    def _assemble(self, found: frozenset, groups: FrozenSet[str]) -> ScanResult:
+        # 不同消息的命中组合有限，组装结果按组合缓存
+        hits = sorted(entry for keyword in found for entry in self._hits[keyword]
+                      if entry[1].group in groups)
+        return ScanResult(tuple(hit for _, hit in hits))
+
+
+def _weighted(keywords: Iterable[str], weight: float = 1.0) -> Dict[str, float]:
+    return {keyword: weight for keyword in keywords}
+
+
+# 全局实例：导入时编译一次
+keyword_engine = KeywordEngine({
+    "risk": RISK_KEYWORDS,
+    "love": {"恋爱话题": _weighted(LOVE_KEYWORDS)},
+    "large_amount": {"大额转账意愿": _weighted(LARGE_AMOUNT_KEYWORDS, 1.5)},
+    "daily": {"日常话题": _weighted(DAILY_TOPIC_KEYWORDS)},
+    "user_pattern": {category: _weighted(words) for category, words in USER_PATTERN_KEYWORDS.items()},
+    "redis_pattern": {category: _weighted(words) for category, words in REDIS_PATTERN_KEYWORDS.items()},
+})
+
+
+@lru_cache(maxsize=1024)
+def _scan_cached(text: str, groups: Optional[FrozenSet[str]]) -> ScanResult:
+    return keyword_engine.scan(text, groups)
+
+
+def scan_keywords(text: str, groups: Optional[Iterable[str]] = None) -> ScanResult:
+    """扫描文本（同一条消息、同一组关键词表只扫描一次）
+
+    Args:
+        text: 待扫描文本
+        groups: 只匹配这些关键词表，默认全部；只需要部分表的调用方应显式传入
+    """
+    return _scan_cached(text, None if groups is None else frozenset(groups))
@@ -0,0 +1,165 @@
+"""
+日志模块 - 分级、按类别采样、队列异步写出
+
+- 级别：LOG_LEVEL 控制全局级别（默认INFO），未启用的级别在调用处直接返回，
+  消息参数不会被格式化（使用 logger.debug("...%s", value) 的惰性格式化）
+- 采样：LOG_SAMPLE_RATES 按类别设置DEBUG/INFO日志的采样率，WARNING及以上不采样
+- 异步：请求线程只把日志记录放入有界队列，由后台线程格式化并写出；
+  队列满时丢弃并计数，不阻塞请求
+- 结构化：LOG_FORMAT=json 时每行输出一个JSON对象，extra={"fields": {...}} 中的字段一并输出
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+# 日志配置
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" 或 "json"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# 按类别的采样率，例如 "seaking=0.1,session=0.01"，未列出的类别不采样(1.0)
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+ROOT_LOGGER_NAME = "antilove"
+
+
+def _parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        category, rate = item.split("=", 1)
+        try:
+            rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """按采样率保留DEBUG/INFO日志，WARNING及以上全部保留"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """把日志记录放入有界队列，队列满时丢弃并计数
+
+    不在请求线程中格式化消息（默认的prepare会调用format），
+    格式化留给后台写出线程完成；日志参数应为不再修改的值。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """文本或JSON行格式，附带 extra={"fields": {...}} 中的结构化字段"""
+
+    def __init__(self, fmt_type: str = "text"):
+        super().__init__("%(asctime)s %(levelname)s [%(category)s] %(message)s")
+        self.fmt_type = fmt_type
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.category = record.name[len(ROOT_LOGGER_NAME) + 1:] or ROOT_LOGGER_NAME
+        fields = getattr(record, "fields", None)
+        if self.fmt_type == "json":
+            data: Dict[str, Any] = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "category": record.category,
+                "message": record.getMessage(),
+            }
+            if fields:
+                data.update(fields)
+            if record.exc_info:
+                data["exc_info"] = self.formatException(record.exc_info)
+            return json.dumps(data, ensure_ascii=False, default=str)
+
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_setup_lock = threading.Lock()
+_sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt_type: str = LOG_FORMAT) -> logging.Logger:
+    """初始化日志（幂等）：根logger挂队列handler，后台线程写到stdout"""
+    global _listener, _queue_handler
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    with _setup_lock:
+        if _listener is not None:
+            return root
+
+        if _queue_handler is not None:
+            root.removeHandler(_queue_handler)
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(StructuredFormatter(fmt_type))
+
+        root.setLevel(getattr(logging, level, logging.INFO))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        _listener = QueueListener(log_queue, stream_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """停止后台写出线程（会先写完队列中已有的日志）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """获取指定类别的logger，按 LOG_SAMPLE_RATES 挂载采样过滤器"""
+    setup_logging()
+    logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{category}")
+    rate = _sample_rates.get(category)
+    if rate is not None and rate < 1.0 and not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(rate))
+    return logger
+
+
+def get_log_stats() -> Dict[str, Any]:
+    """日志子系统状态"""
+    return {
+        "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER_NAME).level),
+        "format": LOG_FORMAT,
+        "queue_size": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "sample_rates": dict(_sample_rates),
+    }
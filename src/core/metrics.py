@@ -0,0 +1,222 @@
+"""
+运行指标 - Prometheus文本格式的计数器/仪表/直方图
+
+依赖中没有prometheus_client，这里实现所需的最小子集（带标签的Counter、Gauge、Histogram
+及text exposition 0.0.4 输出），由 /metrics 端点导出，跨请求观察各阶段耗时与降级情况。
+"""
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 阶段耗时直方图的桶边界（秒），覆盖本地处理的毫秒级到LLM调用的数十秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        values = self.collect()
+        if not self.labelnames and not values:
+            values = {(): 0}  # 无标签的计数器从0开始导出
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """仪表：可设置的当前值，或在导出时调用回调函数取值"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        if self.callback is not None:
+            lines.append(f"{self.name} {_format_value(self.callback())}")
+            return lines
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """直方图：按标签组合统计各桶计数、总和与次数"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签组合 -> [各桶计数(非累计)..., +Inf桶计数, 总和]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """各标签组合的次数与总和"""
+        with self._lock:
+            return {key: {"count": sum(series[:-1]), "sum": series[-1]} for key, series in self._values.items()}
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 各处理阶段耗时：route 为 normal 或海王模式按钮，level 为恋爱脑级别（海王模式为none，未知级别为other）
+STAGE_SECONDS = registry.register(Histogram(
+    "antilove_stage_seconds", "Per-stage request latency in seconds.", ("stage", "route", "level")))
+LLM_CALLS = registry.register(Counter(
+    "antilove_llm_calls", "LLM calls started.", ("model",)))
+LLM_FAILURES = registry.register(Counter(
+    "antilove_llm_failures", "LLM calls that raised an error.", ("model",)))
+SEVERITY_FALLBACKS = registry.register(Counter(
+    "antilove_severity_keyword_fallbacks", "Severity analyses that fell back to keyword matching.", ("reason",)))
+MEMORY_COMPRESSIONS = registry.register(Counter(
+    "antilove_memory_compressions", "Short-term memory compressions."))
+# 正常聊天每轮的耗时、生成回复的LLM调用次数与组装的上下文token数：path 为 agent / talk / persona（见 chat_router.py），
+# over_budget 为 true 表示必选部分已超出 CONTEXT_TOKEN_BUDGET
+CHAT_TURN_SECONDS = registry.register(Histogram(
+    "antilove_chat_turn_seconds", "Normal chat turn latency in seconds by router path.", ("path",)))
+CHAT_TURN_LLM_CALLS = registry.register(Counter(
+    "antilove_chat_turn_llm_calls", "LLM calls made to generate normal chat replies (severity analysis excluded) by router path.", ("path",)))
+CONTEXT_TOKENS = registry.register(Histogram(
+    "antilove_context_tokens", "Estimated prompt tokens assembled per normal chat turn by router path.", ("path", "over_budget"),
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 8000)))
+SESSION_COALESCED = registry.register(Counter(
+    "antilove_session_coalesced_requests", "Duplicate in-flight requests that joined an existing result instead of calling the LLM.", ("endpoint",)))
+SESSION_LOCK_WAITS = registry.register(Counter(
+    "antilove_session_lock_waits", "Requests that waited for another request of the same session to finish."))
+ACTIVE_SESSIONS = registry.register(Gauge(
+    "antilove_active_sessions", "Sessions currently held in the session registry."))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# level 标签只取已知的恋爱脑级别，LLM输出的其他内容归为 other，避免时间序列数量无界增长
+STAGE_LEVELS = frozenset(("无", "轻", "中", "重", "危"))
+
+
+def observe_stages(route: str, level: str, **stages: float):
+    """记录一次请求各阶段的耗时（秒）"""
+    if not level:
+        level = "none"
+    elif level not in STAGE_LEVELS:
+        level = "other"
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage, route=route, level=level)
+
+
+def get_route_stats() -> Dict[str, Dict[str, float]]:
+    """按路由汇总请求数与平均总耗时（供 /system/routing/stats 使用）"""
+    routes: Dict[str, Dict[str, float]] = {}
+    for (stage, route, level), data in STAGE_SECONDS.collect().items():
+        if stage != "total":
+            continue
+        entry = routes.setdefault(route, {"requests": 0, "total_seconds": 0.0, "levels": {}})
+        entry["requests"] += data["count"]
+        entry["total_seconds"] += data["sum"]
+        entry["levels"][level] = entry["levels"].get(level, 0) + data["count"]
+    for entry in routes.values():
+        entry["avg_total_ms"] = round(entry.pop("total_seconds") / entry["requests"] * 1000, 1) if entry["requests"] else 0.0
+    return routes
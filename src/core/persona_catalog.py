@@ -0,0 +1,163 @@
+"""
+海王人设库 - 进程内只解析一次 personas.json，按文件修改时间热加载
+
+- 每种海王模式的人设规整为元组，随机抽取为O(1)
+- 人设ID即人设名（name字段，全库唯一），可直接按ID查找
+- /seaking/personas 的响应体在加载时预先序列化，并计算强ETag，支持 If-None-Match 返回304
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from .log import get_logger
+
+logger = get_logger("config")
+
+# 人设库配置
+PERSONAS_FILE = os.getenv("PERSONAS_FILE", os.path.join("static", "personas.json"))
+PERSONA_RELOAD_CHECK_INTERVAL = float(os.getenv("PERSONA_RELOAD_CHECK_INTERVAL", "1.0"))  # 秒，0为每次都检查
+
+# 人设缺少字段时的默认值
+PERSONA_DEFAULTS = {
+    "persona": "ENTJ-高阶PUA",
+    "gender": "男",
+    "user_gender": "女",
+    "challenge_type": "海王对战",
+    "description": "以刺激、新鲜感制造情绪过山车，擅长用“临时计划+高频邀约”建立优势地位，习惯在临界亲密前切换目标。",
+    "style": "夜生活达人、运动控、擅长即兴决策与肢体语言",
+    "weakness": "耐心差、厌倦快，深度关系维护能力低",
+}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中当前ETag（支持逗号分隔的多个值和 *）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def to_persona_config(persona: Dict[str, Any]) -> Dict[str, Any]:
+    """personas.json 中的人设 -> SeakingChain使用的人设配置"""
+    return {
+        "persona": persona.get("name", PERSONA_DEFAULTS["persona"]),
+        "gender": persona.get("gender", PERSONA_DEFAULTS["gender"]),
+        "user_gender": persona.get("user_gender", PERSONA_DEFAULTS["user_gender"]),
+        "challenge_type": persona.get("challenge_type", PERSONA_DEFAULTS["challenge_type"]),
+        "description": persona.get("description", PERSONA_DEFAULTS["description"]),
+        "style": persona.get("style", PERSONA_DEFAULTS["style"]),
+        "weakness": persona.get("weakness", PERSONA_DEFAULTS["weakness"]),
+    }
+
+
+class PersonaSnapshot:
+    """某一版本人设库的只读视图（整体替换，读取时无需加锁）"""
+
+    __slots__ = ("data", "by_mode", "by_id", "challenge_types", "payload", "etag")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.by_mode: Dict[str, Tuple[Dict[str, Any], ...]] = {}
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        challenge_types = {PERSONA_DEFAULTS["challenge_type"]}
+        for button_type, mode_config in data.items():
+            configs = tuple(to_persona_config(p) for p in (mode_config or {}).get("personas") or ())
+            self.by_mode[button_type] = configs
+            for config in configs:
+                self.by_id.setdefault(config["persona"], config)
+                challenge_types.add(config["challenge_type"])
+        # 人设库与默认人设中出现的挑战类型（前端可传任意字符串，只有这些值按类型区分）
+        self.challenge_types: FrozenSet[str] = frozenset(challenge_types)
+
+        self.payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.payload).hexdigest()[:32] + '"'
+
+
+class PersonaCatalog:
+    """人设库：首次使用时加载，之后按文件mtime热加载
+
+    mtime检查最多每 check_interval 秒一次；新文件解析失败时保留上一版本。
+    """
+
+    def __init__(self, path: str = PERSONAS_FILE, check_interval: float = PERSONA_RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: Optional[PersonaSnapshot] = None
+        self._mtime_ns: Optional[int] = None  # 最近一次尝试加载的文件版本（失败也记录，避免反复解析坏文件）
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def snapshot(self) -> PersonaSnapshot:
+        """当前版本（必要时先检查文件是否更新）"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._next_check:
+            return snapshot
+
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime_ns = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if self._snapshot is None:
+                    logger.error("Failed to load personas: %s", e)
+                    self._snapshot = PersonaSnapshot({})
+                return self._snapshot
+
+            if mtime_ns != self._mtime_ns:
+                self._mtime_ns = mtime_ns
+                self._reload()
+            return self._snapshot
+
+    def _reload(self):
+        """重新解析人设文件，调用方需持有锁"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load personas: %s", e)
+            if self._snapshot is None:
+                self._snapshot = PersonaSnapshot({})
+            return
+
+        self._snapshot = PersonaSnapshot(data)
+        self.reloads += 1
+        logger.info("Personas loaded: %d modes, %d personas", len(data), len(self._snapshot.by_id))
+
+    def get_data(self) -> Dict[str, Any]:
+        """原始人设数据（与 personas.json 结构一致，调用方不应修改）"""
+        return self.snapshot().data
+
+    def random_persona(self, button_type: str) -> Optional[Dict[str, Any]]:
+        """随机抽取某模式下的一个人设配置，模式不存在或为空时返回None"""
+        configs = self.snapshot().by_mode.get(button_type)
+        if not configs:
+            return None
+        return dict(configs[random.randrange(len(configs))])
+
+    def get(self, persona_id: str) -> Optional[Dict[str, Any]]:
+        """按人设ID（人设名）查找人设配置"""
+        config = self.snapshot().by_id.get(persona_id)
+        return dict(config) if config is not None else None
+
+    def is_known_challenge_type(self, challenge_type: Optional[str]) -> bool:
+        """挑战类型是否出现在人设库或默认人设中"""
+        return challenge_type in self.snapshot().challenge_types
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self.snapshot()
+        return {
+            "modes": {button_type: len(configs) for button_type, configs in snapshot.by_mode.items()},
+            "personas": len(snapshot.by_id),
+            "etag": snapshot.etag,
+            "payload_bytes": len(snapshot.payload),
+            "reloads": self.reloads,
+        }
+
+
+# 全局实例
+persona_catalog = PersonaCatalog()
@@ -0,0 +1,128 @@
+"""
+会话请求守卫 - 同一会话的请求串行执行，重复提交合并为一次
+
+- 每个会话一把 asyncio.Lock：同一sid的请求按到达顺序依次读写记忆，互不穿插
+- 单飞合并：同一会话内容完全相同的请求仍在排队或执行时，后到的请求直接等待同一个结果
+  （/chat 共享返回值，/chat/stream 从头回放并跟随同一条事件流），不再发起新的LLM调用
+- 请求在后台任务中执行，发起请求的客户端断开不会中断其他等待者，也不会留下写了一半的记忆
+"""
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from .log import get_logger
+from .metrics import SESSION_COALESCED, SESSION_LOCK_WAITS
+
+logger = get_logger("session")
+
+
+class StreamFlight:
+    """一条正在生成的事件流：已产生的事件全部保留，订阅者从头回放后跟随新事件"""
+
+    def __init__(self):
+        self.events: List[str] = []
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def push(self, event: str):
+        self.events.append(event)
+        self._wake()
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class SessionGuard:
+    """按会话串行化请求，并合并同一会话内重复的在途请求（仅在事件循环线程内使用）"""
+
+    def __init__(self):
+        self._locks: Dict[str, List[Any]] = {}  # session_id -> [asyncio.Lock, 引用数]
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, StreamFlight] = {}
+
+    @contextlib.asynccontextmanager
+    async def lock(self, session_id: str):
+        """持有会话锁期间执行；没有请求引用的锁随即释放"""
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                SESSION_LOCK_WAITS.inc()
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(session_id, None)
+
+    async def run(self, session_id: str, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """在会话锁内执行 factory()；相同 key 的请求在途时等待同一个结果"""
+        flight_key = (session_id, key)
+        task = self._flights.get(flight_key)
+        if task is not None:
+            SESSION_COALESCED.inc(endpoint="chat")
+        else:
+            task = asyncio.ensure_future(self._run_locked(session_id, factory))
+            self._flights[flight_key] = task
+            task.add_done_callback(lambda t: self._finish_flight(flight_key, t))
+        return await asyncio.shield(task)
+
+    async def _run_locked(self, session_id: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.lock(session_id):
+            return await factory()
+
+    def _finish_flight(self, flight_key: Hashable, task: asyncio.Task):
+        self._flights.pop(flight_key, None)
+        # 所有等待者都已断开时，取走异常避免"未获取的异常"告警
+        if not task.cancelled():
+            task.exception()
+
+    def stream(self, session_id: str, key: Hashable, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """在会话锁内生成 factory() 的事件流；相同 key 的流在途时订阅同一条流"""
+        flight_key = (session_id, key)
+        flight = self._streams.get(flight_key)
+        if flight is not None:
+            SESSION_COALESCED.inc(endpoint="stream")
+        else:
+            flight = self._streams[flight_key] = StreamFlight()
+            flight.task = asyncio.ensure_future(self._pump(session_id, flight_key, flight, factory))
+        return flight.subscribe()
+
+    async def _pump(self, session_id: str, flight_key: Hashable, flight: StreamFlight,
+                    factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async with self.lock(session_id):
+                async for event in factory():
+                    flight.push(event)
+        except Exception as e:
+            logger.error("Session stream failed: %s", e)
+        finally:
+            self._streams.pop(flight_key, None)
+            flight.finish()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "locked_sessions": len(self._locks),
+            "in_flight": len(self._flights),
+            "in_flight_streams": len(self._streams),
+            "coalesced": {key[0]: value for key, value in SESSION_COALESCED.collect().items()},
+            "lock_waits": SESSION_LOCK_WAITS.get(),
+        }
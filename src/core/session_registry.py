@@ -0,0 +1,146 @@
+"""
+会话注册表 - 统一管理每个session的记忆管理器与海王对战状态
+
+- 容量上限：超过 max_sessions 时按最近最少访问(LRU)淘汰
+- 滑动过期：每次访问都会续期，活跃用户不会因创建时间过早而被清理
+- 后台清理：过期清理由后台任务定时执行，不占用请求路径
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from .log import get_logger
+
+logger = get_logger("session")
+
+
+class SessionRegistry:
+    """会话注册表
+
+    所有会话放在一个按访问时间排序的OrderedDict中：访问时移到末尾(O(1))。
+    由于TTL对所有会话相同且从最后访问时间起算，队首的会话总是最早过期，
+    清理时只需从队首弹出已过期的会话，每个会话的清理代价为均摊O(1)，
+    LRU淘汰也同样从队首进行。
+    """
+
+    def __init__(self,
+                 factory: Callable[[str], Dict[str, Any]],
+                 ttl_seconds: float,
+                 max_sessions: int,
+                 sweep_interval: float = 60.0):
+        """
+        Args:
+            factory: 新会话数据的创建函数，参数为session_id
+            ttl_seconds: 会话空闲过期时间（秒）
+            max_sessions: 最大会话数
+            sweep_interval: 后台清理间隔（秒）
+        """
+        self.factory = factory
+        self.ttl = ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        self.sweep_interval = sweep_interval
+
+        # session_id -> (最后访问时间, 会话数据)
+        self._sessions: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.stats = {
+            "created": 0,
+            "evicted": 0,
+            "expired": 0,
+        }
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """获取会话数据（不存在时创建），并刷新访问时间"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._sessions[session_id] = (now, entry[1])
+                self._sessions.move_to_end(session_id)
+                return entry[1]
+            if entry is not None:
+                # 已过期但尚未被后台清理，按新会话处理
+                del self._sessions[session_id]
+                self.stats["expired"] += 1
+
+        data = self.factory(session_id)
+        with self._lock:
+            self._sessions[session_id] = (now, data)
+            self._sessions.move_to_end(session_id)
+            self.stats["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                self.stats["evicted"] += 1
+                logger.debug("会话数达到上限，淘汰最久未访问的session: %s", evicted_id)
+        return data
+
+    def peek(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """查看会话数据，不创建也不刷新访问时间"""
+        entry = self._sessions.get(session_id)
+        return entry[1] if entry is not None else None
+
+    def pop(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """移除会话"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        return entry[1] if entry is not None else None
+
+    def sweep(self) -> int:
+        """清理已过期的会话，返回清理数量"""
+        deadline = time.monotonic() - self.ttl
+        expired = 0
+        with self._lock:
+            while self._sessions:
+                session_id, (last_access, _) = next(iter(self._sessions.items()))
+                if last_access >= deadline:
+                    break
+                del self._sessions[session_id]
+                expired += 1
+            self.stats["expired"] += expired
+        if expired:
+            logger.info("清理了 %d 个过期session", expired)
+        return expired
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error("Session sweep failed: %s", e)
+
+    def start(self):
+        """启动后台清理任务（需在事件循环中调用）"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+
+    async def stop(self):
+        """停止后台清理任务"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            active = len(self._sessions)
+        stats.update({
+            "active_sessions": active,
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "sweep_interval_seconds": self.sweep_interval,
+        })
+        return stats
@@ -4,9 +4,33 @@
 恋爱脑分析器 - 简化版本
 """
 import json
-from typing import Dict, Any
+import os
+import re
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 from pydantic import BaseModel
 from .config import llm
+from .keyword_engine import scan_keywords
+from .log import get_logger
+from .metrics import SEVERITY_FALLBACKS
+from .severity_batcher import SEVERITY_BATCH_ENABLED, SeverityBatcher
+from .severity_cache import SEVERITY_CACHE_ENABLED, SeverityCache, make_cache_key
+
+logger = get_logger("severity")
+
+# 分级路由配置：本地关键词分类置信度达到阈值时不再调用LLM
+SEVERITY_TIERED_ENABLED = os.getenv("SEVERITY_TIERED_ENABLED", "false").lower() == "true"
+SEVERITY_LOCAL_CONFIDENCE = float(os.getenv("SEVERITY_LOCAL_CONFIDENCE", "0.75"))
+SEVERITY_LOCAL_MAX_CHARS = int(os.getenv("SEVERITY_LOCAL_MAX_CHARS", "80"))
+
+# 本地分类的基础置信度（重/危一律交给LLM复核）
+LOCAL_BASE_CONFIDENCE = {"无": 0.85, "轻": 0.8, "中": 0.6}
+# 上下文中近期出现过重度/危险记录
+_RECENT_HIGH_RISK_RE = re.compile(r"风险历史：[^|]*[重危]级")
+# 关键词降级分析用到的关键词表
+_FALLBACK_KEYWORD_GROUPS = ("love", "risk", "large_amount")
+# 大额转账意愿需要同时出现数字（正则在C层扫描，长消息上比逐字符 isdigit 快得多）
+_DIGIT_RE = re.compile(r"\d")
 
 
 class SeverityResult(BaseModel):
@@ -16,6 +40,7 @@ class SeverityResult(BaseModel):
     signals: list = []
     switch_to_help: bool = False
     confidence: float = 0.0
+    fallback: bool = False  # LLM调用或解析失败后的关键词兜底结果
 
 
 class SeverityAnalyzer:
@@ -24,6 +49,23 @@ class SeverityAnalyzer:
     def __init__(self):
         self.llm = llm(temperature=0.1)
         
+        # 分析结果缓存（仅缓存LLM成功解析的结果）
+        self.cache = SeverityCache.from_env() if SEVERITY_CACHE_ENABLED else None
+        
+        # 跨用户微批处理（仅异步分析路径）
+        self.batcher = SeverityBatcher(self) if SEVERITY_BATCH_ENABLED else None
+        
+        # 分级路由：本地分类优先，不确定或高风险时才升级到LLM
+        self.tiered_enabled = SEVERITY_TIERED_ENABLED
+        self.local_confidence_threshold = SEVERITY_LOCAL_CONFIDENCE
+        self._tier_lock = threading.Lock()
+        self.tier_stats = {
+            "local": 0,
+            "llm": 0,
+            "escalated_high_risk": 0,
+            "escalated_low_confidence": 0,
+        }
+        
         # 动态人设模板字典
         self.answerstyle = {
             "无": {
@@ -58,8 +100,8 @@ class SeverityAnalyzer:
             }
         }
         
-        # 分析prompt
-        self.prompt_template = """你是"恋爱脑程度识别器"。仔细分析用户的恋爱脑程度，严格按照标准评分，只输出JSON格式。
+        # 评分标准（单条与批量分析共用）
+        self.criteria_prompt = """你是"恋爱脑程度识别器"。仔细分析用户的恋爱脑程度，严格按照标准评分，只输出JSON格式。
 
             ## 评分标准
             - **无风险(0):** 非恋爱话题，如日常闲聊、工作学习、兴趣爱好等
@@ -80,13 +122,25 @@ class SeverityAnalyzer:
             2. 如果用户谈论的是恋爱相关话题（他、她、男朋友、女朋友、恋爱、分手、复合、挽回、喜欢、爱、不爱、出轨、背叛、冷暴力、PUA、控制、依赖、焦虑、消息、回复、朋友圈、约会、礼物、转账、借钱、结婚、离婚等），按严重程度评分
             3. 如果不确定，优先判断为轻度而非无风险
 
-            ## 输出格式
+            """
+        
+        # 单条分析prompt
+        self.prompt_template = self.criteria_prompt + """## 输出格式
             {{"index":0-100,"level":"无|轻|中|重|危","signals":["具体风险信号"],"switch_to_help":true|false}}
 
             switch_to_help规则：无风险/轻度/中度=false，重度/危险=true
 
             用户发言：{user_input}
             上下文提要：{context_summary}"""
+        
+        # 批量分析prompt（多个用户的发言合并为一次调用）
+        self.batch_prompt_template = self.criteria_prompt + """## 输出格式
+            以下共{count}条相互独立的发言，逐条分析，只输出一个JSON数组，每条发言对应一个元素，id与发言编号一致：
+            [{{"id":1,"index":0-100,"level":"无|轻|中|重|危","signals":["具体风险信号"],"switch_to_help":true|false}}]
+
+            switch_to_help规则：无风险/轻度/中度=false，重度/危险=true
+
+            {items}"""
 
     def analyze_with_answerstyle(self, user_text: str, context_summary: str = "") -> Dict[str, Any]:
         """
@@ -99,20 +153,116 @@ class SeverityAnalyzer:
         Returns:
             Dict: 包含severity结果和answerstyle模板的完整分析结果
         """
-        # 1. 进行恋爱脑分析
-        severity_result = self.analyze(user_text, context_summary)
+        # 1. 进行恋爱脑分析（分级模式下先尝试本地分类）
+        severity_result = self._route_local(user_text, context_summary)
+        tier = "local" if severity_result is not None else "llm"
+        if severity_result is None:
+            severity_result = self.analyze(user_text, context_summary)
         
-        # 2. 根据级别选择对应的人设模板
-        selected_style = self.answerstyle.get(severity_result.level, self.answerstyle["轻"])
+        # 2. 选择人设模板并构建动态prompt
+        return self._compose_style_result(severity_result, tier)
+
+    async def analyze_with_answerstyle_async(self, user_text: str, context_summary: str = "") -> Dict[str, Any]:
+        """
+        异步版本：分析用户输入并返回对应的人设模板（不阻塞事件循环）
+        
+        Args:
+            user_text: 用户输入文本
+            context_summary: 上下文摘要
+            
+        Returns:
+            Dict: 包含severity结果和answerstyle模板的完整分析结果
+        """
+        severity_result = self._route_local(user_text, context_summary)
+        tier = "local" if severity_result is not None else "llm"
+        if severity_result is None:
+            severity_result = await self.analyze_async(user_text, context_summary)
+        return self._compose_style_result(severity_result, tier)
+
+    def _route_local(self, user_text: str, context_summary: str = "") -> Optional[SeverityResult]:
+        """分级路由：本地分类足够可信时直接返回结果，否则返回None交给LLM"""
+        if not self.tiered_enabled:
+            return None
         
-        # 3. 构建动态prompt内容
+        result = self.classify_local(user_text, context_summary)
+        if result.level in ("重", "危"):
+            self._record_tier("escalated_high_risk")
+            return None
+        if result.confidence < self.local_confidence_threshold:
+            self._record_tier("escalated_low_confidence")
+            return None
+        
+        self._record_tier("local")
+        return result
+
+    def classify_local(self, user_text: str, context_summary: str = "") -> SeverityResult:
+        """
+        本地快速分类：复用关键词/权重表打分，并给出置信度
+        
+        日常话题和简短的轻度消息置信度高；中度、长文本、近期有重度/危险记录时置信度降低；
+        命中重度/危险信号的结果置信度为0，始终需要LLM复核。
+        """
+        # 复用关键词打分，但这是正常的分级结果而非失败兜底，置信度在下面重新计算
+        result = self._keyword_fallback(user_text)
+        result.fallback = False
+        hits = scan_keywords(user_text, _FALLBACK_KEYWORD_GROUPS)
+        
+        if result.level in ("重", "危") or hits.has("large_amount"):
+            confidence = 0.0
+        else:
+            confidence = LOCAL_BASE_CONFIDENCE[result.level]
+            if result.level == "无":
+                # 命中日常话题更可信；未命中恋爱词却出现风险词（如"想死"）则需要复核
+                if scan_keywords(user_text, ("daily",)).has("daily"):
+                    confidence += 0.1
+                if hits.has("risk"):
+                    confidence -= 0.4
+            # 长文本信息更多，关键词表更容易漏判
+            if len(user_text) > SEVERITY_LOCAL_MAX_CHARS:
+                confidence -= 0.2
+            # 近期出现过重度/危险记录，需要LLM判断是否复发或升级
+            if _RECENT_HIGH_RISK_RE.search(context_summary or ""):
+                confidence -= 0.3
+        
+        result.confidence = round(max(0.0, min(confidence, 1.0)), 2)
+        return result
+
+    def _record_tier(self, tier: str):
+        with self._tier_lock:
+            self.tier_stats[tier] += 1
+            if tier != "local":
+                self.tier_stats["llm"] += 1
+
+    def get_tier_stats(self) -> Dict[str, Any]:
+        """分级路由统计：本地命中数、升级到LLM的次数及原因"""
+        with self._tier_lock:
+            stats = dict(self.tier_stats)
+        total = stats["local"] + stats["llm"]
+        stats.update({
+            "enabled": self.tiered_enabled,
+            "confidence_threshold": self.local_confidence_threshold,
+            "llm_calls_saved": stats["local"],
+            "local_ratio": stats["local"] / total if total else 0.0,
+        })
+        return stats
+
+    def _compose_style_result(self, severity_result: SeverityResult, tier: str = "llm") -> Dict[str, Any]:
+        """根据分析结果选择人设模板，组装完整的分析结果"""
+        # 根据级别选择对应的人设模板
+        style_level = self.get_style_level(severity_result.level)
+        selected_style = self.answerstyle[style_level]
+        
+        # 构建动态prompt内容
         dynamic_prompt = self._build_dynamic_prompt(selected_style, severity_result)
         
-        # 4. 返回完整的分析结果 + 人设模板
+        # 返回完整的分析结果 + 人设模板
         return {
             "severity": severity_result.dict(),
             "answerstyle": selected_style,
-            "dynamic_prompt": dynamic_prompt
+            "style_level": style_level,
+            "severity_state": self.build_state_prompt(severity_result),
+            "dynamic_prompt": dynamic_prompt,
+            "severity_tier": tier
         }
 
     def analyze(self, user_text: str, context_summary: str = "") -> SeverityResult:
@@ -126,27 +276,117 @@ class SeverityAnalyzer:
         Returns:
             SeverityResult: 结构化的分析结果
         """
+        # 查询缓存
+        cache_key = make_cache_key(user_text, context_summary) if self.cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return SeverityResult(**cached)
+        
         try:
             # 构建prompt
-            prompt = self.prompt_template.format(
-                user_input=user_text,
-                context_summary=context_summary
-            )
+            prompt = self._build_prompt(user_text, context_summary)
             
             # 调用LLM
             response = self.llm.invoke(prompt)
             content = response.content if hasattr(response, 'content') else str(response)
             
             # 解析JSON结果
-            return self._parse_response(content)
+            result = self._try_parse_response(content)
+            if result is None:
+                SEVERITY_FALLBACKS.inc(reason="parse_error")
+                return self._keyword_fallback(user_text)
+            
+            if cache_key:
+                self.cache.set(cache_key, result.dict())
+            return result
             
         except Exception as e:
-            print(f"LLM分析失败，使用降级策略: {e}")
+            logger.warning("LLM分析失败，使用降级策略: %s", e)
+            SEVERITY_FALLBACKS.inc(reason="llm_error")
             # 降级策略：使用关键词匹配
             return self._keyword_fallback(user_text)
 
+    async def analyze_async(self, user_text: str, context_summary: str = "") -> SeverityResult:
+        """
+        异步分析用户输入的恋爱脑程度（使用ainvoke，不阻塞事件循环）
+        
+        Args:
+            user_text: 用户输入文本
+            context_summary: 上下文摘要
+            
+        Returns:
+            SeverityResult: 结构化的分析结果
+        """
+        cache_key = make_cache_key(user_text, context_summary) if self.cache else None
+        if cache_key:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                return SeverityResult(**cached)
+        
+        if self.batcher is not None:
+            return await self._analyze_batched(user_text, cache_key, context_summary)
+        
+        try:
+            prompt = self._build_prompt(user_text, context_summary)
+            
+            # 异步调用LLM
+            response = await self.llm.ainvoke(prompt)
+            content = response.content if hasattr(response, 'content') else str(response)
+            
+            result = self._try_parse_response(content)
+            if result is None:
+                SEVERITY_FALLBACKS.inc(reason="parse_error")
+                return self._keyword_fallback(user_text)
+            
+            if cache_key:
+                await self.cache.aset(cache_key, result.dict())
+            return result
+            
+        except Exception as e:
+            logger.warning("LLM分析失败，使用降级策略: %s", e)
+            SEVERITY_FALLBACKS.inc(reason="llm_error")
+            return self._keyword_fallback(user_text)
+
+    async def _analyze_batched(self, user_text: str, cache_key: Optional[str], context_summary: str = "") -> SeverityResult:
+        """通过微批处理器分析，单条解析失败或整批失败时各自降级"""
+        try:
+            result = await self.batcher.submit(user_text, context_summary)
+        except Exception as e:
+            logger.warning("LLM批量分析失败，使用降级策略: %s", e)
+            SEVERITY_FALLBACKS.inc(reason="llm_error")
+            return self._keyword_fallback(user_text)
+        
+        if result is None:
+            # 仅该条解析失败，不影响同批其他请求
+            SEVERITY_FALLBACKS.inc(reason="parse_error")
+            return self._keyword_fallback(user_text)
+        
+        if cache_key:
+            await self.cache.aset(cache_key, result.dict())
+        return result
+
+    def _build_prompt(self, user_text: str, context_summary: str = "") -> str:
+        """构建分析prompt"""
+        return self.prompt_template.format(
+            user_input=user_text,
+            context_summary=context_summary
+        )
+
+    def _build_batch_prompt(self, items: List[Tuple[str, str]]) -> str:
+        """构建批量分析prompt，items为[(用户发言, 上下文提要)]"""
+        lines = []
+        for i, (user_text, context_summary) in enumerate(items, 1):
+            lines.append(f"[{i}] 用户发言：{user_text}\n            上下文提要：{context_summary}")
+        return self.batch_prompt_template.format(count=len(items), items="\n            ".join(lines))
+
     def _build_dynamic_prompt(self, style: Dict, severity: SeverityResult) -> str:
         """构建动态注入到全局prompt的内容"""
+        return self.build_style_prompt(style) + self.build_state_prompt(severity)
+
+    @staticmethod
+    def build_style_prompt(style: Dict) -> str:
+        """构建人设模板部分（每个级别固定，可预编译）"""
         return f"""
                 ## 当前响应模式配置
                 {style['roleset']}
@@ -156,15 +396,24 @@ class SeverityAnalyzer:
                 - 输出长度：{style['output_length']}
                 - 特殊限制：{style['restrictions']}
 
-                ## 当前用户状态分析
+"""
+
+    @staticmethod
+    def build_state_prompt(severity: SeverityResult) -> str:
+        """构建当前用户状态部分（每轮对话变化）"""
+        return f"""                ## 当前用户状态分析
                 - 恋爱脑级别：{severity.level}级({severity.index}分)
                 - 识别信号：{', '.join(severity.signals) if severity.signals else '无特殊信号'}
                 - 需要专业帮助：{'是' if severity.switch_to_help else '否'}
                 - 分析置信度：{severity.confidence:.1f}
                 """
 
-    def _parse_response(self, content: str) -> SeverityResult:
-        """解析LLM响应"""
+    def get_style_level(self, level: str) -> str:
+        """返回实际使用的人设级别（未知级别降级为轻度，与answerstyle选择保持一致）"""
+        return level if level in self.answerstyle else "轻"
+
+    def _try_parse_response(self, content: str) -> Optional[SeverityResult]:
+        """解析LLM响应，失败时返回None"""
         try:
             # 查找JSON格式的结果
             start_idx = content.find('{')
@@ -174,67 +423,70 @@ class SeverityAnalyzer:
                 json_str = content[start_idx:end_idx]
                 data = json.loads(json_str)
                 
-                return SeverityResult(
-                    index=data.get("index", 0),
-                    level=data.get("level", "无"),
-                    signals=data.get("signals", []),
-                    switch_to_help=data.get("switch_to_help", False),
-                    confidence=0.9  # 成功解析的置信度
-                )
-            else:
-                # JSON解析失败，使用降级策略
-                return self._keyword_fallback("")
+                return self._result_from_data(data)
+            return None
                 
         except Exception as e:
-            print(f"JSON解析失败: {e}")
-            return self._keyword_fallback("")
+            logger.warning("JSON解析失败: %s", e)
+            return None
+
+    def _parse_batch_response(self, content: str, count: int) -> List[Optional[SeverityResult]]:
+        """解析批量分析响应，按编号返回每条结果，缺失或无法解析的条目为None"""
+        results: List[Optional[SeverityResult]] = [None] * count
+        try:
+            start_idx = content.find('[')
+            end_idx = content.rfind(']') + 1
+            if start_idx == -1 or end_idx <= start_idx:
+                return results
+            items = json.loads(content[start_idx:end_idx])
+        except Exception as e:
+            logger.warning("批量JSON解析失败: %s", e)
+            return results
+        
+        if not isinstance(items, list):
+            return results
+        for position, data in enumerate(items):
+            try:
+                # 优先按id对应，缺少id时按数组顺序
+                slot = int(data.get("id", position + 1)) - 1
+                if 0 <= slot < count and results[slot] is None:
+                    results[slot] = self._result_from_data(data)
+            except Exception as e:
+                logger.warning("JSON解析失败: %s", e)
+        return results
+
+    @staticmethod
+    def _result_from_data(data: Dict[str, Any]) -> SeverityResult:
+        return SeverityResult(
+            index=data.get("index", 0),
+            level=data.get("level", "无"),
+            signals=data.get("signals", []),
+            switch_to_help=data.get("switch_to_help", False),
+            confidence=0.9  # 成功解析的置信度
+        )
 
     def _keyword_fallback(self, user_text: str) -> SeverityResult:
         """降级策略：基于关键词匹配的分析"""
-        # 风险关键词权重
-        risk_keywords = {
-            # 危险信号 (3.0)
-            '自杀': 3.0, '自残': 3.0, '自伤': 3.0, '想死': 3.0,
-            '暴力': 3.0, '威胁': 3.0, '裸聊': 3.0, '未成年': 3.0,
-            
-            # 重度信号 (2.0)
-            '转账': 2.0, '借钱': 2.0, '万': 2.0, '辞职': 2.0,
-            '跟踪': 2.0, '监控': 2.0, '操控': 2.0,
-            
-            # 中度信号 (1.5)
-            '礼物': 1.5, '隐瞒': 1.5, '依赖': 1.5,
-            
-            # 轻度信号 (1.0)
-            '焦虑': 1.0, '担心': 1.0, '消息': 1.0, '回复': 1.0,
-        }
-        
-        # 恋爱相关关键词
-        love_keywords = ['他', '她', '男朋友', '女朋友', '恋爱', '分手', '复合', '挽回', 
-                        '喜欢', '爱', '不爱', '出轨', '背叛', '冷暴力', 'PUA', '控制', 
-                        '依赖', '焦虑', '消息', '回复', '朋友圈', '约会', '礼物', '转账', 
-                        '借钱', '结婚', '离婚']
-        
+        hits = scan_keywords(user_text, _FALLBACK_KEYWORD_GROUPS)
+
         # 检查是否为恋爱话题
-        if not any(keyword in user_text for keyword in love_keywords):
+        if not hits.has("love"):
             return SeverityResult(
                 index=0,
                 level="无",
                 signals=["非恋爱话题"],
                 switch_to_help=False,
-                confidence=0.8
+                confidence=0.8,
+                fallback=True
             )
         
         # 计算风险分数
-        score = 0.0
-        detected_signals = []
-        
-        for keyword, weight in risk_keywords.items():
-            if keyword in user_text:
-                score += weight
-                detected_signals.append(keyword)
+        risk_hits = hits.group("risk")
+        score = sum(hit.weight for hit in risk_hits)
+        detected_signals = [hit.keyword for hit in risk_hits]
         
         # 检查大额数字
-        if any(char.isdigit() for char in user_text) and any(word in user_text for word in ['万', '千', '转账', '借钱']):
+        if hits.has("large_amount") and _DIGIT_RE.search(user_text):
             score += 1.5
             detected_signals.append('大额转账意愿')
         
@@ -253,18 +505,10 @@ class SeverityAnalyzer:
             level=level,
             signals=detected_signals if detected_signals else ["情绪焦虑"],
             switch_to_help=switch_to_help,
-            confidence=0.6
+            confidence=0.6,
+            fallback=True
         )
 
-    # 兼容性方法
-    async def analyze_async(self, user_text: str, context_summary: str = "") -> SeverityResult:
-        """异步版本（兼容性保留）"""
-        return self.analyze(user_text, context_summary)
-
-    async def analyze_with_answerstyle_async(self, user_text: str, context_summary: str = "") -> Dict[str, Any]:
-        """异步版本（兼容性保留）"""
-        return self.analyze_with_answerstyle(user_text, context_summary)
-
 
 # 全局实例
 severity_analyzer = SeverityAnalyzer()
@@ -278,7 +522,10 @@ def analyze_severity_with_style(user_text: str, context_summary: str = "") -> Di
     """便捷的带人设分析函数"""
     return severity_analyzer.analyze_with_answerstyle(user_text, context_summary)
 
-# 兼容性保留
 async def analyze_severity_async(user_text: str, context_summary: str = "") -> SeverityResult:
-    """异步版本（兼容性保留）"""
-    return severity_analyzer.analyze(user_text, context_summary)
\ No newline at end of file
+    """便捷的异步分析函数"""
+    return await severity_analyzer.analyze_async(user_text, context_summary)
+
+async def analyze_severity_with_style_async(user_text: str, context_summary: str = "") -> Dict[str, Any]:
+    """便捷的异步带人设分析函数"""
+    return await severity_analyzer.analyze_with_answerstyle_async(user_text, context_summary)
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+恋爱脑分析微批处理 - 合并短时间窗口内多个用户的分析请求，一次LLM调用完成
+"""
+import asyncio
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# 批处理配置
+SEVERITY_BATCH_ENABLED = os.getenv("SEVERITY_BATCH_ENABLED", "false").lower() == "true"
+SEVERITY_BATCH_WINDOW_MS = float(os.getenv("SEVERITY_BATCH_WINDOW_MS", "10"))
+SEVERITY_BATCH_MAX_SIZE = int(os.getenv("SEVERITY_BATCH_MAX_SIZE", "8"))
+
+
+class SeverityBatcher:
+    """分析请求微批处理器
+
+    第一个请求到达后开始计时，窗口内到达的请求合并为一批（达到上限立即发送），
+    用一条多条目prompt调用LLM，再把逐条解析的结果分发给各自等待的请求。
+    单条解析失败时该条结果为None，由调用方单独降级；整批调用失败时异常会
+    传给批内所有请求。
+    """
+
+    def __init__(self,
+                 analyzer,
+                 window_ms: float = SEVERITY_BATCH_WINDOW_MS,
+                 max_size: int = SEVERITY_BATCH_MAX_SIZE):
+        """
+        Args:
+            analyzer: SeverityAnalyzer实例（提供llm、prompt构建与解析）
+            window_ms: 收集窗口（毫秒）
+            max_size: 单批最大条目数
+        """
+        self.analyzer = analyzer
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "batches": 0,
+            "llm_items": 0,
+            "max_batch_size": 0,
+            "item_parse_failures": 0,
+            "batch_failures": 0,
+        }
+
+    async def submit(self, user_text: str, context_summary: str = "") -> Optional[Any]:
+        """提交一条分析请求，返回SeverityResult；该条解析失败时返回None"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_text, context_summary, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        """发送当前积攒的请求"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, str, asyncio.Future]]):
+        # 同一批内完全相同的请求只分析一次
+        items: List[Tuple[str, str]] = list(dict.fromkeys((text, context) for text, context, _ in batch))
+
+        try:
+            results = await self._classify(items)
+        except Exception as e:
+            self._record(len(batch), len(items), failed=True)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._record(len(batch), len(items), parse_failures=sum(1 for r in results if r is None))
+        by_item = dict(zip(items, results))
+        for text, context, future in batch:
+            if not future.done():
+                result = by_item[(text, context)]
+                future.set_result(result.copy() if result is not None else None)
+
+    async def _classify(self, items: List[Tuple[str, str]]) -> List[Optional[Any]]:
+        """调用LLM分析一批条目，单条时沿用原有单条prompt"""
+        analyzer = self.analyzer
+        if len(items) == 1:
+            prompt = analyzer._build_prompt(*items[0])
+        else:
+            prompt = analyzer._build_batch_prompt(items)
+
+        response = await analyzer.llm.ainvoke(prompt)
+        content = response.content if hasattr(response, 'content') else str(response)
+
+        if len(items) == 1:
+            return [analyzer._try_parse_response(content)]
+        return analyzer._parse_batch_response(content, len(items))
+
+    def _record(self, requests: int, llm_items: int, parse_failures: int = 0, failed: bool = False):
+        with self._lock:
+            self.stats["requests"] += requests
+            self.stats["batches"] += 1
+            self.stats["llm_items"] += llm_items
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], requests)
+            self.stats["item_parse_failures"] += parse_failures
+            if failed:
+                self.stats["batch_failures"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            "window_ms": self.window * 1000,
+            "max_size": self.max_size,
+            "avg_batch_size": stats["requests"] / stats["batches"] if stats["batches"] else 0.0,
+        })
+        return stats
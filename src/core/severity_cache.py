@@ -0,0 +1,226 @@
+"""
+恋爱脑分析结果缓存 - 进程内LRU+TTL，可选Redis二级缓存
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .log import get_logger
+
+logger = get_logger("severity")
+
+# 缓存配置
+SEVERITY_CACHE_ENABLED = os.getenv("SEVERITY_CACHE_ENABLED", "true").lower() == "true"
+SEVERITY_CACHE_SIZE = int(os.getenv("SEVERITY_CACHE_SIZE", "2048"))
+SEVERITY_CACHE_TTL = int(os.getenv("SEVERITY_CACHE_TTL", "3600"))  # 秒
+SEVERITY_CACHE_REDIS = os.getenv("SEVERITY_CACHE_REDIS", "false").lower() == "true"
+
+# 归一化时去除的空白与句末标点
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[。.!！?？~～…、,，]+$")
+# 上下文中每轮都会变化、但不影响判定的计数信息
+_CONTEXT_COUNTER_RE = re.compile(r"(已?对话\d+轮|已压缩\d+次)\s*\|?\s*")
+
+
+def normalize_text(text: str) -> str:
+    """归一化用户输入：全半角统一、小写、去空白、去句末标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _WHITESPACE_RE.sub("", text)
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def context_digest(context_summary: str) -> str:
+    """上下文摘要的短摘要（忽略对话轮数等计数器）"""
+    stable = _CONTEXT_COUNTER_RE.sub("", context_summary or "").strip()
+    return hashlib.sha1(stable.encode("utf-8")).hexdigest()[:16]
+
+
+def make_cache_key(user_text: str, context_summary: str = "") -> str:
+    """由归一化文本和上下文摘要生成缓存键"""
+    raw = f"{normalize_text(user_text)}\x00{context_digest(context_summary)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SeverityCache:
+    """分析结果缓存
+
+    一级缓存为进程内LRU（容量上限 + TTL过期）；开启Redis二级缓存后，
+    一级未命中时会查询Redis，使多个worker之间共享命中结果。
+    缓存值为SeverityResult的dict形式。
+    """
+
+    def __init__(self,
+                 maxsize: int = SEVERITY_CACHE_SIZE,
+                 ttl: int = SEVERITY_CACHE_TTL,
+                 redis_client=None,
+                 async_redis_client=None,
+                 key_prefix: str = "severity_cache"):
+        """
+        Args:
+            maxsize: 一级缓存最大条目数
+            ttl: 缓存有效期（秒）
+            redis_client: 可选的同步Redis客户端（二级缓存）
+            async_redis_client: 可选的异步Redis客户端（二级缓存）
+            key_prefix: Redis键名前缀
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.key_prefix = key_prefix
+
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "l2_hits": 0,
+            "l2_errors": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "SeverityCache":
+        """按环境变量创建缓存（SEVERITY_CACHE_REDIS=true 时启用Redis二级缓存）"""
+        redis_client = None
+        async_redis_client = None
+        if SEVERITY_CACHE_REDIS:
+            try:
+                import redis
+                import redis.asyncio as aioredis
+
+                redis_config = {
+                    "host": os.getenv("REDIS_HOST", "localhost"),
+                    "port": int(os.getenv("REDIS_PORT", "6379")),
+                    "db": int(os.getenv("REDIS_DB", "0")),
+                    "password": os.getenv("REDIS_PASSWORD"),
+                    "decode_responses": True,
+                }
+                redis_client = redis.Redis(**redis_config)
+                async_redis_client = aioredis.Redis(**redis_config)
+            except Exception as e:
+                logger.error("Severity cache Redis init failed, using local cache only: %s", e)
+        return cls(redis_client=redis_client, async_redis_client=async_redis_client)
+
+    # ---- 一级缓存 ----
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _record(self, hit: bool, l2: bool = False):
+        with self._lock:
+            self.stats["hits" if hit else "misses"] += 1
+            if l2:
+                self.stats["l2_hits"] += 1
+
+    def _record_l2_error(self, e: Exception):
+        with self._lock:
+            self.stats["l2_errors"] += 1
+        logger.error("Severity cache Redis access failed: %s", e)
+
+    # ---- 同步接口 ----
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get_local(key)
+        if value is not None:
+            self._record(hit=True)
+            return value
+
+        if self.redis_client is not None:
+            try:
+                raw = self.redis_client.get(f"{self.key_prefix}:{key}")
+                if raw:
+                    value = json.loads(raw)
+                    self._set_local(key, value)
+                    self._record(hit=True, l2=True)
+                    return value
+            except Exception as e:
+                self._record_l2_error(e)
+
+        self._record(hit=False)
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self._set_local(key, value)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.set(f"{self.key_prefix}:{key}",
+                                      json.dumps(value, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                self._record_l2_error(e)
+
+    # ---- 异步接口 ----
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get_local(key)
+        if value is not None:
+            self._record(hit=True)
+            return value
+
+        if self.async_redis_client is not None:
+            try:
+                raw = await self.async_redis_client.get(f"{self.key_prefix}:{key}")
+                if raw:
+                    value = json.loads(raw)
+                    self._set_local(key, value)
+                    self._record(hit=True, l2=True)
+                    return value
+            except Exception as e:
+                self._record_l2_error(e)
+
+        self._record(hit=False)
+        return None
+
+    async def aset(self, key: str, value: Dict[str, Any]):
+        self._set_local(key, value)
+        if self.async_redis_client is not None:
+            try:
+                await self.async_redis_client.set(f"{self.key_prefix}:{key}",
+                                                  json.dumps(value, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                self._record_l2_error(e)
+
+    # ---- 统计 ----
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            size = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "redis_enabled": self.redis_client is not None,
+        })
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
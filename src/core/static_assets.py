@@ -0,0 +1,278 @@
+"""
+静态资源 - 启动时预压缩，按Accept-Encoding协商，带校验器与内容哈希URL
+
+- 启动时读取 static/ 下的全部文件，文本类资源预先压缩为gzip（安装了brotli时再生成br），
+  请求时只做内存查找，不再逐次读盘或压缩
+- 每个资源带强ETag与Last-Modified，If-None-Match / If-Modified-Since 命中时返回304
+- HTML中引用的 /static/xxx 在构建时改写为内容哈希URL（如 /static/styles.1a2b3c4d5e.css），
+  哈希URL长期缓存（immutable），HTML与未带哈希的URL使用 no-cache 每次重新验证
+- 开发环境开启reload，文件变化后自动重新构建
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from .log import get_logger
+from .persona_catalog import etag_matches
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只提供gzip
+    brotli = None
+
+logger = get_logger("static")
+
+# 静态资源配置
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+STATIC_MIN_COMPRESS_BYTES = int(os.getenv("STATIC_MIN_COMPRESS_BYTES", "256"))
+STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))
+STATIC_RELOAD_CHECK_INTERVAL = float(os.getenv("STATIC_RELOAD_CHECK_INTERVAL", "1.0"))  # 秒
+
+# 值得压缩的文本类型
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+# HTML/CSS中对本地静态资源的引用
+_STATIC_REF_RE = re.compile(r"""(?<=["'(])/static/([^"')?#\s]+)""")
+# 内容哈希URL：name.<10位哈希>.ext
+_HASHED_NAME_RE = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{10})(?P<ext>\.[^./]+)$")
+
+ENCODING_SUFFIX = {"br": "-br", "gzip": "-gz", "identity": ""}
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """解析Accept-Encoding为 {编码: q值}"""
+    accepted: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        parts = item.strip().split(";")
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class StaticAsset:
+    """一个静态资源的全部预计算表示"""
+
+    __slots__ = ("name", "hashed_name", "content_type", "bodies", "etag_base", "last_modified", "mtime")
+
+    def __init__(self, name: str, raw: bytes, mtime: float, content_type: str):
+        self.name = name
+        self.content_type = content_type
+        self.mtime = int(mtime)
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+
+        digest = hashlib.sha256(raw).hexdigest()
+        self.etag_base = digest[:32]
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{digest[:10]}{ext}"
+
+        # 编码 -> 响应体；压缩后没有变小的表示不保留
+        self.bodies: Dict[str, bytes] = {"identity": raw}
+        if len(raw) >= STATIC_MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+            gz = gzip.compress(raw, compresslevel=9, mtime=0)
+            if len(gz) < len(raw):
+                self.bodies["gzip"] = gz
+            if brotli is not None:
+                br = brotli.compress(raw, quality=11)
+                if len(br) < len(raw):
+                    self.bodies["br"] = br
+
+    def etag(self, encoding: str) -> str:
+        """强ETag，不同编码的表示使用不同的ETag"""
+        return f'"{self.etag_base}{ENCODING_SUFFIX[encoding]}"'
+
+    def all_etags(self) -> List[str]:
+        return [self.etag(encoding) for encoding in self.bodies]
+
+    def negotiate(self, accept_encoding: Optional[str]) -> str:
+        """按Accept-Encoding选择编码：br优先，其次gzip，都不接受时返回原文"""
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = "identity", 0.0
+        for encoding in ("br", "gzip"):
+            q = accepted.get(encoding, wildcard)
+            if encoding in self.bodies and q > best_q:
+                best, best_q = encoding, q
+        return best
+
+
+class StaticAssets:
+    """静态资源集合：启动时构建，开启reload时文件变化后重新构建"""
+
+    def __init__(self, directory: str = STATIC_DIR, reload: bool = False,
+                 check_interval: float = STATIC_RELOAD_CHECK_INTERVAL):
+        self.directory = directory
+        self.reload = reload
+        self.check_interval = check_interval
+        self._assets: Dict[str, StaticAsset] = {}
+        self._hashed: Dict[str, StaticAsset] = {}
+        self._signature: Tuple[Tuple[str, int], ...] = ()
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.not_modified = 0
+        self.build()
+
+    def _scan(self) -> Tuple[Tuple[str, int], ...]:
+        """目录下全部文件及其mtime（用于判断是否需要重新构建）"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    entries.append((os.path.relpath(path, self.directory).replace(os.sep, "/"),
+                                    os.stat(path).st_mtime_ns))
+                except OSError:
+                    continue
+        return tuple(sorted(entries))
+
+    def build(self):
+        """读取并预压缩全部资源；HTML/CSS中的静态引用改写为内容哈希URL"""
+        with self._lock:
+            signature = self._scan()
+            raw_files: Dict[str, Tuple[bytes, float]] = {}
+            for name, _ in signature:
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path, "rb") as f:
+                        raw_files[name] = (f.read(), os.stat(path).st_mtime)
+                except OSError as e:
+                    logger.warning("Failed to read static asset %s: %s", name, e)
+
+            assets: Dict[str, StaticAsset] = {}
+            # 先构建被引用的资源，再构建引用它们的HTML/CSS（改写后的内容决定它们自己的哈希）
+            referencing = [name for name in raw_files if name.endswith((".html", ".css"))]
+            for name, (raw, mtime) in raw_files.items():
+                if name not in referencing:
+                    assets[name] = StaticAsset(name, raw, mtime, self._content_type(name))
+            for name in sorted(referencing, key=lambda n: n.endswith(".html")):
+                raw, mtime = raw_files[name]
+                assets[name] = StaticAsset(name, self._rewrite_refs(raw, assets), mtime, self._content_type(name))
+
+            self._assets = assets
+            self._hashed = {asset.hashed_name: asset for asset in assets.values()}
+            self._signature = signature
+            self._next_check = time.monotonic() + self.check_interval
+            self.builds += 1
+        logger.info("Static assets built: %d files, brotli=%s", len(assets), brotli is not None)
+
+    @staticmethod
+    def _content_type(name: str) -> str:
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/json", "application/javascript"):
+            content_type += "; charset=utf-8"
+        return content_type
+
+    @staticmethod
+    def _rewrite_refs(raw: bytes, assets: Dict[str, StaticAsset]) -> bytes:
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            return raw
+
+        def replace(match: "re.Match[str]") -> str:
+            asset = assets.get(match.group(1))
+            return f"/static/{asset.hashed_name}" if asset else match.group(0)
+
+        return _STATIC_REF_RE.sub(replace, text).encode("utf-8")
+
+    def _maybe_reload(self):
+        if not self.reload or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_interval
+        if self._scan() != self._signature:
+            self.build()
+
+    def lookup(self, path: str) -> Tuple[Optional[StaticAsset], bool]:
+        """按请求路径查找资源，返回 (资源, 是否为当前内容哈希URL)
+
+        哈希过期的URL（旧页面引用的上一版本）回退到当前内容，但不作为长期缓存返回。
+        """
+        self._maybe_reload()
+        asset = self._hashed.get(path)
+        if asset is not None:
+            return asset, True
+        asset = self._assets.get(path)
+        if asset is None:
+            match = _HASHED_NAME_RE.match(path)
+            if match:
+                asset = self._assets.get(match.group("stem") + match.group("ext"))
+        return asset, False
+
+    def url(self, name: str) -> str:
+        """资源的内容哈希URL（模板/代码中引用静态资源时使用）"""
+        asset = self._assets.get(name)
+        return f"/static/{asset.hashed_name}" if asset else f"/static/{name}"
+
+    def response(self, path: str, request: Request) -> Optional[Response]:
+        """构造资源响应（含304与编码协商），资源不存在时返回None"""
+        asset, immutable = self.lookup(path)
+        if asset is None:
+            return None
+
+        encoding = asset.negotiate(request.headers.get("accept-encoding"))
+        headers = {
+            "ETag": asset.etag(encoding),
+            "Last-Modified": asset.last_modified,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": (f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+                              if immutable else "no-cache"),
+        }
+
+        if self._not_modified(request, asset):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        body = asset.bodies[encoding]
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=headers, media_type=asset.content_type)
+        return Response(content=body, headers=headers, media_type=asset.content_type)
+
+    @staticmethod
+    def _not_modified(request: Request, asset: StaticAsset) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            # 同一资源不同编码的ETag都视为命中（内容相同）
+            return any(etag_matches(if_none_match, etag) for etag in asset.all_etags())
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= asset.mtime
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def get_stats(self) -> Dict[str, object]:
+        assets = list(self._assets.values())
+        return {
+            "assets": len(assets),
+            "brotli_enabled": brotli is not None,
+            "reload": self.reload,
+            "builds": self.builds,
+            "not_modified": self.not_modified,
+            "bytes": {
+                encoding: sum(len(a.bodies[encoding]) for a in assets if encoding in a.bodies)
+                for encoding in ("identity", "gzip", "br")
+            },
+        }
@@ -2,5 +2,6 @@
 from .memory_manager import SmartMemoryManager
 from .memory_factory import MemoryManagerFactory
 from .redis_memory_manager import RedisMemoryManager
+from .async_redis_memory_manager import AsyncRedisMemoryManager
 
-__all__ = ['SmartMemoryManager', 'MemoryManagerFactory', 'RedisMemoryManager']
+__all__ = ['SmartMemoryManager', 'MemoryManagerFactory', 'RedisMemoryManager', 'AsyncRedisMemoryManager']
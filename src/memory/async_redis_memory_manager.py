@@ -0,0 +1,170 @@
+"""
+基于redis.asyncio的异步Redis记忆管理器 - 接口与SmartMemoryManager/RedisMemoryManager一致，
+方法为协程，Redis读写不阻塞事件循环
+"""
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from .memory_manager import build_user_profile
+from .redis_memory_manager import (ADD_INTERACTION_LUA, REDIS_CONNECT_TIMEOUT, REDIS_MAX_CONNECTIONS,
+                                   REDIS_SOCKET_TIMEOUT, RedisMemoryBase, build_user_analytics,
+                                   get_connection_pool)
+
+_async_connection_pools: Dict[Tuple[str, int, int, Optional[str]], aioredis.ConnectionPool] = {}
+_async_pool_lock = threading.Lock()
+
+
+def get_async_connection_pool(host: str = "localhost", port: int = 6379, db: int = 0,
+                              password: Optional[str] = None) -> aioredis.ConnectionPool:
+    """获取（或创建）进程级共享的异步Redis连接池
+
+    连通性通过同步连接池的一次PING确认（会话在同步代码中创建，无法await），
+    失败时抛出异常，由工厂回退到内存模式；与同步连接池共用失败退避，Redis故障期间直接失败。
+    """
+    key = (host, port, db, password)
+    pool = _async_connection_pools.get(key)
+    if pool is not None:
+        return pool
+
+    get_connection_pool(host, port, db, password)
+    with _async_pool_lock:
+        pool = _async_connection_pools.get(key)
+        if pool is None:
+            pool = aioredis.ConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                password=password,
+                decode_responses=True,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT
+            )
+            _async_connection_pools[key] = pool
+    return pool
+
+
+class AsyncRedisMemoryManager(RedisMemoryBase):
+    """基于redis.asyncio的长期记忆管理器
+
+    数据结构、Lua写入脚本和返回格式与RedisMemoryManager完全相同（两者可读写同一份数据），
+    区别在于所有访问Redis的方法都是协程；互不依赖的读取用asyncio.gather并发发出。
+    """
+
+    def __init__(self,
+                 redis_host: str = "localhost",
+                 redis_port: int = 6379,
+                 redis_db: int = 0,
+                 redis_password: Optional[str] = None,
+                 user_id: Optional[str] = None,
+                 max_tokens: int = 1500,
+                 summary_trigger_ratio: float = 0.8,
+                 memory_ttl: int = 7 * 24 * 3600,  # 7天过期
+                 redis_client: Optional[aioredis.Redis] = None):
+        """
+        初始化异步Redis记忆管理器
+
+        Args:
+            redis_host: Redis主机地址
+            redis_port: Redis端口
+            redis_db: Redis数据库编号
+            redis_password: Redis密码
+            user_id: 用户ID，用于多用户隔离
+            max_tokens: 最大token数量
+            summary_trigger_ratio: 压缩触发比例
+            memory_ttl: 长期记忆TTL（秒）
+            redis_client: 可选的已有异步Redis客户端（需decode_responses=True），传入时忽略连接参数
+        """
+        # Redis连接（所有用户共享进程级连接池）
+        self.redis_client = redis_client or aioredis.Redis(
+            connection_pool=get_async_connection_pool(redis_host, redis_port, redis_db, redis_password)
+        )
+        self._add_interaction_script = self.redis_client.register_script(ADD_INTERACTION_LUA)
+
+        super().__init__(user_id=user_id, memory_ttl=memory_ttl)
+
+    async def add_interaction(self, user_input: str, ai_response: str,
+                              love_brain_level: str = None, risk_signals: List[str] = None) -> int:
+        """添加一轮对话到记忆中（Redis写入通过Lua脚本一次往返完成），返回本轮轮次"""
+        # 添加到短期记忆（内存窗口）
+        self.memory.save_context(
+            {"input": user_input},
+            {"output": ai_response}
+        )
+
+        # 更新长期记忆（Redis）并刷新TTL
+        return int(await self._add_interaction_script(
+            keys=self._memory_keys(),
+            args=self._interaction_args(user_input, love_brain_level, risk_signals)
+        ))
+
+    async def get_memory_stats(self) -> Dict[str, Any]:
+        """获取记忆统计信息（字段与SmartMemoryManager一致）"""
+        client = self.redis_client
+        return self._build_memory_stats(*await asyncio.gather(
+            client.hget(f"{self.key_prefix}:metadata", "conversation_count"),
+            client.hgetall(f"{self.key_prefix}:user_patterns"),
+            client.llen(f"{self.key_prefix}:risk_history")
+        ))
+
+    async def get_memory_context_for_tool(self) -> str:
+        """为工具获取记忆上下文 - 与SmartMemoryManager格式一致"""
+        client = self.redis_client
+        return self._format_tool_context(*await asyncio.gather(
+            client.hget(f"{self.key_prefix}:metadata", "conversation_count"),
+            client.lindex(f"{self.key_prefix}:risk_history", 0),
+            client.hgetall(f"{self.key_prefix}:user_patterns"),
+            client.lindex(f"{self.key_prefix}:key_insights", 0)
+        ))
+
+    async def get_context_summary(self) -> str:
+        """获取上下文摘要（从Redis读取长期记忆）"""
+        client = self.redis_client
+        try:
+            return self._format_context_summary(*await asyncio.gather(
+                client.hget(f"{self.key_prefix}:metadata", "conversation_count"),
+                client.hgetall(f"{self.key_prefix}:user_patterns"),
+                client.lrange(f"{self.key_prefix}:risk_history", 0, 4)
+            ))
+
+        except Exception as e:
+            return f"无法获取记忆摘要: {str(e)}"
+
+    async def get_long_term_memory(self) -> Dict[str, Any]:
+        """获取长期记忆（结构与SmartMemoryManager.long_term_memory一致，按时间正序）"""
+        data, preferences = await asyncio.gather(
+            self.export_memory_from_redis(),
+            self.redis_client.hgetall(f"{self.key_prefix}:preferences")
+        )
+        return self._long_term_view(data, preferences)
+
+    async def get_user_profile_summary(self) -> Dict[str, Any]:
+        """生成用户画像总结"""
+        return build_user_profile(await self.get_long_term_memory())
+
+    async def clear_session(self):
+        """清除当前会话（保留长期记忆），与SmartMemoryManager一致重置对话轮数"""
+        self.memory.clear()
+        await self.redis_client.hdel(f"{self.key_prefix}:metadata", "conversation_count")
+
+    async def clear_all_memory(self):
+        """清除所有记忆（包括Redis长期记忆）"""
+        await self.redis_client.delete(*self._memory_keys())
+        self.memory.clear()
+
+    async def export_memory_from_redis(self) -> Dict[str, Any]:
+        """从Redis导出完整记忆数据"""
+        client = self.redis_client
+        return self._parse_export(*await asyncio.gather(
+            client.hgetall(f"{self.key_prefix}:metadata"),
+            client.hgetall(f"{self.key_prefix}:user_patterns"),
+            client.lrange(f"{self.key_prefix}:risk_history", 0, -1),
+            client.lrange(f"{self.key_prefix}:key_insights", 0, -1)
+        ))
+
+    async def get_user_analytics(self) -> Dict[str, Any]:
+        """获取用户行为分析报告"""
+        return build_user_analytics(self.user_id, await self.export_memory_from_redis())
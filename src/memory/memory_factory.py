@@ -5,13 +5,17 @@ import os
 from typing import Optional
 from .memory_manager import SmartMemoryManager
 from .redis_memory_manager import RedisMemoryManager
+from .async_redis_memory_manager import AsyncRedisMemoryManager
+from ..core.log import get_logger
+
+logger = get_logger("memory")
 
 class MemoryManagerFactory:
     """记忆管理器工厂类"""
     
     @staticmethod
     def create_memory_manager(
-        storage_type: str = "memory",  # "memory" 或 "redis"
+        storage_type: str = "memory",  # "memory"、"redis" 或 "redis_async"
         user_id: Optional[str] = None,
         max_tokens: int = 1500,
         summary_trigger_ratio: float = 0.8,
@@ -21,17 +25,17 @@ class MemoryManagerFactory:
         创建记忆管理器实例
         
         Args:
-            storage_type: 存储类型 ("memory" 或 "redis")
+            storage_type: 存储类型 ("memory"、"redis" 或 "redis_async")
             user_id: 用户ID（Redis模式必需）
             max_tokens: 最大token数量
             summary_trigger_ratio: 压缩触发比例
             **kwargs: 其他配置参数
         
         Returns:
-            记忆管理器实例
+            记忆管理器实例（redis_async模式下访问Redis的方法为协程）
         """
         
-        if storage_type.lower() == "redis":
+        if storage_type.lower() in ("redis", "redis_async"):
             # Redis模式配置
             redis_config = {
                 "redis_host": os.getenv("REDIS_HOST", "localhost"),
@@ -46,9 +50,12 @@ class MemoryManagerFactory:
             redis_config.update(kwargs)
             
             try:
+                # 共享连接池仅在首次创建时检测连通性，之后创建管理器不发送Redis命令
+                if storage_type.lower() == "redis_async":
+                    return AsyncRedisMemoryManager(**redis_config)
                 return RedisMemoryManager(**redis_config)
             except Exception as e:
-                print(f"Redis连接失败，回退到内存模式: {e}")
+                logger.warning("Redis连接失败，回退到内存模式: %s", e)
                 # 回退到内存模式
                 return SmartMemoryManager(max_tokens=max_tokens, summary_trigger_ratio=summary_trigger_ratio)
         
@@ -57,5 +64,5 @@ class MemoryManagerFactory:
             return SmartMemoryManager(max_tokens=max_tokens, summary_trigger_ratio=summary_trigger_ratio)
 
 # 全局配置
-MEMORY_STORAGE_TYPE = os.getenv("MEMORY_STORAGE_TYPE", "memory")  # "memory" 或 "redis"
+MEMORY_STORAGE_TYPE = os.getenv("MEMORY_STORAGE_TYPE", "memory")  # "memory"、"redis" 或 "redis_async"
 ENABLE_MULTI_USER = os.getenv("ENABLE_MULTI_USER", "false").lower() == "true"
@@ -1,8 +1,130 @@
 from langchain.memory import ConversationBufferWindowMemory
 from langchain.schema import BaseMessage, HumanMessage, AIMessage
-from typing import List, Dict, Any
+from collections import deque
+from itertools import islice
+from typing import List, Dict, Any, Optional, Sequence
 import json
+import logging
 import re
+from .ring_buffer import RingBufferChatHistory
+
+# src.core 包初始化时会导入本模块，不能在顶层导入src.core.log；
+# 与 get_logger("memory") 为同一个logger，级别与采样配置由日志模块统一设置
+logger = logging.getLogger("antilove.memory")
+
+# token估算的字符分类标记：中文（含中文/全角标点）、英文数字、空白与标点
+_CJK_MARK, _ALNUM_MARK, _PUNCT_MARK = "\x01", "\x02", "\x03"
+
+
+def _build_token_class_table() -> Dict[int, Optional[str]]:
+    """构建str.translate分类表，把每个字符映射为所属类别的标记（可同时属于多类）"""
+    table: Dict[int, Optional[str]] = {}
+    for start, end in ((0x4e00, 0x9fff), (0x3000, 0x303f), (0xff00, 0xffef)):
+        for code in range(start, end + 1):
+            table[code] = _CJK_MARK
+    for char in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789":
+        table[ord(char)] = _ALNUM_MARK
+    # 与正则 \s 一致的空白字符（均位于U+3000及以下）以及常见标点
+    for code in range(0x3001):
+        char = chr(code)
+        if char.isspace() or char in ".,!?;:()[]{}\"'-":
+            table[code] = (table.get(code) or "") + _PUNCT_MARK
+    # 原文中的标记字符本身不属于任何类别
+    for mark in (_CJK_MARK, _ALNUM_MARK, _PUNCT_MARK):
+        table[ord(mark)] = None
+    return table
+
+
+_TOKEN_CLASS_TABLE = _build_token_class_table()
+
+
+def count_tokens(text: str) -> int:
+    """估算文本token数：一次translate完成字符分类，再统计各类数量"""
+    if not text:
+        return 0
+    
+    classified = text.translate(_TOKEN_CLASS_TABLE)
+    
+    # GPT-4的token估算规则
+    # 中文：约1.5个字符 = 1个token
+    # 英文：约4个字符 = 1个token
+    # 标点符号：约1个字符 = 1个token
+    chinese_tokens = int(classified.count(_CJK_MARK) / 1.5)
+    english_tokens = int(classified.count(_ALNUM_MARK) / 4)
+    punct_tokens = classified.count(_PUNCT_MARK)
+    
+    return chinese_tokens + english_tokens + punct_tokens
+
+def recent_items(items: Sequence, n: int) -> List:
+    """取序列最后n项（兼容list和deque，deque不支持切片）"""
+    return list(islice(items, max(len(items) - n, 0), None))
+
+def build_user_profile(long_term_memory: Dict[str, Any]) -> Dict[str, Any]:
+    """根据长期记忆生成用户画像总结（内存模式与Redis模式共用）"""
+    profile = {
+        "patterns": {},
+        "risk_trend": "",
+        "personality_traits": [],
+        "summary": ""
+    }
+    
+    # 分析行为模式
+    patterns = long_term_memory["user_patterns"]
+    if patterns:
+        # 按频率排序
+        sorted_patterns = sorted(patterns.items(), key=lambda x: x[1], reverse=True)
+        profile["patterns"] = dict(sorted_patterns[:5])  # 取前5个
+        
+        # 生成模式描述
+        pattern_descriptions = []
+        for pattern, count in sorted_patterns[:3]:
+            if count >= 3:
+                pattern_descriptions.append(f"重度{pattern}")
+            elif count >= 2:
+                pattern_descriptions.append(f"中度{pattern}")
+            else:
+                pattern_descriptions.append(f"轻度{pattern}")
+        
+        if pattern_descriptions:
+            profile["summary"] += f"行为特征：{', '.join(pattern_descriptions)}。"
+    
+    # 分析风险趋势
+    risk_history = long_term_memory["risk_history"]
+    if risk_history:
+        recent_risks = recent_items(risk_history, 5)  # 最近5次
+        high_risk_count = sum(1 for r in recent_risks if r["level"] in ["重", "危"])
+        if high_risk_count >= 3:
+            profile["risk_trend"] = "高风险趋势"
+        elif high_risk_count >= 1:
+            profile["risk_trend"] = "中等风险"
+        else:
+            profile["risk_trend"] = "低风险"
+        
+        profile["summary"] += f" 风险状态：{profile['risk_trend']}。"
+    
+    # 生成个性特征
+    traits = []
+    if patterns.get("情绪依赖", 0) >= 2:
+        traits.append("情感敏感型")
+    if patterns.get("金钱依赖", 0) >= 2:
+        traits.append("经济依赖型")
+    if patterns.get("社交隔离", 0) >= 2:
+        traits.append("社交退缩型")
+    if patterns.get("过度理想化", 0) >= 2:
+        traits.append("理想主义型")
+    if patterns.get("自我怀疑", 0) >= 2:
+        traits.append("自我怀疑型")
+    
+    if traits:
+        profile["personality_traits"] = traits
+        profile["summary"] += f" 个性特征：{', '.join(traits)}。"
+    
+    # 如果没有足够数据，提供默认描述
+    if not profile["summary"]:
+        profile["summary"] = "用户画像数据不足，需要更多对话来生成准确分析。"
+    
+    return profile
+
 
 class SmartMemoryManager:
     """智能记忆管理器 - 支持动态窗口、智能压缩和分级存储"""
@@ -20,9 +142,21 @@ class SmartMemoryManager:
         self.conversation_count = 0
         self.compression_count = 0
         
+        # 记忆压缩配置
+        self.compression_config = {
+            "max_risk_history": 20,
+            "max_key_insights": 10,
+            "max_summaries": 5,
+            "compression_threshold": 0.2  # 20%时触发压缩，更早开始压缩
+        }
+        
         # 动态窗口记忆 - 初始窗口大小
+        # 短期记忆存放在固定容量的环形缓冲区中（每轮2条消息），写入时即计算token；
+        # 压缩窗口只调整容量，不重建memory实例
         self.current_window_size = 8
+        self.chat_history = RingBufferChatHistory(self.current_window_size * 2, count_tokens)
         self.memory = ConversationBufferWindowMemory(
+            chat_memory=self.chat_history,
             memory_key="chat_history",
             return_messages=True,
             k=self.current_window_size,
@@ -31,21 +165,21 @@ class SmartMemoryManager:
             output_key="output"
         )
         
-        # 分级记忆存储
-        self.long_term_memory = {
-            "user_patterns": {},      # 用户行为模式
-            "risk_history": [],       # 风险等级历史（最近20条）
-            "key_insights": [],       # 关键洞察（最近10条）
-            "persona_preferences": {}, # 海王模拟偏好
-            "compressed_summaries": [] # 压缩摘要历史
-        }
+        # 分级记忆存储（列表类记忆使用定长deque，超出上限自动丢弃最旧的条目）
+        self.long_term_memory = self._new_long_term_memory()
         
-        # 记忆压缩配置
-        self.compression_config = {
-            "max_risk_history": 20,
-            "max_key_insights": 10,
-            "max_summaries": 5,
-            "compression_threshold": 0.2  # 20%时触发压缩，更早开始压缩
+        self._long_term_tokens: Optional[int] = None  # 长期记忆token缓存，变更时置空
+
+    def _new_long_term_memory(self, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建长期记忆结构，data为导出的记忆数据时按上限载入"""
+        data = data or {}
+        config = self.compression_config
+        return {
+            "user_patterns": dict(data.get("user_patterns", {})),      # 用户行为模式
+            "risk_history": deque(data.get("risk_history", []), maxlen=config["max_risk_history"]),  # 风险等级历史（最近20条）
+            "key_insights": deque(data.get("key_insights", []), maxlen=config["max_key_insights"]),  # 关键洞察（最近10条）
+            "persona_preferences": dict(data.get("persona_preferences", {})), # 海王模拟偏好
+            "compressed_summaries": deque(data.get("compressed_summaries", []), maxlen=config["max_summaries"]) # 压缩摘要历史
         }
 
     def add_interaction(self, user_input: str, ai_response: str, 
@@ -71,32 +205,24 @@ class SmartMemoryManager:
         usage_ratio = current_tokens / self.max_tokens
         
         if usage_ratio > self.compression_config["compression_threshold"]:
+            # src.core 包初始化时会导入本模块，这里延迟导入避免循环依赖
+            from ..core.metrics import MEMORY_COMPRESSIONS
+            
             self._compress_memory()
             self.compression_count += 1
+            MEMORY_COMPRESSIONS.inc()
 
     def _compress_memory(self):
         """智能记忆压缩"""
         try:
-            # 1. 压缩短期记忆窗口
+            # 1. 压缩短期记忆窗口（缩小环形缓冲区容量，保留最近的消息）
             if self.current_window_size > 4:
                 self.current_window_size = max(4, self.current_window_size - 2)
-                # 重新创建memory实例
-                old_messages = self.memory.chat_memory.messages
-                self.memory = ConversationBufferWindowMemory(
-                    memory_key="chat_history",
-                    return_messages=True,
-                    k=self.current_window_size,
-                    ai_prefix="拽姐",
-                    human_prefix="用户",
-                    output_key="output"
-                )
-                # 保留最近的消息
-                for msg in old_messages[-self.current_window_size*2:]:
-                    if hasattr(msg, 'content'):
-                        self.memory.chat_memory.add_message(msg)
+                self.memory.k = self.current_window_size
+                self.chat_history.set_capacity(self.current_window_size * 2)
             
-            # 2. 生成压缩摘要
-            if len(self.memory.chat_memory.messages) > 6:
+            # 2. 生成压缩摘要（摘要数量由deque上限控制）
+            if len(self.chat_history) > 6:
                 summary = self._generate_compression_summary()
                 if summary:
                     self.long_term_memory["compressed_summaries"].append({
@@ -104,22 +230,17 @@ class SmartMemoryManager:
                         "summary": summary,
                         "window_size": self.current_window_size
                     })
-                    # 限制摘要数量
-                    if len(self.long_term_memory["compressed_summaries"]) > self.compression_config["max_summaries"]:
-                        self.long_term_memory["compressed_summaries"] = self.long_term_memory["compressed_summaries"][-self.compression_config["max_summaries"]:]
+                    self._long_term_tokens = None
             
-            # 3. 维护长期记忆大小
-            self._maintain_long_term_memory()
-            
-            print(f"✅ 记忆压缩完成 - 窗口大小: {self.current_window_size}, 压缩次数: {self.compression_count}")
+            logger.debug("记忆压缩完成 - 窗口大小: %s, 压缩次数: %s", self.current_window_size, self.compression_count)
             
         except Exception as e:
-            print(f"⚠️ 记忆压缩失败: {e}")
+            logger.warning("记忆压缩失败: %s", e)
 
     def _generate_compression_summary(self) -> str:
         """生成压缩摘要 - 极简版本，避免重复"""
         try:
-            messages = self.memory.chat_memory.messages
+            messages = self.chat_history.ring
             if len(messages) < 4:
                 return ""
             
@@ -160,22 +281,13 @@ class SmartMemoryManager:
             return result
             
         except Exception as e:
-            print(f"⚠️ 生成压缩摘要失败: {e}")
+            logger.warning("生成压缩摘要失败: %s", e)
             return ""
 
-    def _maintain_long_term_memory(self):
-        """维护长期记忆大小"""
-        # 风险历史保持最近N条
-        if len(self.long_term_memory["risk_history"]) > self.compression_config["max_risk_history"]:
-            self.long_term_memory["risk_history"] = self.long_term_memory["risk_history"][-self.compression_config["max_risk_history"]:]
-        
-        # 关键洞察保持最近N条
-        if len(self.long_term_memory["key_insights"]) > self.compression_config["max_key_insights"]:
-            self.long_term_memory["key_insights"] = self.long_term_memory["key_insights"][-self.compression_config["max_key_insights"]:]
-
     def _update_long_term_memory(self, user_input: str, ai_response: str, 
                                 love_brain_level: str = None, risk_signals: List[str] = None):
         """更新长期记忆中的关键信息"""
+        self._long_term_tokens = None
         
         # 记录风险等级历史
         if love_brain_level:
@@ -195,72 +307,32 @@ class SmartMemoryManager:
 
     def _detect_user_patterns(self, user_input: str, love_brain_level: str):
         """检测用户恋爱行为模式"""
+        # src.core 包初始化时会导入本模块，这里延迟导入避免循环依赖
+        from ..core.keyword_engine import scan_keywords
+        
         patterns = self.long_term_memory["user_patterns"]
         
         # 关键词检测
-        pattern_keywords = {
-            "金钱依赖": ["转账", "借钱", "投资", "买单", "花钱", "钱", "经济"],
-            "情绪依赖": ["想念", "焦虑", "失眠", "心情", "情绪", "难过", "伤心", "痛苦"],
-            "社交隔离": ["朋友", "家人", "同事", "社交", "联系", "孤立", "孤独"],
-            "时间沉迷": ["整天", "一直", "24小时", "不停", "总是", "时刻", "每时每刻"],
-            "自我怀疑": ["我是不是", "我配吗", "我错了", "我不够好", "自卑"],
-            "过度理想化": ["完美", "理想", "童话", "王子", "公主", "命中注定"],
-            "控制欲": ["管我", "限制", "不允许", "必须", "应该", "要求"]
-        }
-        
-        for pattern_type, keywords in pattern_keywords.items():
-            if any(keyword in user_input for keyword in keywords):
-                if pattern_type not in patterns:
-                    patterns[pattern_type] = 0
-                patterns[pattern_type] += 1
+        for pattern_type in scan_keywords(user_input, ("user_pattern",)).categories("user_pattern"):
+            if pattern_type not in patterns:
+                patterns[pattern_type] = 0
+            patterns[pattern_type] += 1
 
     def _estimate_token_count(self) -> int:
-        """更准确的token数量估算"""
+        """当前记忆的token数量（短期记忆由环形缓冲区累计 + 长期缓存值，无需重新扫描）"""
         try:
-            # 获取当前缓冲区内容
-            buffer_messages = self.memory.chat_memory.messages
-            total_tokens = 0
-            
-            for msg in buffer_messages:
-                if hasattr(msg, 'content'):
-                    content = str(msg.content)
-                    # 更准确的token估算
-                    tokens = self._count_tokens_accurately(content)
-                    total_tokens += tokens
-            
-            # 加上长期记忆的token估算
-            long_term_tokens = self._estimate_long_term_tokens()
+            if self._long_term_tokens is None:
+                self._long_term_tokens = self._estimate_long_term_tokens()
             
-            return total_tokens + long_term_tokens
+            return self.chat_history.total_tokens + self._long_term_tokens
             
         except Exception as e:
-            print(f"⚠️ Token估算失败: {e}")
+            logger.warning("Token估算失败: %s", e)
             return 0
 
     def _count_tokens_accurately(self, text: str) -> int:
         """更准确的token计算"""
-        if not text:
-            return 0
-        
-        # 中文字符（包括标点）
-        chinese_chars = len(re.findall(r'[\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]', text))
-        
-        # 英文字符和数字
-        english_chars = len(re.findall(r'[a-zA-Z0-9]', text))
-        
-        # 空格和标点
-        spaces_punct = len(re.findall(r'[\s\.,!?;:()\[\]{}"\'-]', text))
-        
-        # GPT-4的token估算规则
-        # 中文：约1.5个字符 = 1个token
-        # 英文：约4个字符 = 1个token
-        # 标点符号：约1个字符 = 1个token
-        
-        chinese_tokens = int(chinese_chars / 1.5)
-        english_tokens = int(english_chars / 4)
-        punct_tokens = spaces_punct
-        
-        return chinese_tokens + english_tokens + punct_tokens
+        return count_tokens(text)
 
     def _estimate_long_term_tokens(self) -> int:
         """估算长期记忆的token数量"""
@@ -275,19 +347,19 @@ class SmartMemoryManager:
         # 风险历史
         risk_history = self.long_term_memory["risk_history"]
         if risk_history:
-            risk_text = json.dumps(risk_history[-5:], ensure_ascii=False)  # 只计算最近5条
+            risk_text = json.dumps(recent_items(risk_history, 5), ensure_ascii=False)  # 只计算最近5条
             long_term_tokens += self._count_tokens_accurately(risk_text)
         
         # 关键洞察
         key_insights = self.long_term_memory["key_insights"]
         if key_insights:
-            insights_text = " ".join(key_insights[-3:])  # 只计算最近3条
+            insights_text = " ".join(recent_items(key_insights, 3))  # 只计算最近3条
             long_term_tokens += self._count_tokens_accurately(insights_text)
         
         # 压缩摘要
         compressed_summaries = self.long_term_memory["compressed_summaries"]
         if compressed_summaries:
-            summaries_text = " ".join([s["summary"] for s in compressed_summaries[-2:]])  # 只计算最近2条
+            summaries_text = " ".join([s["summary"] for s in recent_items(compressed_summaries, 2)])  # 只计算最近2条
             long_term_tokens += self._count_tokens_accurately(summaries_text)
         
         return long_term_tokens
@@ -301,9 +373,9 @@ class SmartMemoryManager:
             if hasattr(self.memory, 'prune'):
                 self.memory.prune()
             
-            print(f"✅ 内存优化完成，当前轮次：{self.conversation_count}")
+            logger.debug("内存优化完成，当前轮次：%s", self.conversation_count)
         except Exception as e:
-            print(f"⚠️ 内存优化出现问题：{e}")
+            logger.warning("内存优化出现问题：%s", e)
 
     def get_context_summary(self) -> str:
         """获取上下文摘要供工具使用 - 优化版本"""
@@ -318,7 +390,7 @@ class SmartMemoryManager:
         
         # 添加风险历史摘要
         if self.long_term_memory["risk_history"]:
-            recent_risks = self.long_term_memory["risk_history"][-3:]  # 最近3次
+            recent_risks = recent_items(self.long_term_memory["risk_history"], 3)  # 最近3次
             risk_summary = "，".join([f"{r['level']}级" for r in recent_risks])
             summary_parts.append(f"风险历史：{risk_summary}")
         
@@ -426,15 +498,15 @@ class SmartMemoryManager:
         recent_interactions = []
         
         try:
-            # 从memory获取最近的消息
-            if hasattr(self.memory, 'chat_memory') and hasattr(self.memory.chat_memory, 'messages'):
-                messages = self.memory.chat_memory.messages
+            # 从环形缓冲区获取最近的消息（直接读取记录，无需构造消息对象）
+            if self.chat_history is not None:
+                messages = self.chat_history.ring
                 
                 # 配对用户输入和AI响应
                 for i in range(len(messages) - 1, -1, -2):  # 倒序遍历，每次跳2个
                     if i > 0 and len(recent_interactions) < limit:
-                        ai_msg = messages[i] if hasattr(messages[i], 'content') else None
-                        user_msg = messages[i-1] if hasattr(messages[i-1], 'content') else None
+                        ai_msg = messages[i]
+                        user_msg = messages[i-1]
                         
                         if user_msg and ai_msg:
                             interaction = {
@@ -447,75 +519,17 @@ class SmartMemoryManager:
                 recent_interactions.reverse()
                 
         except Exception as e:
-            print(f"⚠️ 获取最近上下文时出错: {e}")
+            logger.warning("获取最近上下文时出错: %s", e)
         
         return recent_interactions
 
+    def get_long_term_memory(self) -> Dict[str, Any]:
+        """获取长期记忆"""
+        return self.long_term_memory
+
     def get_user_profile_summary(self) -> Dict[str, Any]:
         """生成用户画像总结"""
-        profile = {
-            "patterns": {},
-            "risk_trend": "",
-            "personality_traits": [],
-            "summary": ""
-        }
-        
-        # 分析行为模式
-        patterns = self.long_term_memory["user_patterns"]
-        if patterns:
-            # 按频率排序
-            sorted_patterns = sorted(patterns.items(), key=lambda x: x[1], reverse=True)
-            profile["patterns"] = dict(sorted_patterns[:5])  # 取前5个
-            
-            # 生成模式描述
-            pattern_descriptions = []
-            for pattern, count in sorted_patterns[:3]:
-                if count >= 3:
-                    pattern_descriptions.append(f"重度{pattern}")
-                elif count >= 2:
-                    pattern_descriptions.append(f"中度{pattern}")
-                else:
-                    pattern_descriptions.append(f"轻度{pattern}")
-            
-            if pattern_descriptions:
-                profile["summary"] += f"行为特征：{', '.join(pattern_descriptions)}。"
-        
-        # 分析风险趋势
-        risk_history = self.long_term_memory["risk_history"]
-        if risk_history:
-            recent_risks = risk_history[-5:]  # 最近5次
-            high_risk_count = sum(1 for r in recent_risks if r["level"] in ["重", "危"])
-            if high_risk_count >= 3:
-                profile["risk_trend"] = "高风险趋势"
-            elif high_risk_count >= 1:
-                profile["risk_trend"] = "中等风险"
-            else:
-                profile["risk_trend"] = "低风险"
-            
-            profile["summary"] += f" 风险状态：{profile['risk_trend']}。"
-        
-        # 生成个性特征
-        traits = []
-        if patterns.get("情绪依赖", 0) >= 2:
-            traits.append("情感敏感型")
-        if patterns.get("金钱依赖", 0) >= 2:
-            traits.append("经济依赖型")
-        if patterns.get("社交隔离", 0) >= 2:
-            traits.append("社交退缩型")
-        if patterns.get("过度理想化", 0) >= 2:
-            traits.append("理想主义型")
-        if patterns.get("自我怀疑", 0) >= 2:
-            traits.append("自我怀疑型")
-        
-        if traits:
-            profile["personality_traits"] = traits
-            profile["summary"] += f" 个性特征：{', '.join(traits)}。"
-        
-        # 如果没有足够数据，提供默认描述
-        if not profile["summary"]:
-            profile["summary"] = "用户画像数据不足，需要更多对话来生成准确分析。"
-        
-        return profile
+        return build_user_profile(self.long_term_memory)
 
     def get_memory_stats(self) -> Dict[str, Any]:
         """获取内存使用统计"""
@@ -524,7 +538,7 @@ class SmartMemoryManager:
         return {
             "conversation_count": self.conversation_count,
             "total_interactions": self.conversation_count,
-            "short_term_count": len(self.memory.chat_memory.messages) if hasattr(self.memory, 'chat_memory') else 0,
+            "short_term_count": len(self.chat_history),
             "long_term_count": len(self.long_term_memory["risk_history"]),
             "estimated_tokens": estimated_tokens,
             "max_tokens": self.max_tokens,
@@ -544,22 +558,23 @@ class SmartMemoryManager:
 
     def export_memory(self) -> Dict[str, Any]:
         """导出记忆数据（用于持久化）"""
+        long_term_memory = {
+            key: list(value) if isinstance(value, deque) else value
+            for key, value in self.long_term_memory.items()
+        }
         return {
             "conversation_count": self.conversation_count,
-            "long_term_memory": self.long_term_memory,
+            "long_term_memory": long_term_memory,
             "memory_window": self.current_window_size # 导出当前窗口大小
         }
 
     def import_memory(self, memory_data: Dict[str, Any]):
         """导入记忆数据（用于恢复）"""
         self.conversation_count = memory_data.get("conversation_count", 0)
-        self.long_term_memory = memory_data.get("long_term_memory", {
-            "user_patterns": {},
-            "risk_history": [],
-            "key_insights": [],
-            "persona_preferences": {},
-            "compressed_summaries": []
-        })
+        self.long_term_memory = self._new_long_term_memory(memory_data.get("long_term_memory"))
         self.current_window_size = memory_data.get("memory_window", 8) # 导入窗口大小
+        self.memory.k = self.current_window_size
+        self.chat_history.set_capacity(self.current_window_size * 2)
+        self._long_term_tokens = None
 
 
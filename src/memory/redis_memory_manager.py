@@ -1,45 +1,106 @@
 import redis
 import json
+import os
+import threading
+import time
 import uuid
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 from langchain.memory import ConversationBufferWindowMemory
 from ..core.config import llm
+from ..core.keyword_engine import scan_keywords
+from .memory_manager import build_user_profile
 
-class RedisMemoryManager:
-    """基于Redis的生产级长期记忆管理器"""
+# 进程级共享连接池配置
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "1.0"))  # 建立连接超时，单位秒
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "2.0"))  # 单条命令读写超时，单位秒
+REDIS_RETRY_BACKOFF = float(os.getenv("REDIS_RETRY_BACKOFF", "30"))  # 连通性检测失败后多久内不再重试，单位秒
+
+PoolKey = Tuple[str, int, int, Optional[str]]
+
+_connection_pools: Dict[PoolKey, redis.ConnectionPool] = {}
+_pool_failures: Dict[PoolKey, Tuple[float, str]] = {}  # 连接池key -> (允许重试的时间, 失败原因)
+_pool_lock = threading.Lock()
+
+
+def _check_pool_backoff(key: PoolKey):
+    """上次连通性检测失败且仍在退避窗口内时直接抛出异常，不再连接Redis"""
+    failure = _pool_failures.get(key)
+    if failure is not None and time.monotonic() < failure[0]:
+        raise redis.ConnectionError(f"Redis不可用（{failure[1]}），退避期内不再重试")
+
+
+def get_connection_pool(host: str = "localhost", port: int = 6379, db: int = 0,
+                        password: Optional[str] = None) -> redis.ConnectionPool:
+    """获取（或创建）进程级共享的Redis连接池
     
-    def __init__(self, 
-                 redis_host: str = "localhost", 
-                 redis_port: int = 6379,
-                 redis_db: int = 0,
-                 redis_password: Optional[str] = None,
-                 user_id: Optional[str] = None,
-                 max_tokens: int = 1500,
-                 summary_trigger_ratio: float = 0.8,
-                 memory_ttl: int = 7 * 24 * 3600):  # 7天过期
-        """
-        初始化Redis记忆管理器
-        
-        Args:
-            redis_host: Redis主机地址
-            redis_port: Redis端口
-            redis_db: Redis数据库编号
-            redis_password: Redis密码
-            user_id: 用户ID，用于多用户隔离
-            max_tokens: 最大token数量
-            summary_trigger_ratio: 压缩触发比例
-            memory_ttl: 长期记忆TTL（秒）
-        """
-        # Redis连接
-        self.redis_client = redis.Redis(
-            host=redis_host,
-            port=redis_port,
-            db=redis_db,
-            password=redis_password,
-            decode_responses=True
-        )
-        
+    新建连接池时做一次PING确认Redis可用，之后复用连接池创建的会话不会再发送任何命令。
+    PING失败时抛出异常并记录失败，REDIS_RETRY_BACKOFF 秒内的调用直接失败（不再连接），
+    Redis故障期间新会话可立即回退到内存模式；异步连接池也经过这里的检测。
+    """
+    key = (host, port, db, password)
+    pool = _connection_pools.get(key)
+    if pool is not None:
+        return pool
+    _check_pool_backoff(key)
+    
+    with _pool_lock:
+        pool = _connection_pools.get(key)
+        if pool is None:
+            # 等锁期间其他线程可能刚刚检测失败
+            _check_pool_backoff(key)
+            pool = redis.ConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                password=password,
+                decode_responses=True,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT
+            )
+            try:
+                redis.Redis(connection_pool=pool).ping()
+            except Exception as e:
+                pool.disconnect()
+                _pool_failures[key] = (time.monotonic() + REDIS_RETRY_BACKOFF, str(e))
+                raise
+            _pool_failures.pop(key, None)
+            _connection_pools[key] = pool
+    return pool
+
+# 一轮对话的全部写入在服务端一次完成（计数、行为模式、风险历史、关键洞察、TTL）
+# KEYS: metadata, user_patterns, risk_history, key_insights, preferences
+# ARGV[1]: TTL秒数  ARGV[2]: 命中的行为模式列表(JSON)
+# ARGV[3]/ARGV[4]: 风险记录/关键洞察的JSON片段列表，片段之间填入本轮轮次；为空表示不写入
+ADD_INTERACTION_LUA = """
+local round = redis.call('HINCRBY', KEYS[1], 'conversation_count', 1)
+for _, pattern in ipairs(cjson.decode(ARGV[2])) do
+    redis.call('HINCRBY', KEYS[2], pattern, 1)
+end
+if ARGV[3] ~= '' then
+    redis.call('LPUSH', KEYS[3], table.concat(cjson.decode(ARGV[3]), tostring(round)))
+    redis.call('LTRIM', KEYS[3], 0, 49)
+end
+if ARGV[4] ~= '' then
+    redis.call('LPUSH', KEYS[4], table.concat(cjson.decode(ARGV[4]), tostring(round)))
+    redis.call('LTRIM', KEYS[4], 0, 19)
+end
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ARGV[1])
+end
+return round
+"""
+
+class RedisMemoryBase:
+    """Redis记忆管理器的公共部分：键名、短期记忆窗口、写入参数构建与读取结果格式化
+    
+    不涉及任何I/O，同步(RedisMemoryManager)与异步(AsyncRedisMemoryManager)实现共用，
+    保证两种后端写入的数据和返回的格式完全一致。
+    """
+    
+    def __init__(self, user_id: Optional[str] = None, memory_ttl: int = 7 * 24 * 3600):
         # 用户标识
         self.user_id = user_id or str(uuid.uuid4())
         self.memory_ttl = memory_ttl
@@ -54,121 +115,62 @@ class RedisMemoryManager:
             output_key="output"  # 明确指定输出键，消除警告
         )
         
-        # Redis键名前缀
+        # Redis键名前缀（键在首次写入时由Redis自动创建，构造时不发送任何命令）
         self.key_prefix = f"memory:{self.user_id}"
-        
-        # 初始化长期记忆结构
-        self._initialize_long_term_memory()
     
-    def _initialize_long_term_memory(self):
-        """初始化长期记忆Redis数据结构"""
-        keys = [
-            f"{self.key_prefix}:user_patterns",    # Hash: 用户行为模式
-            f"{self.key_prefix}:risk_history",     # List: 风险历史记录
-            f"{self.key_prefix}:key_insights",     # List: 关键洞察
-            f"{self.key_prefix}:preferences",      # Hash: 用户偏好
-            f"{self.key_prefix}:metadata"          # Hash: 元数据（计数器等）
-        ]
-        
-        # 为所有键设置TTL
-        for key in keys:
-            if not self.redis_client.exists(key):
-                # 初始化空数据结构
-                if "history" in key or "insights" in key:
-                    self.redis_client.lpush(key, "[]")  # 空列表占位符
-                    self.redis_client.lpop(key)  # 立即移除，创建空列表
-                else:
-                    self.redis_client.hset(key, "initialized", "true")
-                    self.redis_client.hdel(key, "initialized")  # 创建空hash
-            
-            self.redis_client.expire(key, self.memory_ttl)
-    
-    def add_interaction(self, user_input: str, ai_response: str, 
-                       love_brain_level: str = None, risk_signals: List[str] = None):
-        """添加一轮对话到记忆中"""
-        # 更新对话计数
-        conversation_count = self.redis_client.hincrby(
-            f"{self.key_prefix}:metadata", 
-            "conversation_count", 
-            1
-        )
-        
-        # 添加到短期记忆（内存窗口）
-        self.memory.save_context(
-            {"input": user_input},
-            {"output": ai_response}
-        )
+    def _interaction_args(self, user_input: str, love_brain_level: str, risk_signals: List[str]) -> List[Any]:
+        """构建一轮对话写入脚本的ARGV
         
-        # 更新长期记忆（Redis）
-        self._update_long_term_memory_redis(
-            user_input, ai_response, love_brain_level, risk_signals, conversation_count
-        )
-        
-        # 刷新TTL
-        self._refresh_ttl()
-    
-    def _update_long_term_memory_redis(self, user_input: str, ai_response: str, 
-                                     love_brain_level: str, risk_signals: List[str], round_num: int):
-        """更新Redis中的长期记忆"""
+        轮次由脚本内的HINCRBY产生，风险记录和关键洞察以JSON片段传入，
+        由脚本在片段之间填入轮次，结果与按轮次直接json.dumps完全一致。
+        """
         
-        # 1. 更新用户行为模式
+        # 1. 用户行为模式（仅重度/危险时统计）
+        patterns = []
         if love_brain_level and love_brain_level in ["重", "危"]:
-            self._detect_and_update_patterns(user_input)
+            patterns = self._detect_patterns(user_input)
         
-        # 2. 记录风险历史
+        # 2. 风险历史（保持不超过50条）
+        risk_pieces = ""
         if love_brain_level:
-            risk_record = {
-                "round": round_num,
+            rest = json.dumps({
                 "level": love_brain_level,
                 "timestamp": datetime.now().isoformat(),
                 "signals": risk_signals or [],
                 "input_preview": user_input[:100]  # 保存前100字符
-            }
-            self.redis_client.lpush(
-                f"{self.key_prefix}:risk_history",
-                json.dumps(risk_record, ensure_ascii=False)
-            )
-            
-            # 保持风险历史不超过50条
-            self.redis_client.ltrim(f"{self.key_prefix}:risk_history", 0, 49)
+            }, ensure_ascii=False)
+            risk_pieces = json.dumps(['{"round": ', ', ' + rest[1:]], ensure_ascii=False)
         
-        # 3. 记录关键洞察
+        # 3. 关键洞察（保持不超过20条）
+        insight_pieces = ""
         if love_brain_level in ["重", "危"]:
-            insight = {
-                "round": round_num,
-                "level": love_brain_level,
-                "content": f"第{round_num}轮：{love_brain_level}级风险 - {user_input[:50]}...",
-                "timestamp": datetime.now().isoformat()
-            }
-            self.redis_client.lpush(
-                f"{self.key_prefix}:key_insights",
-                json.dumps(insight, ensure_ascii=False)
-            )
-            
-            # 保持关键洞察不超过20条
-            self.redis_client.ltrim(f"{self.key_prefix}:key_insights", 0, 19)
-    
-    def _detect_and_update_patterns(self, user_input: str):
-        """检测并更新用户行为模式到Redis"""
-        pattern_keywords = {
-            "金钱依赖": ["转账", "借钱", "投资", "买单", "花钱", "红包", "转钱"],
-            "情绪依赖": ["想念", "焦虑", "失眠", "心情", "情绪", "难过", "开心"],
-            "社交隔离": ["朋友", "家人", "同事", "社交", "联系", "孤独", "alone"],
-            "时间沉迷": ["整天", "一直", "24小时", "不停", "总是", "每天", "时刻"]
-        }
+            content_tail = json.dumps(f"轮：{love_brain_level}级风险 - {user_input[:50]}...", ensure_ascii=False)[1:]
+            insight_pieces = json.dumps([
+                '{"round": ',
+                ', "level": ' + json.dumps(love_brain_level, ensure_ascii=False) + ', "content": "第',
+                content_tail + ', "timestamp": ' + json.dumps(datetime.now().isoformat()) + '}'
+            ], ensure_ascii=False)
         
-        for pattern, keywords in pattern_keywords.items():
-            if any(keyword in user_input for keyword in keywords):
-                self.redis_client.hincrby(
-                    f"{self.key_prefix}:user_patterns",
-                    pattern,
-                    1
-                )
+        return [self.memory_ttl, json.dumps(patterns, ensure_ascii=False), risk_pieces, insight_pieces]
     
-    def get_memory_stats(self) -> Dict[str, Any]:
-        """获取记忆统计信息"""
-        # 从Redis获取长期记忆统计
-        conversation_count = int(self.redis_client.hget(f"{self.key_prefix}:metadata", "conversation_count") or 0)
+    def _detect_patterns(self, user_input: str) -> List[str]:
+        """检测用户行为模式"""
+        return scan_keywords(user_input, ("redis_pattern",)).categories("redis_pattern")
+    
+    def _memory_keys(self) -> List[str]:
+        """长期记忆的全部Redis键（顺序与Lua脚本的KEYS约定一致）"""
+        return [
+            f"{self.key_prefix}:metadata",         # Hash: 元数据（计数器等）
+            f"{self.key_prefix}:user_patterns",    # Hash: 用户行为模式
+            f"{self.key_prefix}:risk_history",     # List: 风险历史记录
+            f"{self.key_prefix}:key_insights",     # List: 关键洞察
+            f"{self.key_prefix}:preferences"       # Hash: 用户偏好
+        ]
+    
+    def _build_memory_stats(self, conversation_count: Optional[str], pattern_data: Dict[str, str],
+                            risk_count: int) -> Dict[str, Any]:
+        """由Redis读取结果构建记忆统计（字段与SmartMemoryManager一致）"""
+        conversation_count = int(conversation_count or 0)
         
         # 估算token使用（短期记忆）
         estimated_tokens = self._estimate_tokens()
@@ -176,114 +178,123 @@ class RedisMemoryManager:
         
         # 获取用户行为模式
         user_patterns = {}
-        pattern_data = self.redis_client.hgetall(f"{self.key_prefix}:user_patterns")
         for pattern, count in pattern_data.items():
             user_patterns[pattern] = int(count)
         
         return {
             "conversation_count": conversation_count,
+            "total_interactions": conversation_count,
+            "short_term_count": len(self.memory.chat_memory.messages),
+            "long_term_count": risk_count,
             "estimated_tokens": estimated_tokens,
             "max_tokens": max_tokens,
             "memory_usage_ratio": estimated_tokens / max_tokens if max_tokens > 0 else 0,
+            "risk_history_count": risk_count,
+            "pattern_count": len(user_patterns),
             "user_patterns": user_patterns,
+            "compression_count": 0,
+            "current_window_size": self.memory.k,
             "storage_type": "redis",
             "user_id": self.user_id
         }
     
-    def get_context_summary(self) -> str:
-        """获取上下文摘要（从Redis读取长期记忆）"""
-        try:
-            # 从Redis获取数据
-            conversation_count = int(self.redis_client.hget(f"{self.key_prefix}:metadata", "conversation_count") or 0)
-            
-            # 获取用户行为模式
-            user_patterns = {}
-            pattern_data = self.redis_client.hgetall(f"{self.key_prefix}:user_patterns")
-            for pattern, count in pattern_data.items():
-                user_patterns[pattern] = int(count)
-            
-            # 获取最近的风险历史
-            risk_history_raw = self.redis_client.lrange(f"{self.key_prefix}:risk_history", 0, 4)
-            risk_history = []
-            for record in risk_history_raw:
-                try:
-                    risk_history.append(json.loads(record))
-                except json.JSONDecodeError:
-                    continue
-            
-            # 构建摘要
-            summary = f"已对话{conversation_count}轮"
-            
-            if user_patterns:
-                pattern_summary = ", ".join([f"{k}({v}次)" for k, v in user_patterns.items() if v > 0])
-                summary += f" | 行为模式: {pattern_summary}"
-            
-            if risk_history:
-                recent_risks = [r["level"] for r in risk_history[:3]]
-                summary += f" | 风险历史: {', '.join(recent_risks)}"
-            
-            return summary
-            
-        except Exception as e:
-            return f"无法获取记忆摘要: {str(e)}"
-    
-    def _estimate_tokens(self) -> int:
-        """估算当前短期记忆的token使用量"""
+    def _format_tool_context(self, conversation_count: Optional[str], latest_risk: Optional[str],
+                             pattern_data: Dict[str, str], latest_insight: Optional[str]) -> str:
+        """由Redis读取结果构建工具用的记忆上下文 - 与SmartMemoryManager格式一致"""
+        # 只在有足够历史时才提供上下文
+        conversation_count = int(conversation_count or 0)
+        if conversation_count <= 1:
+            return ""
+        
+        context_parts = []
+        
+        # 1. 简化的状态信息
+        status_info = [f"对话{conversation_count}轮"]
+        if latest_risk:
+            try:
+                status_info.append(f"风险{json.loads(latest_risk)['level']}级")
+            except (json.JSONDecodeError, KeyError):
+                pass
+        if pattern_data:
+            top_pattern = max(pattern_data.items(), key=lambda x: int(x[1]))
+            if int(top_pattern[1]) >= 2:  # 只显示出现2次以上的模式
+                status_info.append(top_pattern[0])
+        context_parts.append(" | ".join(status_info))
+        
+        # 2. 只显示最近1轮对话的关键信息
         messages = self.memory.chat_memory.messages
-        total_chars = sum(len(msg.content) for msg in messages)
-        # 中文约1.5倍token，英文约0.5倍
-        estimated_tokens = int(total_chars * 0.8)
-        return estimated_tokens
-    
-    def _refresh_ttl(self):
-        """刷新所有记忆键的TTL"""
-        keys = [
-            f"{self.key_prefix}:user_patterns",
-            f"{self.key_prefix}:risk_history", 
-            f"{self.key_prefix}:key_insights",
-            f"{self.key_prefix}:preferences",
-            f"{self.key_prefix}:metadata"
-        ]
+        if len(messages) >= 2:
+            user_input = str(messages[-2].content).strip()
+            if user_input:
+                key_info = user_input[:30].replace('\n', ' ').strip()
+                if len(user_input) > 30:
+                    key_info += "..."
+                context_parts.append(f"上轮: {key_info}")
         
-        for key in keys:
-            self.redis_client.expire(key, self.memory_ttl)
-    
-    def reset_short_term_memory(self):
-        """重置短期记忆，保留长期记忆"""
-        self.memory.clear()
-        # Redis中的长期记忆保持不变
-    
-    def clear_all_memory(self):
-        """清除所有记忆（包括Redis长期记忆）"""
-        keys = [
-            f"{self.key_prefix}:user_patterns",
-            f"{self.key_prefix}:risk_history",
-            f"{self.key_prefix}:key_insights", 
-            f"{self.key_prefix}:preferences",
-            f"{self.key_prefix}:metadata"
-        ]
+        # 3. 只显示最近1个关键洞察
+        if latest_insight:
+            try:
+                content = json.loads(latest_insight).get("content", "")
+            except json.JSONDecodeError:
+                content = ""
+            if "：" in content:
+                insight_content = content.split("：", 1)[1]
+                if insight_content:
+                    context_parts.append(f"洞察: {insight_content[:50]}...")
         
-        # 清除Redis数据
-        self.redis_client.delete(*keys)
+        # 严格控制总长度
+        result = " | ".join(context_parts)
+        if len(result) > 150:
+            result = result[:147] + "..."
         
-        # 清除短期记忆
-        self.memory.clear()
+        return result
     
-    def export_memory_from_redis(self) -> Dict[str, Any]:
-        """从Redis导出完整记忆数据"""
-        data = {}
+    @staticmethod
+    def _format_context_summary(conversation_count: Optional[str], pattern_data: Dict[str, str],
+                                risk_history_raw: List[str]) -> str:
+        """由Redis读取结果构建上下文摘要"""
+        conversation_count = int(conversation_count or 0)
         
-        # 元数据
-        metadata = self.redis_client.hgetall(f"{self.key_prefix}:metadata")
-        data["metadata"] = metadata
+        # 获取用户行为模式
+        user_patterns = {}
+        for pattern, count in pattern_data.items():
+            user_patterns[pattern] = int(count)
         
-        # 用户模式
-        user_patterns = self.redis_client.hgetall(f"{self.key_prefix}:user_patterns")
-        data["user_patterns"] = {k: int(v) for k, v in user_patterns.items()}
+        # 获取最近的风险历史
+        risk_history = []
+        for record in risk_history_raw:
+            try:
+                risk_history.append(json.loads(record))
+            except json.JSONDecodeError:
+                continue
+        
+        # 构建摘要
+        summary = f"已对话{conversation_count}轮"
+        
+        if user_patterns:
+            pattern_summary = ", ".join([f"{k}({v}次)" for k, v in user_patterns.items() if v > 0])
+            summary += f" | 行为模式: {pattern_summary}"
+        
+        if risk_history:
+            recent_risks = [r["level"] for r in risk_history[:3]]
+            summary += f" | 风险历史: {', '.join(recent_risks)}"
+        
+        return summary
+    
+    @staticmethod
+    def _parse_export(metadata: Dict[str, str], user_patterns: Dict[str, str],
+                      risk_history_raw: List[str], insights_raw: List[str]) -> Dict[str, Any]:
+        """由Redis读取结果构建完整记忆数据"""
+        data = {
+            # 元数据
+            "metadata": metadata,
+            # 用户模式
+            "user_patterns": {k: int(v) for k, v in user_patterns.items()},
+            "risk_history": [],
+            "key_insights": []
+        }
         
         # 风险历史
-        risk_history_raw = self.redis_client.lrange(f"{self.key_prefix}:risk_history", 0, -1)
-        data["risk_history"] = []
         for record in risk_history_raw:
             try:
                 data["risk_history"].append(json.loads(record))
@@ -291,8 +302,6 @@ class RedisMemoryManager:
                 continue
         
         # 关键洞察
-        insights_raw = self.redis_client.lrange(f"{self.key_prefix}:key_insights", 0, -1)
-        data["key_insights"] = []
         for insight in insights_raw:
             try:
                 data["key_insights"].append(json.loads(insight))
@@ -301,31 +310,180 @@ class RedisMemoryManager:
         
         return data
     
-    def get_user_analytics(self) -> Dict[str, Any]:
-        """获取用户行为分析报告"""
-        memory_data = self.export_memory_from_redis()
+    @staticmethod
+    def _long_term_view(data: Dict[str, Any], preferences: Dict[str, str]) -> Dict[str, Any]:
+        """长期记忆视图（结构与SmartMemoryManager.long_term_memory一致，按时间正序）"""
+        return {
+            "user_patterns": data["user_patterns"],
+            "risk_history": list(reversed(data["risk_history"])),
+            "key_insights": [insight.get("content", "") for insight in reversed(data["key_insights"])],
+            "persona_preferences": preferences,
+            "compressed_summaries": []
+        }
+    
+    def _estimate_tokens(self) -> int:
+        """估算当前短期记忆的token使用量"""
+        messages = self.memory.chat_memory.messages
+        total_chars = sum(len(msg.content) for msg in messages)
+        # 中文约1.5倍token，英文约0.5倍
+        estimated_tokens = int(total_chars * 0.8)
+        return estimated_tokens
+    
+    def reset_short_term_memory(self):
+        """重置短期记忆，保留长期记忆"""
+        self.memory.clear()
+        # Redis中的长期记忆保持不变
+
+
+class RedisMemoryManager(RedisMemoryBase):
+    """基于Redis的生产级长期记忆管理器"""
+    
+    def __init__(self, 
+                 redis_host: str = "localhost", 
+                 redis_port: int = 6379,
+                 redis_db: int = 0,
+                 redis_password: Optional[str] = None,
+                 user_id: Optional[str] = None,
+                 max_tokens: int = 1500,
+                 summary_trigger_ratio: float = 0.8,
+                 memory_ttl: int = 7 * 24 * 3600,  # 7天过期
+                 redis_client: Optional[redis.Redis] = None):
+        """
+        初始化Redis记忆管理器
         
-        # 分析风险趋势
-        risk_trend = []
-        if memory_data.get("risk_history"):
-            recent_risks = memory_data["risk_history"][:10]  # 最近10次
-            risk_levels = {"轻": 1, "中": 2, "重": 3, "危": 4}
-            risk_trend = [risk_levels.get(r["level"], 0) for r in recent_risks]
+        Args:
+            redis_host: Redis主机地址
+            redis_port: Redis端口
+            redis_db: Redis数据库编号
+            redis_password: Redis密码
+            user_id: 用户ID，用于多用户隔离
+            max_tokens: 最大token数量
+            summary_trigger_ratio: 压缩触发比例
+            memory_ttl: 长期记忆TTL（秒）
+            redis_client: 可选的已有Redis客户端（需decode_responses=True），传入时忽略连接参数
+        """
+        # Redis连接（所有用户共享进程级连接池）
+        self.redis_client = redis_client or redis.Redis(
+            connection_pool=get_connection_pool(redis_host, redis_port, redis_db, redis_password)
+        )
+        self._add_interaction_script = self.redis_client.register_script(ADD_INTERACTION_LUA)
         
-        # 分析行为模式分布
-        pattern_distribution = memory_data.get("user_patterns", {})
-        total_patterns = sum(pattern_distribution.values())
+        super().__init__(user_id=user_id, memory_ttl=memory_ttl)
+    
+    def add_interaction(self, user_input: str, ai_response: str, 
+                       love_brain_level: str = None, risk_signals: List[str] = None):
+        """添加一轮对话到记忆中（Redis写入通过Lua脚本一次往返完成）"""
+        # 添加到短期记忆（内存窗口）
+        self.memory.save_context(
+            {"input": user_input},
+            {"output": ai_response}
+        )
         
-        pattern_percentages = {}
-        if total_patterns > 0:
-            for pattern, count in pattern_distribution.items():
-                pattern_percentages[pattern] = round((count / total_patterns) * 100, 1)
+        # 更新长期记忆（Redis）并刷新TTL
+        self._update_long_term_memory_redis(user_input, ai_response, love_brain_level, risk_signals)
+    
+    def _update_long_term_memory_redis(self, user_input: str, ai_response: str, 
+                                     love_brain_level: str, risk_signals: List[str]) -> int:
+        """更新Redis中的长期记忆，返回本轮轮次"""
+        return int(self._add_interaction_script(
+            keys=self._memory_keys(),
+            args=self._interaction_args(user_input, love_brain_level, risk_signals)
+        ))
+    
+    def get_memory_stats(self) -> Dict[str, Any]:
+        """获取记忆统计信息（字段与SmartMemoryManager一致）"""
+        # 从Redis获取长期记忆统计（一次往返）
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hget(f"{self.key_prefix}:metadata", "conversation_count")
+        pipe.hgetall(f"{self.key_prefix}:user_patterns")
+        pipe.llen(f"{self.key_prefix}:risk_history")
+        return self._build_memory_stats(*pipe.execute())
+    
+    def get_memory_context_for_tool(self) -> str:
+        """为工具获取记忆上下文 - 与SmartMemoryManager格式一致"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hget(f"{self.key_prefix}:metadata", "conversation_count")
+        pipe.lindex(f"{self.key_prefix}:risk_history", 0)
+        pipe.hgetall(f"{self.key_prefix}:user_patterns")
+        pipe.lindex(f"{self.key_prefix}:key_insights", 0)
+        return self._format_tool_context(*pipe.execute())
+    
+    @property
+    def long_term_memory(self) -> Dict[str, Any]:
+        """长期记忆视图（结构与SmartMemoryManager.long_term_memory一致，按时间正序）"""
+        return self.get_long_term_memory()
+    
+    def get_long_term_memory(self) -> Dict[str, Any]:
+        """获取长期记忆"""
+        data = self.export_memory_from_redis()
+        return self._long_term_view(data, self.redis_client.hgetall(f"{self.key_prefix}:preferences"))
+    
+    def get_user_profile_summary(self) -> Dict[str, Any]:
+        """生成用户画像总结"""
+        return build_user_profile(self.long_term_memory)
+    
+    def get_context_summary(self) -> str:
+        """获取上下文摘要（从Redis读取长期记忆）"""
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hget(f"{self.key_prefix}:metadata", "conversation_count")
+            pipe.hgetall(f"{self.key_prefix}:user_patterns")
+            pipe.lrange(f"{self.key_prefix}:risk_history", 0, 4)
+            return self._format_context_summary(*pipe.execute())
+            
+        except Exception as e:
+            return f"无法获取记忆摘要: {str(e)}"
+    
+    def clear_session(self):
+        """清除当前会话（保留长期记忆），与SmartMemoryManager一致重置对话轮数"""
+        self.memory.clear()
+        self.redis_client.hdel(f"{self.key_prefix}:metadata", "conversation_count")
+    
+    def clear_all_memory(self):
+        """清除所有记忆（包括Redis长期记忆）"""
+        # 清除Redis数据
+        self.redis_client.delete(*self._memory_keys())
         
-        return {
-            "user_id": self.user_id,
-            "total_conversations": len(memory_data.get("risk_history", [])),
-            "risk_trend": risk_trend,
-            "pattern_distribution": pattern_percentages,
-            "high_risk_episodes": len([r for r in memory_data.get("risk_history", []) if r["level"] in ["重", "危"]]),
-            "analysis_timestamp": datetime.now().isoformat()
-        }
+        # 清除短期记忆
+        self.memory.clear()
+    
+    def export_memory_from_redis(self) -> Dict[str, Any]:
+        """从Redis导出完整记忆数据"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hgetall(f"{self.key_prefix}:metadata")
+        pipe.hgetall(f"{self.key_prefix}:user_patterns")
+        pipe.lrange(f"{self.key_prefix}:risk_history", 0, -1)
+        pipe.lrange(f"{self.key_prefix}:key_insights", 0, -1)
+        return self._parse_export(*pipe.execute())
+    
+    def get_user_analytics(self) -> Dict[str, Any]:
+        """获取用户行为分析报告"""
+        return build_user_analytics(self.user_id, self.export_memory_from_redis())
+
+
+def build_user_analytics(user_id: str, memory_data: Dict[str, Any]) -> Dict[str, Any]:
+    """由导出的记忆数据生成用户行为分析报告"""
+    # 分析风险趋势
+    risk_trend = []
+    if memory_data.get("risk_history"):
+        recent_risks = memory_data["risk_history"][:10]  # 最近10次
+        risk_levels = {"轻": 1, "中": 2, "重": 3, "危": 4}
+        risk_trend = [risk_levels.get(r["level"], 0) for r in recent_risks]
+    
+    # 分析行为模式分布
+    pattern_distribution = memory_data.get("user_patterns", {})
+    total_patterns = sum(pattern_distribution.values())
+    
+    pattern_percentages = {}
+    if total_patterns > 0:
+        for pattern, count in pattern_distribution.items():
+            pattern_percentages[pattern] = round((count / total_patterns) * 100, 1)
+    
+    return {
+        "user_id": user_id,
+        "total_conversations": len(memory_data.get("risk_history", [])),
+        "risk_trend": risk_trend,
+        "pattern_distribution": pattern_percentages,
+        "high_risk_episodes": len([r for r in memory_data.get("risk_history", []) if r["level"] in ["重", "危"]]),
+        "analysis_timestamp": datetime.now().isoformat()
+    }
@@ -0,0 +1,127 @@
+"""
+短期记忆环形缓冲区 - 固定容量的紧凑消息记录，以LangChain chat_history的形式提供给记忆窗口
+"""
+from typing import Callable, Iterator, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+# 消息角色（记录中只保存角色标记，读取时再构造LangChain消息对象）
+HUMAN, AI = "human", "ai"
+
+
+class MessageRecord:
+    """一条短期记忆消息：角色、内容和写入时计算好的token数"""
+
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: str, content: str, tokens: int):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+    def to_message(self) -> BaseMessage:
+        if self.role == HUMAN:
+            return HumanMessage(content=self.content)
+        return AIMessage(content=self.content)
+
+
+class MessageRing:
+    """固定容量的消息环形缓冲区
+
+    底层数组按最大容量一次分配，写满后新消息覆盖最旧的消息；
+    调整容量只改变逻辑上限并丢弃多出的最旧消息，不重新分配数组。
+    token总数随写入/覆盖增量维护。
+    """
+
+    __slots__ = ("_slots", "_start", "_size", "capacity", "total_tokens")
+
+    def __init__(self, capacity: int):
+        self._slots: List[Optional[MessageRecord]] = [None] * max(1, capacity)
+        self._start = 0
+        self._size = 0
+        self.capacity = len(self._slots)
+        self.total_tokens = 0
+
+    def append(self, record: MessageRecord):
+        """写入一条消息，已满时覆盖最旧的消息"""
+        if self._size == self.capacity:
+            self._drop_oldest(1)
+        index = (self._start + self._size) % len(self._slots)
+        self._slots[index] = record
+        self._size += 1
+        self.total_tokens += record.tokens
+
+    def set_capacity(self, capacity: int):
+        """调整容量（不超过初始分配的大小），缩小时丢弃最旧的消息"""
+        self.capacity = max(1, min(capacity, len(self._slots)))
+        if self._size > self.capacity:
+            self._drop_oldest(self._size - self.capacity)
+
+    def _drop_oldest(self, count: int):
+        slots = self._slots
+        for _ in range(count):
+            self.total_tokens -= slots[self._start].tokens
+            slots[self._start] = None
+            self._start = (self._start + 1) % len(slots)
+        self._size -= count
+
+    def clear(self):
+        for i in range(len(self._slots)):
+            self._slots[i] = None
+        self._start = 0
+        self._size = 0
+        self.total_tokens = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[MessageRecord]:
+        slots, start, length = self._slots, self._start, len(self._slots)
+        for i in range(self._size):
+            yield slots[(start + i) % length]
+
+    def __getitem__(self, index: int) -> MessageRecord:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("MessageRing index out of range")
+        return self._slots[(self._start + index) % len(self._slots)]
+
+
+class RingBufferChatHistory(BaseChatMessageHistory):
+    """把MessageRing适配为LangChain的chat_history
+
+    ConversationBufferWindowMemory通过messages读取、通过add_messages写入；
+    Agent写入的消息同样在写入时计算token，无需再扫描消息列表。
+    """
+
+    def __init__(self, capacity: int, token_counter: Callable[[str], int]):
+        self.ring = MessageRing(capacity)
+        self.token_counter = token_counter
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return [record.to_message() for record in self.ring]
+
+    def add_message(self, message: BaseMessage) -> None:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        role = HUMAN if message.type == "human" else AI
+        self.ring.append(MessageRecord(role, content, self.token_counter(content)))
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        for message in messages:
+            self.add_message(message)
+
+    def set_capacity(self, capacity: int):
+        self.ring.set_capacity(capacity)
+
+    def clear(self) -> None:
+        self.ring.clear()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.ring.total_tokens
+
+    def __len__(self) -> int:
+        return len(self.ring)
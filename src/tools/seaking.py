@@ -1,21 +1,49 @@
-from typing import Dict, Any
+"""
+海王对战Chain
+
+- 每种已知挑战类型一个模块级Chain，prompt与LLM只在首次使用时组装一次
+- 人设相关的字段（人设、性别、描述、风格、弱点等）渲染为静态prompt前缀并按人设缓存，
+  每轮只格式化得分、上一轮对话和用户回复
+- 提供同步、异步、流式与批量入口
+- SeakingStreamParser 随流式片段增量解析输出，产出拽姐点评、得分、海王台词与通关事件
+"""
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from langchain.prompts import PromptTemplate
 from ..core.config import llm
+from ..core.log import get_logger
+from ..core.persona_catalog import PERSONA_DEFAULTS, persona_catalog
 
-class SeakingChain:
-    """海王对战Chain - 直接输出符合要求的海王对战结果"""
-    
-    def __init__(self):
-        self.llm = llm(temperature=0.1)
-        self.prompt_template = PromptTemplate(
-            input_variables=["persona", "user_input", "current_score", "challenge_type", "gender", "user_gender", "description", "style", "weakness", "last_conversation"],
-            template="""你是一个海王模拟器，需要和用户进行{challenge_type}挑战。
+logger = get_logger("seaking")
+
+# 人设前缀缓存容量（按人设字段组合计）
+SEAKING_PREFIX_CACHE_SIZE = int(os.getenv("SEAKING_PREFIX_CACHE_SIZE", "256"))
+
+# 通关提示与降级回复
+VICTORY_MESSAGE = "【🎉恭喜挑战成功】你已经成功应对了海王的套路！挑战结束。"
+SEAKING_FALLBACK_MESSAGE = "海王断网了，还在骑马赶来的路上...🚬"
+VICTORY_MARKERS = ("🎉恭喜挑战成功", "恭喜通关")
+
+# 输出解析：段落标题【xxx】、拽姐旁白中的得分、以及兜底的得分写法
+_SECTION_HEADER_RE = re.compile(r"【([^【】\n]{1,20})】")
+_SECTION_HEADER_MAX_LEN = 22
+_SCORE_RE = re.compile(r"当前得分[：:]\s*(\d+)")
+_LOOSE_SCORE_RE = re.compile(r"得分[：:]\s*(\d+)")
+
+# 人设部分：同一人设每轮都相同
+PERSONA_PREFIX_TEMPLATE = """你是一个海王模拟器，需要和用户进行{challenge_type}挑战。
 
                         【海王人设】{persona}，性别{gender}，典型行为{description}，特点是{style}，弱点是{weakness}。
                         【用户人设】性别{user_gender}。
           
                         【关系设定】
-                         若海王和用户都是同性，则视为同性恋爱暧昧关系；否则，则视为异性恋爱关系。
+                         若海王和用户都是同性，则视为同性恋爱暧昧关系；否则，则视为异性恋爱关系。"""
+
+# 每轮变化的部分
+TURN_TEMPLATE = """{persona_prefix}
 
                         【当前状态】
                         - 用户当前总得分：{current_score}分（满分100分通关）
@@ -52,37 +80,287 @@ class SeakingChain:
                         - 根据用户上轮回复质量增加分数：优秀+【40-50】分，良好+【30-40分】，一般+【20】分，较差+【0-10】分，不要过于严格，尽量给分。
                         - 输出的"当前得分"必须是累计总分，不是增量分数
                         - 分数后面不要加"分"字，只输出纯数字"""
+
+
+@lru_cache(maxsize=SEAKING_PREFIX_CACHE_SIZE)
+def render_persona_prefix(challenge_type: str, persona: str, gender: str, user_gender: str, description: str, style: str, weakness: str) -> str:
+    """渲染人设前缀（按人设字段组合缓存）"""
+    return PERSONA_PREFIX_TEMPLATE.format(
+        challenge_type=challenge_type,
+        persona=persona,
+        gender=gender,
+        user_gender=user_gender,
+        description=description,
+        style=style,
+        weakness=weakness,
+    )
+
+
+class SeakingChain:
+    """海王对战Chain - 直接输出符合要求的海王对战结果"""
+    
+    def __init__(self, challenge_type: str = "海王对战"):
+        self.challenge_type = challenge_type
+        self.llm = llm(temperature=0.1)
+        self.prompt_template = PromptTemplate(
+            input_variables=["persona_prefix", "current_score", "last_conversation", "user_input"],
+            template=TURN_TEMPLATE
         )
+        # 只组装一次，各入口复用
+        self.chain = self.prompt_template | self.llm
     
-    def run(self, persona: str, user_input: str, current_score: int = 0, challenge_type: str = "海王对战", gender: str = "女", user_gender: str = "女", description: str = "", style: str = "", weakness: str = "", last_conversation: str = "") -> str:
+    def run(self, persona: str, user_input: str, current_score: int = 0, challenge_type: Optional[str] = None, gender: str = "女", user_gender: str = "女", description: str = "", style: str = "", weakness: str = "", last_conversation: str = "") -> str:
         """运行海王对战Chain"""
         try:
             # 如果已经达到100分，直接返回通关信息
             if current_score >= 100:
-                return "【🎉恭喜挑战成功】你已经成功应对了海王的套路！挑战结束。"
+                return VICTORY_MESSAGE
             
-            # 调用LLM生成回复 - 使用新的 RunnableSequence 模式
-            chain = self.prompt_template | self.llm
-            result = chain.invoke({
-                "persona": persona,
-                "user_input": user_input,
-                "current_score": current_score,
-                "challenge_type": challenge_type,
-                "gender": gender,
-                "user_gender": user_gender,
-                "description": description,
-                "style": style,
-                "weakness": weakness,
-                "last_conversation": last_conversation
-            })
+            result = self.chain.invoke(self._build_inputs(
+                persona, user_input, current_score, challenge_type, gender,
+                user_gender, description, style, weakness, last_conversation
+            ))
+            return self._content(result)
             
-            # 处理返回结果
-            content = result.content if hasattr(result, 'content') else str(result)
-            return content.strip()
+        except Exception as e:
+            logger.error("SeakingChain failed: %s", e)
+            return SEAKING_FALLBACK_MESSAGE
+
+    async def arun(self, persona: str, user_input: str, current_score: int = 0, challenge_type: Optional[str] = None, gender: str = "女", user_gender: str = "女", description: str = "", style: str = "", weakness: str = "", last_conversation: str = "") -> str:
+        """异步运行海王对战Chain（不阻塞事件循环）"""
+        try:
+            if current_score >= 100:
+                return VICTORY_MESSAGE
             
+            result = await self.chain.ainvoke(self._build_inputs(
+                persona, user_input, current_score, challenge_type, gender,
+                user_gender, description, style, weakness, last_conversation
+            ))
+            return self._content(result)
+            
+        except Exception as e:
+            logger.error("SeakingChain failed: %s", e)
+            return SEAKING_FALLBACK_MESSAGE
+
+    async def astream(self, persona: str, user_input: str, current_score: int = 0, challenge_type: Optional[str] = None, gender: str = "女", user_gender: str = "女", description: str = "", style: str = "", weakness: str = "", last_conversation: str = "") -> AsyncIterator[str]:
+        """流式运行海王对战Chain，逐个产出生成的文本片段"""
+        if current_score >= 100:
+            yield VICTORY_MESSAGE
+            return
+        
+        emitted = False
+        try:
+            async for chunk in self.chain.astream(self._build_inputs(
+                persona, user_input, current_score, challenge_type, gender,
+                user_gender, description, style, weakness, last_conversation
+            )):
+                content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if content:
+                    emitted = True
+                    yield content
+        
         except Exception as e:
-            print(f"[Error] SeakingChain failed: {e}")
-            return "海王断网了，还在骑马赶来的路上...🚬"
+            logger.error("SeakingChain stream failed: %s", e)
+            # 已输出部分内容时不再拼接降级回复，避免内容错乱
+            if not emitted:
+                yield SEAKING_FALLBACK_MESSAGE
+
+    def batch(self, requests: List[Dict[str, Any]]) -> List[str]:
+        """批量运行，requests 中每项为 run() 的关键字参数；单项失败时该项返回降级回复"""
+        pending = [i for i, kwargs in enumerate(requests) if kwargs.get("current_score", 0) < 100]
+        results = self.chain.batch([self._build_inputs_from(requests[i]) for i in pending], return_exceptions=True) if pending else []
+        return self._merge_batch(requests, pending, results)
+
+    async def abatch(self, requests: List[Dict[str, Any]]) -> List[str]:
+        """异步批量运行（并发调用LLM），参数与返回同 batch()"""
+        pending = [i for i, kwargs in enumerate(requests) if kwargs.get("current_score", 0) < 100]
+        results = await self.chain.abatch([self._build_inputs_from(requests[i]) for i in pending], return_exceptions=True) if pending else []
+        return self._merge_batch(requests, pending, results)
+
+    def _merge_batch(self, requests: List[Dict[str, Any]], pending: List[int], results: List[Any]) -> List[str]:
+        """已通关的项直接返回通关信息，其余按顺序填入LLM结果"""
+        outputs = [VICTORY_MESSAGE] * len(requests)
+        for i, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.error("SeakingChain batch item failed: %s", result)
+                outputs[i] = SEAKING_FALLBACK_MESSAGE
+            else:
+                outputs[i] = self._content(result)
+        return outputs
+
+    @staticmethod
+    def _content(result: Any) -> str:
+        content = result.content if hasattr(result, 'content') else str(result)
+        return content.strip()
+
+    def _build_inputs_from(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return self._build_inputs(
+            kwargs["persona"], kwargs["user_input"], kwargs.get("current_score", 0),
+            kwargs.get("challenge_type"), kwargs.get("gender", "女"), kwargs.get("user_gender", "女"),
+            kwargs.get("description", ""), kwargs.get("style", ""), kwargs.get("weakness", ""),
+            kwargs.get("last_conversation", "")
+        )
+
+    def _build_inputs(self, persona: str, user_input: str, current_score: int, challenge_type: Optional[str], gender: str, user_gender: str, description: str, style: str, weakness: str, last_conversation: str) -> Dict[str, Any]:
+        """组装prompt模板输入（人设部分取缓存的前缀）"""
+        return {
+            "persona_prefix": render_persona_prefix(
+                challenge_type or self.challenge_type, persona, gender, user_gender, description, style, weakness
+            ),
+            "current_score": current_score,
+            "last_conversation": last_conversation,
+            "user_input": user_input,
+        }
+
+
+# 每种已知挑战类型一个Chain（首次使用时创建）
+_chains: Dict[str, SeakingChain] = {}
+_chains_lock = threading.Lock()
+
+
+def get_seaking_chain(challenge_type: str = PERSONA_DEFAULTS["challenge_type"]) -> SeakingChain:
+    """获取某挑战类型的共享Chain
+
+    challenge_type 可能来自客户端请求，人设库与默认人设之外的值一律使用默认类型的Chain，
+    Chain数量不随请求内容增长（实际的挑战类型在调用时随参数传入prompt）。
+    """
+    if not persona_catalog.is_known_challenge_type(challenge_type):
+        challenge_type = PERSONA_DEFAULTS["challenge_type"]
+    chain = _chains.get(challenge_type)
+    if chain is None:
+        with _chains_lock:
+            chain = _chains.get(challenge_type)
+            if chain is None:
+                chain = _chains[challenge_type] = SeakingChain(challenge_type)
+    return chain
+
+
+def get_seaking_stats() -> Dict[str, Any]:
+    """Chain与人设前缀缓存统计"""
+    info = render_persona_prefix.cache_info()
+    return {
+        "chains": sorted(_chains),
+        "prefix_cache": {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize},
+    }
+
+
+class SeakingStreamParser:
+    """海王输出的增量解析器
+
+    逐个喂入流式片段，只向前扫描一遍，段落（【xxx】开头）结束时产出结构化事件：
+    - ("victory", {"score": 100})：出现通关标记时立即产出
+    - ("commentary", {"text": ...})：一段【拽姐旁白】结束
+    - ("score", {"score": n, "is_victory": bool})：【拽姐旁白】中的当前得分数字接收完整
+    - ("seaking", {"text": ...})：【海王】台词结束（已去掉人设名称前缀）
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.sections: List[Tuple[str, str]] = []
+        self.commentary: List[str] = []
+        self.seaking_reply = ""
+        self.score: Optional[int] = None
+        self.victory = False
+        self._section: Optional[str] = None
+        self._section_start = 0
+        self._scan = 0  # 该位置之前已确认不含未处理的段落标题
+        self._victory_scan = 0
+        self._closed = False
+
+    @classmethod
+    def parse(cls, text: str) -> "SeakingStreamParser":
+        """一次性解析完整输出（非流式调用）"""
+        parser = cls()
+        parser.feed(text)
+        parser.close()
+        return parser
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """喂入一个片段，返回本片段触发的事件"""
+        events: List[Tuple[str, Dict[str, Any]]] = []
+        if not chunk or self._closed:
+            return events
+        self.text += chunk
+        self._check_victory(events)
+
+        text = self.text
+        while True:
+            start = text.find("【", self._scan)
+            if start < 0:
+                self._scan = len(text)
+                break
+            match = _SECTION_HEADER_RE.match(text, start)
+            if match is None:
+                # 标题可能还没接收完整，等下一个片段
+                if "】" not in text[start:start + _SECTION_HEADER_MAX_LEN] and len(text) - start < _SECTION_HEADER_MAX_LEN:
+                    self._scan = start
+                    break
+                self._scan = start + 1
+                continue
+            self._close_section(start, events)
+            self._section = match.group(1)
+            self._section_start = self._scan = match.end()
+
+        # 得分数字后面已有其他字符，说明数字接收完整
+        if self._section == "拽姐旁白" and self.score is None:
+            match = _SCORE_RE.search(text, self._section_start)
+            if match and match.end() < len(text):
+                self._set_score(int(match.group(1)), events)
+        return events
+
+    def close(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """输出结束：收尾最后一段；拽姐旁白中没有得分时按兜底写法在全文中查找"""
+        events: List[Tuple[str, Dict[str, Any]]] = []
+        if self._closed:
+            return events
+        self._close_section(len(self.text), events)
+        self._closed = True
+        if self.score is None and not self.victory:
+            match = _SCORE_RE.search(self.text) or _LOOSE_SCORE_RE.search(self.text)
+            if match:
+                self._set_score(int(match.group(1)), events)
+        return events
+
+    def result(self, prev_score: int, is_first_round: bool = False) -> Tuple[int, bool]:
+        """本轮得分与是否通关：通关 > 第一轮不计分 > 解析出的得分 > 保持上轮得分"""
+        if self.victory:
+            return 100, True
+        if is_first_round:
+            return 0, False
+        if self.score is not None:
+            return self.score, self.score >= 100
+        return prev_score, prev_score >= 100
+
+    def _check_victory(self, events: List[Tuple[str, Dict[str, Any]]]):
+        if self.victory:
+            return
+        # 从上次检查位置往前回退一个标记长度，覆盖跨片段的标记
+        start = max(0, self._victory_scan - max(len(marker) for marker in VICTORY_MARKERS))
+        self._victory_scan = len(self.text)
+        if any(self.text.find(marker, start) >= 0 for marker in VICTORY_MARKERS):
+            self.victory = True
+            events.append(("victory", {"score": 100}))
+
+    def _set_score(self, score: int, events: List[Tuple[str, Dict[str, Any]]]):
+        self.score = score
+        events.append(("score", {"score": score, "is_victory": score >= 100}))
 
+    def _close_section(self, end: int, events: List[Tuple[str, Dict[str, Any]]]):
+        if self._section is None:
+            return
+        name, body = self._section, self.text[self._section_start:end].strip()
+        self._section = None
+        self.sections.append((name, body))
 
-   
\ No newline at end of file
+        if name == "拽姐旁白":
+            if self.score is None:
+                match = _SCORE_RE.search(body)
+                if match:
+                    self._set_score(int(match.group(1)), events)
+            self.commentary.append(body)
+            events.append(("commentary", {"text": body}))
+        elif name == "海王" and not self.seaking_reply:
+            # 去掉人设名称前缀（如"INFP-治愈文青型海王："）
+            reply = body.split("：", 1)[1].strip() if "：" in body else body
+            self.seaking_reply = reply
+            events.append(("seaking", {"text": reply}))
@@ -19,10 +19,7 @@ class TalkTool(BaseTool):
             from ..core.config import llm
             
             # 格式化prompt模板
-            formatted_prompt = TALK_EXECUTION_PROMPT.format(
-                user_text=user_text,
-                talk_guide=TALK_INNER_GUIDE,
-            )
+            formatted_prompt = self._format_prompt(user_text)
             
             # 直接调用LLM生成回复
             llm_instance = llm(temperature=0.1)
@@ -35,5 +32,27 @@ class TalkTool(BaseTool):
             # 降级处理：返回简单回复
             return f"姐没钱了，忙着打工赚草料！晚点再聊吧铁子！😭"
 
-    def _arun(self, *args, **kwargs):
-        raise NotImplementedError
+    async def _arun(self, user_text: str, memory_context: str = "", memory_manager=None) -> str:
+        """闺蜜吹水搭子模式 - 异步调用LLM生成回复"""
+        try:
+            from ..core.config import llm
+            
+            formatted_prompt = self._format_prompt(user_text)
+            
+            # 异步调用LLM，不阻塞事件循环
+            llm_instance = llm(temperature=0.1)
+            response = await llm_instance.ainvoke(formatted_prompt)
+            
+            return response.content if hasattr(response, 'content') else str(response)
+            
+        except Exception as e:
+            # 降级处理：返回简单回复
+            return f"姐没钱了，忙着打工赚草料！晚点再聊吧铁子！😭"
+
+    @staticmethod
+    def _format_prompt(user_text: str) -> str:
+        """格式化闲聊prompt模板"""
+        return TALK_EXECUTION_PROMPT.format(
+            user_text=user_text,
+            talk_guide=TALK_INNER_GUIDE,
+        )